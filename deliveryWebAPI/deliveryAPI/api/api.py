@@ -1,13 +1,28 @@
-from typing import Type, Dict, Union
+from typing import Annotated, Type, Dict, List, Literal, AsyncIterator, Optional, Tuple, Union
 
 import asyncio
-from fastapi import FastAPI, HTTPException
-from starlette.status import HTTP_404_NOT_FOUND
+import time
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, ORJSONResponse
+from starlette.status import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND, HTTP_422_UNPROCESSABLE_ENTITY
 from fastapi.middleware.cors import CORSMiddleware
 
-from deliveryAPI.models.FoodModels import (
-    BaseFoodModel, foodItems, PizzaHut, Dominos, McDonalds, KFC, BurgerKing
-)
+from deliveryAPI.models.FoodModels import BaseFoodModel, UberEatsSessionPool
+from deliveryAPI.models.BackendRegistry import BackendRegistry, Capability
+from deliveryAPI.models.SessionPool import SessionPool
+from deliveryAPI.models.CircuitBreaker import CircuitOpenError
+from deliveryAPI.cache.ResultCache import DeliveryResultCache
+from deliveryAPI.cache.LocationCache import UELocationCache
+from deliveryAPI.cache.CacheStore import createStore
+from deliveryAPI.cache.CatchmentIndex import CatchmentIndex
+from deliveryAPI.cache.CoverageTable import CoverageTable
+from deliveryAPI.cache.NegativePostcodes import NegativePostcodes
+from deliveryAPI.cache.CacheWarmer import CacheWarmer, HotPostcodes
+from deliveryAPI.jobs.BulkJobs import BulkJob, BulkJobs, InvalidInputError
+from deliveryAPI.settings import settings
+from deliveryAPI.postcodes import normalizePostcode, InvalidPostcodeError
+from deliveryAPI.metrics import registry, workerId, REQUEST_SECONDS
+from deliveryAPI import fastjson
 from deliveryAPI.api import schemas
 
 app = FastAPI()
@@ -20,52 +35,602 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+resultCache = DeliveryResultCache(
+    settings.result_cache_max_size,
+    createStore(settings.result_cache_store_url) if settings.result_cache_store_url else None,
+    settings.result_cache_lock_seconds
+)
+backendRegistry = BackendRegistry.discover(settings.backends_config)
+coverageTable = CoverageTable()
+
+
+async def recordRequestMetrics(request: Request, callNext):
+    startTime = time.monotonic()
+    response = await callNext(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.monotonic() - startTime,
+        request.method, route.path if route else "unmatched", str(response.status_code)
+    )
+    return response
+
+
+if settings.metrics_enabled:
+    # only add the middleware when needed, so disabled metrics cost nothing per request
+    app.middleware("http")(recordRequestMetrics)
+
+
+@app.on_event("startup")
+async def openSessionPool():
+    SessionPool.open()
+
+
+@app.on_event("startup")
+async def openUberEatsSessionPool():
+    UberEatsSessionPool.open()
+
+
+@app.on_event("startup")
+async def openLocationCache():
+    await UELocationCache.open()
+
+
+@app.on_event("startup")
+async def openCoverageTable():
+    if settings.coverage_table_path:
+        coverageTable.open(settings.coverage_table_path)
+
+
+@app.on_event("startup")
+async def openNegativePostcodes():
+    await NegativePostcodes.open()
+
+
+@app.on_event("startup")
+async def openCacheWarmer():
+    if settings.warm_enabled:
+        await cacheWarmer.open()
+
+
+@app.on_event("startup")
+async def openBulkJobs():
+    await bulkJobs.open()
+
+
+@app.on_event("shutdown")
+async def closeCacheWarmer():
+    if settings.warm_enabled:
+        await cacheWarmer.close()
+
+
+@app.on_event("shutdown")
+async def closeBulkJobs():
+    await bulkJobs.close()
+
+
+# shutdown handlers run in order, background upstream calls finish before the pool closes
+
+
+@app.on_event("shutdown")
+async def closeResultCache():
+    await resultCache.close(settings.shutdown_drain_seconds)
+
+
+@app.on_event("shutdown")
+async def closeUberEatsSessionPool():
+    await UberEatsSessionPool.close()
+
+
+@app.on_event("shutdown")
+async def closeSessionPool():
+    await SessionPool.close()
+
+
+@app.on_event("shutdown")
+async def closeLocationCache():
+    await UELocationCache.close()
 
-DELIVERY_SERVICE_ENDPOINT_MAPPING = {
-    "pizzahut": PizzaHut,
-    "dominos": Dominos,
-    "mcdonalds": McDonalds,
-    "kfc": KFC,
-    "burgerking": BurgerKing
-}
+
+@app.on_event("shutdown")
+async def closeCoverageTable():
+    coverageTable.close()
+
+
+@app.on_event("shutdown")
+async def closeNegativePostcodes():
+    await NegativePostcodes.close()
 
 
 async def getDeliveryServiceFromEndpoint(endpoint: str) -> Type[BaseFoodModel]:
     try:
-        return DELIVERY_SERVICE_ENDPOINT_MAPPING[endpoint]
+        spec = backendRegistry.get(endpoint)
     except KeyError:
+        spec = None
+    if not spec or not spec.hasCapability(Capability.DIRECT):
         raise HTTPException(
             status_code=HTTP_404_NOT_FOUND,
             detail=f"Could not find delivery service backend for {endpoint}"
         )
+    return spec.load()
+
+
+def aggregateFoodItems() -> List[Type[BaseFoodModel]]:
+    return [spec.load() for spec in backendRegistry.backends(Capability.AGGREGATE)]
+
+
+def resultCacheTtls(name: str) -> Tuple[float, float, float]:
+    """
+    The ttl, negative ttl and maximum staleness of a service's cached answers.
+    """
+    maxStale = 0
+    if settings.stale_while_revalidate or settings.stale_if_error:
+        maxStale = settings.max_stale.get(name, settings.max_stale_seconds)
+    return (
+        settings.result_cache_ttls.get(name, settings.result_cache_ttl_seconds),
+        settings.result_cache_negative_ttls.get(name, settings.result_cache_negative_ttl_seconds),
+        maxStale
+    )
+
+
+def serviceTimeout(name: str) -> float:
+    return settings.service_timeouts.get(name, settings.service_timeout_seconds)
+
+
+async def checkCanDeliver(
+        foodItemInstance: BaseFoodModel, postcode: str, sweep: bool = False
+) -> bool:
+    if sweep:
+        # a sweep's answers are compiled into the coverage table, so they must come from
+        # the upstream, and its postcodes would push live traffic's out of the cache
+        return await foodItemInstance.canDeliverUpstream()
+
+    name = foodItemInstance.name
+    canDeliver = coverageTable.lookup(name, postcode)
+    if canDeliver is not None:
+        return canDeliver
+
+    ttl, negativeTtl, maxStale = resultCacheTtls(name)
+    return await resultCache.get(
+        name, postcode, foodItemInstance.canDeliver,
+        ttl=ttl, negativeTtl=negativeTtl, maxStale=maxStale
+    )
+
+
+async def warmPostcode(postcode: str) -> int:
+    """
+    Fill the result cache for a postcode, or refresh answers that are about
+    to expire, returning the number of backends checked. Failures are left
+    for live requests to report.
+    """
+    checks = []
+    for foodItem in aggregateFoodItems():
+        foodItemInstance = foodItem(postcode)
+        name = foodItemInstance.name
+        ttl, negativeTtl, maxStale = resultCacheTtls(name)
+        if (
+                max(ttl, negativeTtl) <= 0 or NegativePostcodes.isNegative(name, postcode) or
+                coverageTable.lookup(name, postcode) is not None
+        ):
+            continue
+
+        expiresIn = resultCache.expiresIn(name, postcode)
+        if expiresIn is None:
+            check = resultCache.get(
+                name, postcode, foodItemInstance.canDeliver, ttl, negativeTtl, maxStale
+            )
+        elif expiresIn < settings.warm_refresh_ahead_seconds:
+            check = resultCache.refresh(
+                name, postcode, foodItemInstance.canDeliver, ttl, negativeTtl, maxStale
+            )
+        else:
+            continue
+        checks.append(asyncio.wait_for(check, serviceTimeout(name)))
+
+    await asyncio.gather(*checks, return_exceptions=True)
+    return len(checks)
+
+
+hotPostcodes = HotPostcodes(settings.warm_track_max_postcodes)
+cacheWarmer = CacheWarmer(hotPostcodes, warmPostcode)
+
+
+# the CanDeliverResponse fields in order with their defaults, for responses that skip the model
+CAN_DELIVER_DEFAULTS = {
+    "can_deliver": None, "status": schemas.DeliveryStatus.OK, "error": None, "age_seconds": None
+}
+
+
+def deliveryResponse(responses: Dict[str, Dict]) -> Union[Dict, ORJSONResponse]:
+    """
+    can_deliver responses keyed by service. They are built here, so with
+    fast JSON they are encoded with orjson straight away rather than being
+    validated against the response model and walked by jsonable_encoder.
+    """
+    if not fastjson.enabled():
+        return responses
+    return ORJSONResponse({
+        name: {**CAN_DELIVER_DEFAULTS, **response} for name, response in responses.items()
+    })
+
+
+def batchDeliveryResponse(
+        responses: Dict[str, Dict[str, Dict]]
+) -> Union[Dict, ORJSONResponse]:
+    if not fastjson.enabled():
+        return responses
+    return ORJSONResponse({
+        postcode: {
+            name: {**CAN_DELIVER_DEFAULTS, **response}
+            for name, response in postcodeResponses.items()
+        }
+        for postcode, postcodeResponses in responses.items()
+    })
+
+
+def timedOutResponse() -> Dict:
+    return {"can_deliver": None, "status": schemas.DeliveryStatus.TIMED_OUT}
+
+
+def errorResponse(error: Exception) -> Dict:
+    return {
+        "can_deliver": None,
+        "status": schemas.DeliveryStatus.ERROR,
+        "error": str(error) or type(error).__name__
+    }
+
+
+def staleResponse(name: str, postcode: str) -> Optional[Dict]:
+    stale = resultCache.stale(name, postcode)
+    if not stale:
+        return None
+    canDeliver, age = stale
+    return {
+        "can_deliver": canDeliver,
+        "status": schemas.DeliveryStatus.STALE,
+        "age_seconds": round(age, 1)
+    }
+
+
+async def canDeliverResponse(
+        foodItemInstance: BaseFoodModel, postcode: str, sweep: bool = False
+) -> Dict:
+    """
+    Check a single delivery service, reporting timeouts and failures in the
+    response so one backend can't fail the whole request. Depending on the
+    settings an expired answer is served instead, while it is refreshed in
+    the background or when the check fails. A sweep, e.g. a bulk job, only
+    takes answers from the upstream and leaves the result cache alone.
+    """
+    name = foodItemInstance.name
+    if not sweep and NegativePostcodes.isNegative(name, postcode):
+        return {"can_deliver": False, "status": schemas.DeliveryStatus.OK}
+
+    if settings.stale_while_revalidate and not sweep:
+        response = staleResponse(name, postcode)
+        if response:
+            ttl, negativeTtl, maxStale = resultCacheTtls(name)
+            resultCache.revalidate(
+                name, postcode, foodItemInstance.canDeliver, ttl, negativeTtl, maxStale,
+                serviceTimeout(name)
+            )
+            return response
+
+    try:
+        canDeliver = await asyncio.wait_for(
+            checkCanDeliver(foodItemInstance, postcode, sweep), serviceTimeout(name)
+        )
+    except asyncio.TimeoutError:
+        response = timedOutResponse()
+    except CircuitOpenError as error:
+        response = {
+            "can_deliver": None, "status": schemas.DeliveryStatus.UNAVAILABLE, "error": str(error)
+        }
+    except Exception as error:
+        response = errorResponse(error)
+    else:
+        return {"can_deliver": canDeliver, "status": schemas.DeliveryStatus.OK}
+
+    if settings.stale_if_error and not sweep:
+        return staleResponse(name, postcode) or response
+    return response
+
+
+async def awaitWithinDeadline(tasks: Dict[str, asyncio.Task]) -> Dict[str, Dict]:
+    """
+    Wait for the response tasks until the request deadline, anything still
+    running after that is cancelled and reported as timed out.
+    """
+    _done, pending = await asyncio.wait(
+        tasks.values(), timeout=settings.request_deadline_seconds
+    )
+    for task in pending:
+        task.cancel()
+
+    return {
+        name: timedOutResponse() if task in pending else task.result()
+        for name, task in tasks.items()
+    }
 
 
 async def getResponseData(deliveryService: str, postcode: str) -> Dict:
     foodItem = await getDeliveryServiceFromEndpoint(deliveryService)
+    hotPostcodes.record(postcode)
     foodItemInstance = foodItem(postcode)
-    return {
-        deliveryService: {
-            "can_deliver": await foodItemInstance.canDeliver()
+    return await awaitWithinDeadline({
+        deliveryService: asyncio.create_task(canDeliverResponse(foodItemInstance, postcode))
+    })
+
+
+@app.get("/delivery/services", response_model=List[schemas.DeliveryBackend])
+async def deliveryServices():
+    return [
+        {
+            "slug": spec.slug,
+            "name": spec.displayName,
+            "capabilities": sorted(spec.capabilities)
         }
+        for spec in backendRegistry.backends()
+    ]
+
+
+async def awaitFirstDeliverer(tasks: Dict[str, asyncio.Task]) -> Dict[str, Dict]:
+    """
+    Wait for the first response that can deliver and cancel the rest, which
+    closes their sessions as they unwind. If none can deliver by the request
+    deadline, every response is returned as awaitWithinDeadline would.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.request_deadline_seconds
+    pending = set(tasks.values())
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for name, task in tasks.items():
+                if task in done and task.result()["can_deliver"]:
+                    return {name: task.result()}
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return {
+        name: timedOutResponse() if task in pending else task.result()
+        for name, task in tasks.items()
     }
 
 
 @app.get("/delivery/food", response_model=schemas.DeliveryServiceResponse)
-async def foodDeliveryData(postcode: Union[str, None]):
-    response = {}
+async def foodDeliveryData(
+        postcode: schemas.Postcode,
+        mode: Literal["all", "any"] = "all",
+        services: Annotated[Optional[List[str]], Query()] = None
+):
+    """
+    Check every aggregated delivery service, or the services named by their
+    endpoint. With mode=any the response is the first service that can
+    deliver, or every service's response if none can.
+    """
+    hotPostcodes.record(postcode)
+    foodItems = [
+        await getDeliveryServiceFromEndpoint(deliveryService)
+        for deliveryService in dict.fromkeys(services)
+    ] if services else aggregateFoodItems()
+
+    tasks = {}
     for foodItem in foodItems:
         foodItemInstance = foodItem(postcode)
-        foodItemTask = asyncio.create_task(foodItemInstance.canDeliver())
-        response[foodItemInstance.name] = foodItemTask
+        foodItemTask = asyncio.create_task(canDeliverResponse(foodItemInstance, postcode))
+        tasks[foodItemInstance.name] = foodItemTask
 
-    for name, task in response.items():
-        response[name] = {
-            "can_deliver": await task
-        }
+    if mode == "any":
+        return deliveryResponse(await awaitFirstDeliverer(tasks))
+    return deliveryResponse(await awaitWithinDeadline(tasks))
+
+
+async def streamCanDeliver(postcode: str) -> AsyncIterator[Tuple[str, Dict]]:
+    """
+    Yield each delivery service's result as soon as it completes, rather than
+    in registration order. Services still running at the request deadline are
+    yielded as timed out.
+    """
+    async def checkFoodItem(foodItemInstance: BaseFoodModel) -> Tuple[str, Dict]:
+        return foodItemInstance.name, await canDeliverResponse(foodItemInstance, postcode)
+
+    tasks = {}
+    for foodItem in aggregateFoodItems():
+        foodItemInstance = foodItem(postcode)
+        tasks[foodItemInstance.name] = asyncio.create_task(checkFoodItem(foodItemInstance))
+
+    yielded = set()
+    try:
+        try:
+            for task in asyncio.as_completed(
+                    tasks.values(), timeout=settings.request_deadline_seconds
+            ):
+                name, response = await task
+                yielded.add(name)
+                yield name, response
+        except asyncio.TimeoutError:
+            for name, task in tasks.items():
+                if name not in yielded:
+                    yield name, task.result() if task.done() else timedOutResponse()
+    finally:
+        # the client went away or the deadline passed, stop the upstream calls
+        for task in tasks.values():
+            task.cancel()
+
+
+async def formatStream(
+        results: AsyncIterator[Tuple[str, Dict]], streamFormat: str
+) -> AsyncIterator[str]:
+    async for name, canDeliverResponse in results:
+        data = fastjson.dumps({name: canDeliverResponse})
+        if streamFormat == "sse":
+            yield f"data: {data}\n\n"
+        else:
+            yield f"{data}\n"
 
-    return response
+
+@app.get("/delivery/food/stream")
+async def foodDeliveryDataStream(
+        postcode: schemas.Postcode,
+        streamFormat: Literal["ndjson", "sse"] = Query("ndjson", alias="format")
+):
+    hotPostcodes.record(postcode)
+    mediaType = "text/event-stream" if streamFormat == "sse" else "application/x-ndjson"
+    return StreamingResponse(
+        formatStream(streamCanDeliver(postcode), streamFormat), media_type=mediaType
+    )
 
 
 @app.get("/delivery/food/{deliveryService}", response_model=schemas.DeliveryServiceResponse)
-async def foodDeliveryDataPizzaHut(deliveryService: str, postcode: Union[str, None]):
-    return await getResponseData(deliveryService, postcode)
+async def foodDeliveryDataPizzaHut(deliveryService: str, postcode: schemas.Postcode):
+    return deliveryResponse(await getResponseData(deliveryService, postcode))
+
+
+@app.post("/delivery/food/batch", response_model=schemas.BatchDeliveryServiceResponse)
+async def foodDeliveryDataBatch(batchRequest: schemas.BatchRequest):
+    """
+    Check many postcodes at once, keyed by postcode then delivery service endpoint
+    name. Failures are reported against the individual postcode and service.
+    """
+    postcodes = list(dict.fromkeys(batchRequest.postcodes))
+    if len(postcodes) > settings.batch_max_postcodes:
+        raise HTTPException(
+            status_code=HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"A batch can contain at most {settings.batch_max_postcodes} postcodes"
+        )
+
+    services = batchRequest.services or [
+        spec.slug for spec in backendRegistry.backends(Capability.DIRECT)
+    ]
+    foodItemsByService = {
+        deliveryService: await getDeliveryServiceFromEndpoint(deliveryService)
+        for deliveryService in services
+    }
+
+    batchLimit = asyncio.Semaphore(settings.batch_concurrency)
+    serviceLimits = {
+        deliveryService: asyncio.Semaphore(settings.batch_service_concurrencies.get(
+            deliveryService, settings.batch_service_concurrency
+        ))
+        for deliveryService in foodItemsByService
+    }
+
+    async def checkPostcode(deliveryService: str, postcode: str) -> Dict:
+        async with batchLimit, serviceLimits[deliveryService]:
+            foodItemInstance = foodItemsByService[deliveryService](postcode)
+            return await canDeliverResponse(foodItemInstance, postcode)
+
+    response = {}
+    tasks = {}
+    for postcode in postcodes:
+        try:
+            normalizedPostcode = normalizePostcode(postcode)
+        except InvalidPostcodeError as error:
+            response[postcode] = {
+                deliveryService: errorResponse(error) for deliveryService in foodItemsByService
+            }
+            continue
+        if normalizedPostcode not in tasks:
+            # in input order, the answers are filled in below
+            response[normalizedPostcode] = {}
+            tasks[normalizedPostcode] = {
+                deliveryService: asyncio.create_task(
+                    checkPostcode(deliveryService, normalizedPostcode)
+                )
+                for deliveryService in foodItemsByService
+            }
+    for postcode, postcodeTasks in tasks.items():
+        for deliveryService, task in postcodeTasks.items():
+            response[postcode][deliveryService] = await task
+
+    return batchDeliveryResponse(response)
+
+
+async def bulkCheckPostcode(deliveryService: str, postcode: str) -> Dict:
+    try:
+        foodItem = await getDeliveryServiceFromEndpoint(deliveryService)
+    except HTTPException as error:
+        # the backend was removed while the job was waiting to resume
+        return errorResponse(LookupError(error.detail))
+    return await canDeliverResponse(foodItem(postcode), postcode, sweep=True)
+
+
+bulkJobs = BulkJobs(settings.bulk_jobs_directory, bulkCheckPostcode, settings.bulk_jobs_max_running)
+
+
+async def getBulkJob(jobId: str) -> BulkJob:
+    job = await bulkJobs.get(jobId)
+    if not job:
+        raise HTTPException(status_code=HTTP_404_NOT_FOUND, detail=f"Could not find job {jobId}")
+    return job
+
+
+@app.post(
+    "/delivery/jobs", response_model=schemas.BulkJobResponse, status_code=HTTP_202_ACCEPTED
+)
+async def createBulkJob(
+        request: Request,
+        inputFormat: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+        services: Annotated[Optional[List[str]], Query()] = None
+):
+    """
+    Check a list of postcodes of any size in the background, uploaded as the
+    request body with a postcode per line, as CSV or NDJSON. The job's
+    status and results are available from the returned ID as it runs.
+    """
+    services = list(dict.fromkeys(services)) if services else [
+        spec.slug for spec in backendRegistry.backends(Capability.DIRECT)
+    ]
+    for deliveryService in services:
+        await getDeliveryServiceFromEndpoint(deliveryService)
+
+    try:
+        return await bulkJobs.create(request.stream(), inputFormat, services)
+    except InvalidInputError as error:
+        raise HTTPException(status_code=HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+
+
+@app.get("/delivery/jobs/{jobId}", response_model=schemas.BulkJobResponse)
+async def bulkJobStatus(jobId: str):
+    return (await getBulkJob(jobId)).state
+
+
+@app.get("/delivery/jobs/{jobId}/results")
+async def bulkJobResults(
+        jobId: str, outputFormat: Literal["ndjson", "csv"] = Query("ndjson", alias="format")
+):
+    """
+    The results in input order, streamed as they are checkpointed until the
+    job finishes. A CSV row has a column per service, true or false, or the
+    status when there is no answer.
+    """
+    job = await getBulkJob(jobId)
+    mediaType = "text/csv" if outputFormat == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        job.results(outputFormat, settings.bulk_job_poll_interval_seconds), media_type=mediaType
+    )
+
+
+@app.get("/cache/stats")
+async def cacheStats():
+    return {
+        "worker": workerId(),
+        "result_cache": {
+            "size": len(resultCache),
+            "services": resultCache.stats
+        },
+        "catchment_index": {"sectors": CatchmentIndex.stats()},
+        "ue_session_pool": UberEatsSessionPool.stats(),
+        "coverage_table": {"slots": len(coverageTable), "built_at": coverageTable.builtAt},
+        "negative_postcodes": NegativePostcodes.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return registry.render({"worker": workerId()})
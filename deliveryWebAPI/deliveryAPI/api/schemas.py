@@ -1,9 +1,77 @@
-from pydantic import BaseModel
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel, conlist
+
+from deliveryAPI.models.BackendRegistry import Capability
+from deliveryAPI.jobs.BulkJobs import JobStatus
+from deliveryAPI.postcodes import normalizePostcode
+
+
+class Postcode(str):
+    """
+    A UK postcode, validated and normalized to the canonical form used as the
+    key for caching and coalescing, so malformed input is rejected with a 422
+    before any upstream request is made.
+    """
+
+    @classmethod
+    def __get_validators__(cls):
+        yield cls.validate
+
+    @classmethod
+    def __modify_schema__(cls, fieldSchema):
+        fieldSchema.update(type="string", example="SW1A 1AA")
+
+    @classmethod
+    def validate(cls, value) -> "Postcode":
+        if not isinstance(value, str):
+            raise TypeError("string required")
+        return cls(normalizePostcode(value))
+
+
+class DeliveryStatus(str, Enum):
+    OK = "ok"
+    TIMED_OUT = "timed_out"
+    UNAVAILABLE = "unavailable"
+    ERROR = "error"
+    STALE = "stale"
+
+
+class DeliveryBackend(BaseModel):
+    slug: str
+    name: str
+    capabilities: List[Capability]
 
 
 class CanDeliverResponse(BaseModel):
-    can_deliver: bool
+    can_deliver: Optional[bool]  # None unless the status is ok or stale
+    status: DeliveryStatus = DeliveryStatus.OK
+    error: Optional[str] = None
+    age_seconds: Optional[float] = None  # how old a stale answer is
 
 
 class DeliveryServiceResponse(BaseModel):
     __root__: dict[str, CanDeliverResponse]
+
+
+class BatchRequest(BaseModel):
+    # normalized per postcode, so a malformed one is reported inline
+    postcodes: conlist(str, min_items=1)
+    services: Optional[List[str]] = None
+
+
+class BatchDeliveryServiceResponse(BaseModel):
+    __root__: dict[str, dict[str, CanDeliverResponse]]
+
+
+class BulkJobResponse(BaseModel):
+    id: str
+    status: JobStatus
+    services: List[str]
+    total: Optional[int]  # None until the upload has finished
+    rejected: int  # input lines that weren't a valid postcode
+    processed: int
+    created_at: float
+    updated_at: float
+    error: Optional[str]
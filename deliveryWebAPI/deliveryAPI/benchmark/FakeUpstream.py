@@ -0,0 +1,171 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+
+class RouteBehaviour:
+    """
+    How a fake upstream route responds: log-normally distributed latency around
+    a median, a rate of 503 responses, and how many items its payload holds.
+    """
+
+    def __init__(
+            self, latencyMs: float = 30, latencySigma: float = 0.5, errorRate: float = 0,
+            payloadItems: int = 10
+    ):
+        self.latencyMs = latencyMs
+        self.latencySigma = latencySigma
+        self.errorRate = errorRate
+        self.payloadItems = payloadItems
+
+    @classmethod
+    def fromDict(cls, behaviour: Dict, default: "RouteBehaviour" = None) -> "RouteBehaviour":
+        default = default or cls()
+        return cls(
+            latencyMs=behaviour.get("latency_ms", default.latencyMs),
+            latencySigma=behaviour.get("latency_sigma", default.latencySigma),
+            errorRate=behaviour.get("error_rate", default.errorRate),
+            payloadItems=behaviour.get("payload_items", default.payloadItems)
+        )
+
+
+class FakeUpstream:
+    """
+    Local stand in for the Pizza Hut, Dominos and Uber Eats endpoints used by
+    the food models. The routes don't overlap, so one server can stand in for
+    all three hosts. Requests are counted per route and exposed on /_stats.
+    """
+
+    ROUTES = {
+        "huts": ("GET", "/v1/huts"),
+        "stores": ("GET", "/api/stores/v1/stores"),
+        "locationAutocomplete": ("POST", "/api/getLocationAutocompleteV1"),
+        "deliveryLocation": ("POST", "/_p/api/getDeliveryLocationV1"),
+        "setTargetLocation": ("POST", "/_p/api/setTargetLocationV1"),
+        "searchSuggestions": ("POST", "/api/getSearchSuggestionsV1"),
+    }
+
+    def __init__(
+            self, defaultBehaviour: RouteBehaviour = None,
+            routeBehaviours: Dict[str, RouteBehaviour] = None, seed: Optional[int] = None
+    ):
+        self._defaultBehaviour = defaultBehaviour or RouteBehaviour()
+        self._routeBehaviours = routeBehaviours or {}
+        self._random = random.Random(seed)
+        self.requestCounts: Counter = Counter()
+
+    def createApp(self) -> web.Application:
+        app = web.Application()
+        for routeName, (method, path) in self.ROUTES.items():
+            app.router.add_route(method, path, self._routeHandler(routeName))
+        app.router.add_get("/_stats", self._stats)
+        app.router.add_post("/_stats/reset", self._resetStats)
+        return app
+
+    def _routeHandler(self, routeName: str):
+        async def handler(request: web.Request) -> web.Response:
+            self.requestCounts[routeName] += 1
+            behaviour = self._routeBehaviours.get(routeName, self._defaultBehaviour)
+            await asyncio.sleep(self._latency(behaviour))
+            if self._random.random() < behaviour.errorRate:
+                return web.Response(status=503)
+
+            payloadBuilder = getattr(self, f"_{routeName}Payload")
+            return web.json_response(await payloadBuilder(request, behaviour.payloadItems))
+        return handler
+
+    def _latency(self, behaviour: RouteBehaviour) -> float:
+        if behaviour.latencyMs <= 0:
+            return 0
+        return self._random.lognormvariate(
+            math.log(behaviour.latencyMs / 1000), behaviour.latencySigma
+        )
+
+    async def _stats(self, _request: web.Request) -> web.Response:
+        return web.json_response(dict(self.requestCounts))
+
+    async def _resetStats(self, _request: web.Request) -> web.Response:
+        self.requestCounts.clear()
+        return web.json_response({})
+
+    async def _hutsPayload(self, request: web.Request, items: int):
+        return [
+            {
+                "id": str(index),
+                "name": f"Hut {index}",
+                "address": {"lines": ["1 High Street"], "postcode": request.query.get("postcode")}
+            }
+            for index in range(items)
+        ]
+
+    async def _storesPayload(self, _request: web.Request, items: int):
+        stores = [
+            {"id": str(index), "name": f"Store {index}", "catchmentServiceability": {"reason": "None"}}
+            for index in range(items)
+        ]
+        return {"data": {"localStore": stores[0] if stores else None, "stores": stores}}
+
+    async def _locationAutocompletePayload(self, request: web.Request, _items: int):
+        form = await request.post()
+        return {"data": [{"id": f"place-{form.get('query')}"}]}
+
+    async def _deliveryLocationPayload(self, request: web.Request, _items: int):
+        body = await request.json()
+        return {"data": {"id": body["placeId"], "latitude": 51.5, "longitude": -0.1}}
+
+    async def _setTargetLocationPayload(self, _request: web.Request, _items: int):
+        return {"status": "success"}
+
+    async def _searchSuggestionsPayload(self, request: web.Request, items: int):
+        form = await request.post()
+        suggestions = [
+            {"type": "text", "title": f"Suggestion {index}"} for index in range(items)
+        ]
+        suggestions.append({"type": "store", "store": {"title": f"{form.get('userQuery')} Local"}})
+        return {"data": suggestions}
+
+
+def _parseArguments():
+    parser = argparse.ArgumentParser(description="Run a local fake of the delivery upstream APIs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--payload-items", type=int, default=10)
+    parser.add_argument(
+        "--config",
+        help="JSON file with per route behaviour, e.g. "
+             '{"searchSuggestions": {"latency_ms": 200, "error_rate": 0.01}}'
+    )
+    parser.add_argument("--seed", type=int)
+    return parser.parse_args()
+
+
+def main():
+    arguments = _parseArguments()
+    defaultBehaviour = RouteBehaviour(
+        arguments.latency_ms, arguments.latency_sigma, arguments.error_rate, arguments.payload_items
+    )
+    routeBehaviours = {}
+    if arguments.config:
+        with open(arguments.config) as configFile:
+            routeBehaviours = {
+                routeName: RouteBehaviour.fromDict(behaviour, defaultBehaviour)
+                for routeName, behaviour in json.load(configFile).items()
+            }
+
+    fakeUpstream = FakeUpstream(defaultBehaviour, routeBehaviours, arguments.seed)
+    web.run_app(
+        fakeUpstream.createApp(), host=arguments.host, port=arguments.port, print=None
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import asyncio
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout
+
+
+POSTCODE_UNIT_LETTERS = "ABDEFGHJLNPQRSTUWXYZ"
+
+
+def generatePostcodes(count: int, seed: int = 0) -> List[str]:
+    """
+    Well formed, distinct UK style postcodes, so the cache hit rate of a run
+    can be controlled by how many are used.
+    """
+    generator = random.Random(seed)
+    postcodes = set()
+    while len(postcodes) < count:
+        postcodes.add("{}{} {}{}{}".format(
+            "".join(generator.choice("ABCEGHKLMNPRSTW") for _ in range(2)),
+            generator.randint(1, 99),
+            generator.randint(0, 9),
+            generator.choice(POSTCODE_UNIT_LETTERS),
+            generator.choice(POSTCODE_UNIT_LETTERS)
+        ))
+    return sorted(postcodes)
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    orderedValues = sorted(values)
+    return orderedValues[max(0, math.ceil(len(orderedValues) * percent / 100) - 1)]
+
+
+class LoadTest:
+    """
+    Drives an endpoint of the API either at a fixed request rate (open loop,
+    requests start on schedule however slowly the API answers) or with a fixed
+    number of concurrent clients (closed loop).
+    """
+
+    def __init__(
+            self, baseUrl: str, path: str, postcodes: List[str], durationSeconds: float,
+            concurrency: int = 10, requestsPerSecond: Optional[float] = None,
+            requestTimeoutSeconds: float = 30
+    ):
+        self._baseUrl = baseUrl
+        self._path = path
+        self._postcodes = postcodes
+        self._durationSeconds = durationSeconds
+        self._concurrency = concurrency
+        self._requestsPerSecond = requestsPerSecond
+        self._requestTimeoutSeconds = requestTimeoutSeconds
+        self._latencies: List[float] = []
+        self._errors = 0
+        self._dropped = 0
+        self._requestNumber = 0
+
+    async def run(self) -> Dict:
+        timeout = ClientTimeout(total=self._requestTimeoutSeconds)
+        async with ClientSession(timeout=timeout) as session:
+            startTime = time.monotonic()
+            if self._requestsPerSecond:
+                await self._runOpenLoop(session)
+            else:
+                await self._runClosedLoop(session)
+            elapsed = time.monotonic() - startTime
+
+        return {
+            "path": self._path,
+            "mode": "rps" if self._requestsPerSecond else "concurrency",
+            "target_rps": self._requestsPerSecond,
+            "concurrency": self._concurrency,
+            "requests": len(self._latencies),
+            "errors": self._errors,
+            "dropped": self._dropped,
+            "throughput_rps": len(self._latencies) / elapsed if elapsed else 0,
+            "p50_ms": self._percentileMs(50),
+            "p95_ms": self._percentileMs(95),
+            "p99_ms": self._percentileMs(99),
+        }
+
+    def _percentileMs(self, percent: float) -> Optional[float]:
+        value = percentile(self._latencies, percent)
+        return None if value is None else round(value * 1000, 2)
+
+    async def _runClosedLoop(self, session: ClientSession):
+        deadline = time.monotonic() + self._durationSeconds
+
+        async def client():
+            while time.monotonic() < deadline:
+                await self._request(session)
+
+        await asyncio.gather(*(client() for _ in range(self._concurrency)))
+
+    async def _runOpenLoop(self, session: ClientSession):
+        interval = 1 / self._requestsPerSecond
+        inFlight = set()
+        nextStart = time.monotonic()
+        deadline = nextStart + self._durationSeconds
+        while nextStart < deadline:
+            await asyncio.sleep(max(0.0, nextStart - time.monotonic()))
+            nextStart += interval
+            if len(inFlight) >= self._concurrency:
+                # the API can't keep up, count it rather than queueing without bound
+                self._dropped += 1
+                continue
+            task = asyncio.create_task(self._request(session))
+            inFlight.add(task)
+            task.add_done_callback(inFlight.discard)
+
+        if inFlight:
+            await asyncio.wait(inFlight)
+
+    async def _request(self, session: ClientSession):
+        postcode = self._postcodes[self._requestNumber % len(self._postcodes)]
+        self._requestNumber += 1
+        startTime = time.monotonic()
+        try:
+            async with session.get(self._baseUrl + self._path, params={"postcode": postcode}) as response:
+                await response.read()
+                failed = response.status >= 400
+        except Exception:
+            failed = True
+
+        if failed:
+            self._errors += 1
+        else:
+            self._latencies.append(time.monotonic() - startTime)
+
+
+def compareToBaseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Describe every scenario that is slower, costlier in upstream calls or CPU,
+    or has lower throughput, than the baseline by more than the tolerance
+    (a fraction, e.g. 0.1 for 10%).
+    """
+    regressions = []
+    baselineScenarios = {scenario["name"]: scenario for scenario in baseline["scenarios"]}
+    for scenario in report["scenarios"]:
+        baselineScenario = baselineScenarios.get(scenario["name"])
+        if not baselineScenario:
+            continue
+
+        for metric in (
+                "p50_ms", "p95_ms", "p99_ms", "upstream_calls_per_request", "api_cpu_ms_per_request"
+        ):
+            current, previous = scenario.get(metric), baselineScenario.get(metric)
+            if current is not None and previous and current > previous * (1 + tolerance):
+                regressions.append(f"{scenario['name']}: {metric} {previous} -> {current}")
+
+        current, previous = scenario["throughput_rps"], baselineScenario["throughput_rps"]
+        if previous and current < previous * (1 - tolerance):
+            regressions.append(f"{scenario['name']}: throughput_rps {previous:.1f} -> {current:.1f}")
+    return regressions
@@ -0,0 +1,216 @@
+"""
+Offline benchmark of the API against a local fake upstream, e.g.
+
+    python -m deliveryAPI.benchmark --duration 20 --save-baseline baseline.json
+    python -m deliveryAPI.benchmark --duration 20 --compare baseline.json --tolerance 0.1
+
+Both servers run as subprocesses, the API with every upstream host pointed at
+the fake. The process exits non-zero if a comparison finds a regression.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession
+
+from deliveryAPI.benchmark.LoadTest import LoadTest, generatePostcodes, compareToBaseline
+
+
+UPSTREAM_HOSTS = ("api.pizzahut.io", "www.dominos.co.uk", "www.ubereats.com")
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _parseArguments():
+    parser = argparse.ArgumentParser(description="Benchmark the API against a local fake upstream")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--rps", type=float,
+        help="fixed request rate (open loop), otherwise --concurrency clients run back to back"
+    )
+    parser.add_argument("--postcodes", type=int, default=200, help="distinct postcodes to cycle through")
+    parser.add_argument("--services", nargs="*", default=["pizzahut", "dominos"])
+    parser.add_argument("--no-cache", action="store_true", help="disable the result cache in the API")
+    parser.add_argument(
+        "--no-fast-json", action="store_true", help="disable orjson encoding and decoding in the API"
+    )
+    parser.add_argument("--api-port", type=int, default=8090)
+    parser.add_argument("--upstream-port", type=int, default=8091)
+    parser.add_argument("--upstream-latency-ms", type=float, default=30)
+    parser.add_argument("--upstream-error-rate", type=float, default=0)
+    parser.add_argument("--upstream-config", help="per route behaviour JSON, see FakeUpstream --config")
+    parser.add_argument("--output", help="write the report to this file as well as stdout")
+    parser.add_argument("--save-baseline", help="write the report as a baseline to this file")
+    parser.add_argument("--compare", help="baseline file to compare the report against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    return parser.parse_args()
+
+
+def _startUpstream(arguments) -> subprocess.Popen:
+    command = [
+        sys.executable, "-m", "deliveryAPI.benchmark.FakeUpstream",
+        "--port", str(arguments.upstream_port),
+        "--latency-ms", str(arguments.upstream_latency_ms),
+        "--error-rate", str(arguments.upstream_error_rate),
+        "--seed", "0",
+    ]
+    if arguments.upstream_config:
+        command.extend(["--config", os.path.abspath(arguments.upstream_config)])
+    return subprocess.Popen(command, cwd=PACKAGE_ROOT)
+
+
+def _startApi(arguments, workingDirectory: str) -> subprocess.Popen:
+    upstreamUrl = f"http://127.0.0.1:{arguments.upstream_port}"
+    environment = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join(filter(None, [PACKAGE_ROOT, os.environ.get("PYTHONPATH")])),
+        DELIVERY_API_UPSTREAM_BASE_URLS=json.dumps({host: upstreamUrl for host in UPSTREAM_HOSTS}),
+    )
+    if arguments.no_cache:
+        environment["DELIVERY_API_RESULT_CACHE_TTL_SECONDS"] = "0"
+        environment["DELIVERY_API_RESULT_CACHE_NEGATIVE_TTL_SECONDS"] = "0"
+    if arguments.no_fast_json:
+        environment["DELIVERY_API_FAST_JSON"] = "false"
+    # run from a scratch directory so the location cache file starts empty
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "deliveryAPI.api.api:app",
+            "--port", str(arguments.api_port), "--log-level", "warning",
+        ],
+        cwd=workingDirectory, env=environment
+    )
+
+
+def _waitForPort(port: int, process: subprocess.Popen, timeoutSeconds: float = 20):
+    deadline = time.monotonic() + timeoutSeconds
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process for port {port} exited with {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port} after {timeoutSeconds}s")
+
+
+def _peakRssMb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as statusFile:
+            for line in statusFile:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def _cpuSeconds(pid: int) -> Optional[float]:
+    """
+    User and system CPU time the process has used so far.
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as statFile:
+            # skip past the command name, which can contain spaces
+            fields = statFile.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime and stime, fields 14 and 15 of the whole line
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def _upstreamCalls(session: ClientSession, upstreamBaseUrl: str) -> int:
+    async with session.get(f"{upstreamBaseUrl}/_stats") as response:
+        return sum((await response.json()).values())
+
+
+async def _runScenarios(arguments, apiProcess: subprocess.Popen) -> Dict:
+    apiBaseUrl = f"http://127.0.0.1:{arguments.api_port}"
+    upstreamBaseUrl = f"http://127.0.0.1:{arguments.upstream_port}"
+    postcodes = generatePostcodes(arguments.postcodes)
+    paths = {"all": "/delivery/food"}
+    paths.update({service: f"/delivery/food/{service}" for service in arguments.services})
+
+    scenarios: List[Dict] = []
+    async with ClientSession() as session:
+        for name, path in paths.items():
+            upstreamCallsBefore = await _upstreamCalls(session, upstreamBaseUrl)
+            cpuSecondsBefore = _cpuSeconds(apiProcess.pid)
+            result = await LoadTest(
+                apiBaseUrl, path, postcodes, arguments.duration,
+                concurrency=arguments.concurrency, requestsPerSecond=arguments.rps
+            ).run()
+            cpuSecondsAfter = _cpuSeconds(apiProcess.pid)
+            upstreamCalls = await _upstreamCalls(session, upstreamBaseUrl) - upstreamCallsBefore
+            result["name"] = name
+            result["upstream_calls_per_request"] = (
+                round(upstreamCalls / result["requests"], 3) if result["requests"] else None
+            )
+            # the API's CPU cost per request, what the work on the hot path shows up in
+            result["api_cpu_ms_per_request"] = (
+                round((cpuSecondsAfter - cpuSecondsBefore) * 1000 / result["requests"], 3)
+                if result["requests"] and cpuSecondsBefore is not None and cpuSecondsAfter is not None
+                else None
+            )
+            scenarios.append(result)
+            print(json.dumps(result), file=sys.stderr)
+
+    return {
+        "settings": {
+            "duration": arguments.duration,
+            "concurrency": arguments.concurrency,
+            "rps": arguments.rps,
+            "postcodes": arguments.postcodes,
+            "no_cache": arguments.no_cache,
+            "no_fast_json": arguments.no_fast_json,
+            "upstream_latency_ms": arguments.upstream_latency_ms,
+            "upstream_error_rate": arguments.upstream_error_rate,
+        },
+        "peak_rss_mb": _peakRssMb(apiProcess.pid),
+        "scenarios": scenarios,
+    }
+
+
+def main() -> int:
+    arguments = _parseArguments()
+    processes = []
+    with tempfile.TemporaryDirectory() as workingDirectory:
+        try:
+            processes.append(_startUpstream(arguments))
+            _waitForPort(arguments.upstream_port, processes[-1])
+            apiProcess = _startApi(arguments, workingDirectory)
+            processes.append(apiProcess)
+            _waitForPort(arguments.api_port, apiProcess)
+
+            report = asyncio.run(_runScenarios(arguments, apiProcess))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+    reportJson = json.dumps(report, indent=2)
+    print(reportJson)
+    for path in filter(None, (arguments.output, arguments.save_baseline)):
+        with open(path, "w") as reportFile:
+            reportFile.write(reportJson)
+
+    if arguments.compare:
+        with open(arguments.compare) as baselineFile:
+            regressions = compareToBaseline(report, json.load(baselineFile), arguments.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+import asyncio
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+
+class CacheStore(ABC):
+    """
+    Key value store of bytes with a per entry expiry, shared by the caches
+    that can outlive or be shared between processes. Locks are plain keys
+    set only if absent, so workers can agree on which of them fetches a key.
+    A lock's value is a token only its holder knows, so nobody else can
+    release it.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    async def acquireLock(self, key: str, ttl: float) -> Optional[str]:
+        """
+        Take the lock if nobody holds it, returning the token to release it
+        with, or None if it is held. It is released after ttl seconds in
+        case the holder dies.
+        """
+
+    @abstractmethod
+    async def releaseLock(self, key: str, token: str):
+        """
+        Release the lock if it is still held with the token, and not by
+        whoever took it after it expired.
+        """
+
+    async def sweep(self) -> int:
+        """
+        Remove expired entries, returning the number removed.
+        """
+        return 0
+
+    async def close(self):
+        pass
+
+
+class MemoryStore(CacheStore):
+    """
+    Store private to the process, for a single worker or for tests.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Tuple[bytes, Optional[float]]] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if not entry:
+            return None
+        value, expiry = entry
+        if expiry is not None and expiry <= time.time():
+            del self._entries[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        self._entries[key] = (value, time.time() + ttl if ttl is not None else None)
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def acquireLock(self, key: str, ttl: float) -> Optional[str]:
+        if await self.get(key) is not None:
+            return None
+        token = _newToken()
+        await self.set(key, token.encode(), ttl)
+        return token
+
+    async def releaseLock(self, key: str, token: str):
+        if await self.get(key) == token.encode():
+            del self._entries[key]
+
+    async def sweep(self) -> int:
+        now = time.time()
+        expiredKeys = [
+            key for key, (_value, expiry) in self._entries.items()
+            if expiry is not None and expiry <= now
+        ]
+        for key in expiredKeys:
+            del self._entries[key]
+        return len(expiredKeys)
+
+
+class FileStore(CacheStore):
+    """
+    sqlite file shared by the workers on one host. sqlite locks the file
+    for each write, so several processes can write to it safely. All access
+    runs on a single worker thread, so the event loop never blocks on file I/O.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="FileStore")
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._runInExecutor(self._get, key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self._runInExecutor(self._set, key, value, ttl)
+
+    async def delete(self, key: str):
+        await self._runInExecutor(self._delete, key)
+
+    async def acquireLock(self, key: str, ttl: float) -> Optional[str]:
+        token = _newToken()
+        if await self._runInExecutor(self._acquireLock, key, token, ttl):
+            return token
+        return None
+
+    async def releaseLock(self, key: str, token: str):
+        await self._runInExecutor(self._releaseLock, key, token)
+
+    async def sweep(self) -> int:
+        return await self._runInExecutor(self._sweep)
+
+    async def close(self):
+        await self._runInExecutor(self._close)
+
+    async def _runInExecutor(self, function: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, function, *args
+        )
+
+    # the methods below only run on the executor thread
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            # autocommit, each statement is its own transaction
+            self._db = sqlite3.connect(self._path, timeout=5, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expiry REAL)"
+            )
+        return self._db
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _get(self, key: str) -> Optional[bytes]:
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE key = ? AND (expiry IS NULL OR expiry > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: bytes, ttl: Optional[float]):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO entries (key, value, expiry) VALUES (?, ?, ?)",
+            (key, value, time.time() + ttl if ttl is not None else None)
+        )
+
+    def _delete(self, key: str):
+        self._connect().execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _acquireLock(self, key: str, token: str, ttl: float) -> bool:
+        db = self._connect()
+        now = time.time()
+        # the upsert only replaces a lock that has expired, in a single statement
+        cursor = db.execute(
+            "INSERT INTO entries (key, value, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expiry = excluded.expiry "
+            "WHERE entries.expiry IS NOT NULL AND entries.expiry <= ?",
+            (key, token.encode(), now + ttl, now)
+        )
+        return cursor.rowcount == 1
+
+    def _releaseLock(self, key: str, token: str):
+        self._connect().execute(
+            "DELETE FROM entries WHERE key = ? AND value = ?", (key, token.encode())
+        )
+
+    def _sweep(self) -> int:
+        return self._connect().execute(
+            "DELETE FROM entries WHERE expiry IS NOT NULL AND expiry <= ?", (time.time(),)
+        ).rowcount
+
+
+class RedisStore(CacheStore):
+    """
+    Redis, or anything speaking its protocol, shared by every worker on every
+    node pointed at it. Redis expires entries itself.
+    """
+
+    # compares and deletes in one step, so a lock taken by another worker
+    # between the two is left alone
+    _RELEASE_LOCK = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then "
+        "return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, client):
+        self._client = client
+
+    @classmethod
+    def fromUrl(cls, url: str) -> "RedisStore":
+        try:
+            from redis import asyncio as redis
+        except ImportError as error:
+            raise RuntimeError(f"the redis package is needed for the cache store {url}") from error
+        return cls(redis.Redis.from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        await self._client.set(key, value, px=self._milliseconds(ttl) if ttl is not None else None)
+
+    async def delete(self, key: str):
+        await self._client.delete(key)
+
+    async def acquireLock(self, key: str, ttl: float) -> Optional[str]:
+        token = _newToken()
+        if await self._client.set(key, token.encode(), nx=True, px=self._milliseconds(ttl)):
+            return token
+        return None
+
+    async def releaseLock(self, key: str, token: str):
+        await self._client.eval(self._RELEASE_LOCK, 1, key, token.encode())
+
+    async def close(self):
+        await self._client.aclose()
+
+    @staticmethod
+    def _milliseconds(seconds: float) -> int:
+        return max(1, int(seconds * 1000))
+
+
+def _newToken() -> str:
+    return uuid.uuid4().hex
+
+
+def createStore(url: str) -> CacheStore:
+    """
+    The store for a URL, one of memory://, file://<path> or
+    redis://[:password@]<host>[:port][/<db>] (rediss:// for TLS).
+    """
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryStore()
+    if scheme == "file":
+        # file://relative/path as well as file:///absolute/path
+        return FileStore(url[len("file://"):])
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisStore.fromUrl(url)
+    raise ValueError(f"unknown cache store {url!r}")
@@ -0,0 +1,200 @@
+import asyncio
+import fcntl
+import heapq
+import json
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from deliveryAPI.settings import settings
+from deliveryAPI.files import writeAtomically
+from deliveryAPI.postcodes import normalizePostcode, InvalidPostcodeError
+
+
+class HotPostcodes:
+    """
+    Request counts per postcode, bounded to roughly the most requested
+    maxSize. Counts decay over time so the ranking follows recent traffic.
+    """
+
+    _MIN_COUNT = 0.1
+
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self._counts: Dict[str, float] = {}
+        # recorded since the counts were last merged with the other workers'
+        self._recorded: Dict[str, float] = {}
+
+    def record(self, postcode: str):
+        self._counts[postcode] = self._counts.get(postcode, 0) + 1
+        self._recorded[postcode] = self._recorded.get(postcode, 0) + 1
+        if len(self._counts) > self.maxSize * 2:
+            # prune in batches rather than on every new postcode
+            self._counts = self._pruned(self._counts)
+        if len(self._recorded) > self.maxSize * 2:
+            self._recorded = self._pruned(self._recorded)
+
+    def top(self, count: int) -> List[str]:
+        return heapq.nlargest(count, self._counts, key=self._counts.get)
+
+    def decay(self, factor: float):
+        self._counts = {
+            postcode: count * factor for postcode, count in self._counts.items()
+            if count * factor >= self._MIN_COUNT
+        }
+
+    def add(self, counts: Dict[str, float]):
+        for postcode, count in counts.items():
+            self._counts[postcode] = self._counts.get(postcode, 0) + count
+        if len(self._counts) > self.maxSize:
+            self._counts = self._pruned(self._counts)
+
+    def takeRecorded(self) -> Dict[str, float]:
+        recorded, self._recorded = self._recorded, {}
+        return recorded
+
+    def reset(self, merged: "HotPostcodes"):
+        """
+        Take the merged counts, keeping what was recorded since they were
+        merged.
+        """
+        self._counts = dict(merged._counts)
+        self.add(self._recorded)
+
+    def load(self, path: str):
+        try:
+            with open(path) as stateFile:
+                self._counts.update(json.load(stateFile))
+        except (OSError, ValueError):
+            # no state yet, or it was only partly written
+            pass
+
+    def dumps(self) -> str:
+        return json.dumps(self._counts)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _pruned(self, counts: Dict[str, float]) -> Dict[str, float]:
+        return {
+            postcode: counts[postcode]
+            for postcode in heapq.nlargest(self.maxSize, counts, key=counts.get)
+        }
+
+
+def _mergeState(
+        path: str, recorded: Dict[str, float], decayFactor: float, maxSize: int
+) -> HotPostcodes:
+    """
+    Add a worker's recorded counts to the state file the workers share,
+    returning the merged counts. The file is locked while it is read and
+    written, so the workers don't overwrite each other's counts.
+    """
+    with open(f"{path}.lock", "a") as lockFile:
+        fcntl.flock(lockFile, fcntl.LOCK_EX)
+        hotPostcodes = HotPostcodes(maxSize)
+        hotPostcodes.load(path)
+        hotPostcodes.add(recorded)
+        hotPostcodes.decay(decayFactor)
+        writeAtomically(path, hotPostcodes.dumps())
+    return hotPostcodes
+
+
+class CacheWarmer:
+    """
+    Keeps the caches warm for the most requested postcodes, and any configured
+    ones, filling them at startup and refreshing answers shortly before they
+    expire. Postcodes are warmed one at a time and the backend checks are
+    spaced out to the configured rate, so warming takes a small, fixed share
+    of upstream capacity away from live traffic.
+
+    With a state file, only the worker holding its lock warms, so the rate
+    holds however many workers there are, and every worker merges its counts
+    into the file. Without one, each worker warms from its own counts.
+    """
+
+    def __init__(
+            self, hotPostcodes: HotPostcodes, warmPostcode: Callable[[str], Awaitable[int]]
+    ):
+        self.hotPostcodes = hotPostcodes
+        # fills or refreshes the caches for a postcode, returning the number of backend checks
+        self._warmPostcode = warmPostcode
+        self._task: Optional[asyncio.Task] = None
+        self._lockFile = None
+
+    async def open(self):
+        if settings.warm_state_file:
+            await asyncio.to_thread(self.hotPostcodes.load, settings.warm_state_file)
+        if not self._task:
+            self._task = asyncio.create_task(self._warmPeriodically())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self._saveState()
+        if self._lockFile:
+            self._lockFile.close()
+            self._lockFile = None
+
+    def isWarming(self) -> bool:
+        """
+        Whether this worker warms, taking over the lock if the worker that
+        held it has gone.
+        """
+        if not settings.warm_state_file or self._lockFile:
+            return True
+        lockFile = open(f"{settings.warm_state_file}.warmer", "a")
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockFile.close()
+            return False
+        self._lockFile = lockFile
+        return True
+
+    def postcodes(self) -> List[str]:
+        postcodes = []
+        for postcode in settings.warm_postcodes:
+            try:
+                postcodes.append(normalizePostcode(postcode))
+            except InvalidPostcodeError:
+                continue
+        postcodes.extend(self.hotPostcodes.top(settings.warm_top_postcodes))
+        return list(dict.fromkeys(postcodes))
+
+    async def warm(self) -> int:
+        """
+        One pass over the postcodes to warm, returning the number of backend
+        checks made.
+        """
+        checks = 0
+        for postcode in self.postcodes():
+            postcodeChecks = await self._warmPostcode(postcode)
+            checks += postcodeChecks
+            if postcodeChecks:
+                await asyncio.sleep(postcodeChecks / settings.warm_checks_per_second)
+        return checks
+
+    async def _warmPeriodically(self):
+        while True:
+            startTime = time.monotonic()
+            warming = self.isWarming()
+            if warming:
+                await self.warm()
+            await asyncio.sleep(settings.warm_interval_seconds)
+            # the shared counts are decayed once, by the worker warming
+            decayFactor = 0.5 ** (
+                (time.monotonic() - startTime) / settings.warm_half_life_seconds
+            ) if warming else 1
+            await self._saveState(decayFactor)
+
+    async def _saveState(self, decayFactor: float = 1):
+        if not settings.warm_state_file:
+            self.hotPostcodes.decay(decayFactor)
+            return
+        # taken on the event loop so the counts can't change underneath the merge
+        merged = await asyncio.to_thread(
+            _mergeState, settings.warm_state_file, self.hotPostcodes.takeRecorded(),
+            decayFactor, self.hotPostcodes.maxSize
+        )
+        self.hotPostcodes.reset(merged)
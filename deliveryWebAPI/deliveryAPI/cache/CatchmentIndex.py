@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from deliveryAPI.settings import settings
+from deliveryAPI.metrics import CATCHMENT_INDEX
+from deliveryAPI.postcodes import normalizePostcode, postcodeSector
+
+
+class CatchmentIndex:
+    """
+    Per backend record of upstream answers grouped by postcode sector, so a
+    sector clearly inside or outside a store's catchment can be answered
+    without an upstream call. A sector is only answered locally once enough
+    different postcodes in it have been seen recently and they all agree, on
+    the answer and, when delivery is possible, on the store. Anything else is
+    ambiguous and goes upstream.
+    """
+
+    _MAX_POSTCODES_PER_SECTOR = 32
+
+    _indexes: Dict[str, "CatchmentIndex"] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        # sector -> postcode -> (canDeliver, storeId, observedAt)
+        self._sectors: OrderedDict[
+            str, OrderedDict[str, Tuple[bool, Optional[str], float]]
+        ] = OrderedDict()
+
+    @classmethod
+    def forBackend(cls, name: str) -> "CatchmentIndex":
+        index = cls._indexes.get(name)
+        if not index:
+            index = cls._indexes[name] = cls(name)
+        return index
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        return {name: len(index) for name, index in cls._indexes.items()}
+
+    def __len__(self) -> int:
+        return len(self._sectors)
+
+    def lookup(self, postcode: str) -> Optional[bool]:
+        """
+        Whether the backend delivers to the postcode, or None if the sector is
+        unknown or ambiguous and the upstream has to be asked.
+        """
+        sector = postcodeSector(postcode)
+        observations = self._freshObservations(sector) if sector else None
+        if not observations or len(observations) < settings.catchment_min_observations:
+            CATCHMENT_INDEX.inc(self.name, "unknown")
+            return None
+
+        answers = {
+            (canDeliver, storeId if canDeliver else None)
+            for canDeliver, storeId, _observedAt in observations.values()
+        }
+        if len(answers) != 1:
+            CATCHMENT_INDEX.inc(self.name, "ambiguous")
+            return None
+
+        self._sectors.move_to_end(sector)
+        canDeliver, _storeId = answers.pop()
+        CATCHMENT_INDEX.inc(self.name, "inside" if canDeliver else "outside")
+        return canDeliver
+
+    def record(self, postcode: str, canDeliver: bool, storeId: Optional[str] = None):
+        sector = postcodeSector(postcode)
+        if not sector:
+            return
+
+        observations = self._sectors.setdefault(sector, OrderedDict())
+        unit = normalizePostcode(postcode)
+        observations[unit] = (canDeliver, storeId, time.monotonic())
+        observations.move_to_end(unit)
+        while len(observations) > self._MAX_POSTCODES_PER_SECTOR:
+            observations.popitem(last=False)
+
+        self._sectors.move_to_end(sector)
+        while len(self._sectors) > settings.catchment_max_sectors:
+            self._sectors.popitem(last=False)
+
+    def clear(self):
+        self._sectors.clear()
+
+    def _freshObservations(
+            self, sector: str
+    ) -> Optional[OrderedDict[str, Tuple[bool, Optional[str], float]]]:
+        observations = self._sectors.get(sector)
+        if not observations:
+            return None
+
+        oldestAllowed = time.monotonic() - settings.catchment_ttl_seconds
+        for unit, (_canDeliver, _storeId, observedAt) in list(observations.items()):
+            if observedAt < oldestAllowed:
+                del observations[unit]
+        if not observations:
+            del self._sectors[sector]
+        return observations
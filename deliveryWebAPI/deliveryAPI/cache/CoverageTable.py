@@ -0,0 +1,197 @@
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from deliveryAPI.settings import settings
+from deliveryAPI.metrics import COVERAGE_TABLE
+from deliveryAPI.postcodes import normalizePostcode, postcodeSector
+
+
+# magic, slot count, brand count, built at
+_HEADER = struct.Struct("<8sIId")
+# brand name, swept at
+_BRAND = struct.Struct("<64sd")
+_MAGIC = b"DCOVTBL1"
+# a normalized postcode is at most 8 characters, e.g. "SW1A 1AA", a sector 6
+_KEY_BYTES = 8
+
+
+def _encodeKey(key: str) -> bytes:
+    return key.encode("ascii").ljust(_KEY_BYTES, b"\0")
+
+
+def _firstSlot(key: bytes, slotCount: int) -> int:
+    return zlib.crc32(key) & (slotCount - 1)
+
+
+class CoverageTable:
+    """
+    Answers from a postcode sweep, compiled by deliveryAPI.coverage into a
+    file that is memory mapped rather than read, so the workers on a host
+    share its pages. Keys, postcodes and postcode sectors, are in an open
+    addressed hash table, so a lookup is a few probes whatever the size.
+    Each brand has a row of two bitsets over the slots, whether the answer
+    is known and whether it can deliver, and the time it was swept. A row
+    older than the maximum age isn't used.
+
+        header | brands | keys, 8 bytes a slot | per brand: known bits, can deliver bits
+    """
+
+    def __init__(self):
+        self._map: Optional[mmap.mmap] = None
+        self._slotCount = 0
+        self._keysOffset = 0
+        # brand name -> (row number, swept at)
+        self._brands: Dict[str, Tuple[int, float]] = {}
+        self.builtAt: Optional[float] = None
+
+    def open(self, path: str):
+        with open(path, "rb") as tableFile:
+            tableMap = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slotCount, brandCount, builtAt = _HEADER.unpack_from(tableMap)
+        if magic != _MAGIC:
+            tableMap.close()
+            raise ValueError(f"{path} is not a coverage table")
+
+        brands = {}
+        for row in range(brandCount):
+            name, sweptAt = _BRAND.unpack_from(tableMap, _HEADER.size + row * _BRAND.size)
+            brands[name.rstrip(b"\0").decode()] = (row, sweptAt)
+
+        self.close()
+        self._map = tableMap
+        self._slotCount = slotCount
+        self._keysOffset = _HEADER.size + brandCount * _BRAND.size
+        self._brands = brands
+        self.builtAt = builtAt
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._brands = {}
+        self.builtAt = None
+
+    def __len__(self) -> int:
+        return self._slotCount if self._map is not None else 0
+
+    def lookup(self, name: str, postcode: str) -> Optional[bool]:
+        """
+        Whether the brand delivers to the postcode, by the postcode or failing
+        that its sector, or None if the table can't say.
+        """
+        if self._map is None or name not in self._brands:
+            return None
+        row, sweptAt = self._brands[name]
+        if sweptAt + settings.coverage_table_max_age_seconds <= time.time():
+            COVERAGE_TABLE.inc(name, "stale")
+            return None
+
+        for key in (postcode, postcodeSector(postcode)):
+            slot = self._find(key) if key else None
+            if slot is not None and self._bit(row * 2, slot):
+                COVERAGE_TABLE.inc(name, "hit")
+                return self._bit(row * 2 + 1, slot)
+        COVERAGE_TABLE.inc(name, "miss")
+        return None
+
+    def _find(self, key: str) -> Optional[int]:
+        encodedKey = _encodeKey(key)
+        mask = self._slotCount - 1
+        slot = _firstSlot(encodedKey, self._slotCount)
+        # at most half the slots are used, so an empty one is always reached
+        while True:
+            offset = self._keysOffset + slot * _KEY_BYTES
+            slotKey = self._map[offset:offset + _KEY_BYTES]
+            if slotKey == encodedKey:
+                return slot
+            if slotKey[0] == 0:
+                return None
+            slot = (slot + 1) & mask
+
+    def _bit(self, bitset: int, slot: int) -> bool:
+        offset = (
+            self._keysOffset + self._slotCount * _KEY_BYTES +
+            bitset * (self._slotCount // 8) + slot // 8
+        )
+        return bool(self._map[offset] & (1 << (slot % 8)))
+
+
+class CoverageTableBuilder:
+    """
+    Collects answers by brand and postcode and writes them as a
+    CoverageTable. A later answer for the same brand and postcode replaces
+    an earlier one, and a brand's row is dated by its oldest answer.
+    """
+
+    def __init__(self):
+        # key -> two bits per brand, known and can deliver
+        self._keys: Dict[str, int] = {}
+        # brand name -> (row number, swept at)
+        self._brands: Dict[str, Tuple[int, float]] = {}
+
+    def add(self, name: str, postcode: str, canDeliver: bool, sweptAt: float):
+        if len(name.encode()) > _BRAND.size - 8:
+            raise ValueError(f"brand name {name!r} is too long")
+        row, brandSweptAt = self._brands.get(name, (len(self._brands), sweptAt))
+        self._brands[name] = (row, min(brandSweptAt, sweptAt))
+
+        key = normalizePostcode(postcode)
+        bits = self._keys.get(key, 0) & ~(0b11 << row * 2)
+        self._keys[key] = bits | (0b01 | canDeliver << 1) << row * 2
+
+    def addSectors(self, minPostcodes: int):
+        """
+        Add an answer for each sector where at least minPostcodes postcodes
+        were answered for a brand and all agree, so the rest of the sector
+        is answered as well.
+        """
+        # (sector, row) -> [postcodes, that can deliver]
+        sectorCounts: Dict[Tuple[str, int], List[int]] = {}
+        for key, bits in self._keys.items():
+            sector = postcodeSector(key)
+            for row, _sweptAt in self._brands.values():
+                if bits >> row * 2 & 0b01:
+                    counts = sectorCounts.setdefault((sector, row), [0, 0])
+                    counts[0] += 1
+                    counts[1] += bits >> row * 2 + 1 & 0b01
+
+        for (sector, row), (postcodes, canDeliver) in sectorCounts.items():
+            if postcodes >= minPostcodes and canDeliver in (0, postcodes):
+                self._keys[sector] = (
+                    self._keys.get(sector, 0) | (0b01 | bool(canDeliver) << 1) << row * 2
+                )
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def write(self, path: str):
+        slotCount = 8
+        while slotCount < len(self._keys) * 2:
+            slotCount *= 2
+        keys = bytearray(slotCount * _KEY_BYTES)
+        bitsets = [bytearray(slotCount // 8) for _row in range(len(self._brands) * 2)]
+
+        for key, bits in self._keys.items():
+            encodedKey = _encodeKey(key)
+            slot = _firstSlot(encodedKey, slotCount)
+            while keys[slot * _KEY_BYTES]:
+                slot = (slot + 1) % slotCount
+            keys[slot * _KEY_BYTES:(slot + 1) * _KEY_BYTES] = encodedKey
+            for bitset, bitsetBytes in enumerate(bitsets):
+                if bits >> bitset & 1:
+                    bitsetBytes[slot // 8] |= 1 << (slot % 8)
+
+        temporaryPath = f"{path}.{os.getpid()}.tmp"
+        with open(temporaryPath, "wb") as tableFile:
+            tableFile.write(_HEADER.pack(_MAGIC, slotCount, len(self._brands), time.time()))
+            for name, (_row, sweptAt) in sorted(self._brands.items(), key=lambda item: item[1][0]):
+                tableFile.write(_BRAND.pack(name.encode(), sweptAt))
+            tableFile.write(keys)
+            for bitsetBytes in bitsets:
+                tableFile.write(bitsetBytes)
+        # replaced rather than rewritten, workers with the old file mapped keep reading it
+        os.replace(temporaryPath, path)
@@ -1,33 +1,138 @@
-import dbm
+import asyncio
 import json
 import time
-from typing import Dict, Optional
+from collections import OrderedDict
+from typing import Dict, Optional, Set
+
+from deliveryAPI.settings import settings
+from deliveryAPI.metrics import LOCATION_CACHE, CACHE_STORE_ERRORS
+from deliveryAPI.cache.CacheStore import CacheStore, createStore
 
 
 class UELocationCache:
+    """
+    Two tier cache of Uber Eats locations: an in-memory LRU in front of a
+    cache store that outlives the process and is shared with the other
+    workers, a sqlite file by default or Redis to share it between nodes.
+    Writes to the store happen in the background, so a lookup never waits
+    on them, and a failing store only costs the second tier.
+    """
 
-    _CACHE_NAME = "UE_Postcodes"
+    _KEY_PREFIX = "ue_location:"
     _CACHE_EXPIRY_SECONDS = 604800  # 7 days
 
+    _memory: OrderedDict[str, Dict] = OrderedDict()
+    _store: Optional[CacheStore] = None
+    _writes: Set[asyncio.Task] = set()
+    _sweeper: Optional[asyncio.Task] = None
+
     @classmethod
-    def getCacheLocation(cls, postcode: str) -> Optional[Dict]:
-        with dbm.open(cls._CACHE_NAME, "c") as db:
-            locationData = db.get(postcode)
-            if not locationData:
-                return None
+    async def open(cls):
+        cls._getStore()
+        if not cls._sweeper:
+            cls._sweeper = asyncio.create_task(cls._sweepPeriodically())
 
-            locationData = json.loads(locationData)
-            createdDate = locationData.pop("create_date")
+    @classmethod
+    async def close(cls):
+        if cls._sweeper:
+            cls._sweeper.cancel()
+            cls._sweeper = None
+        if cls._writes:
+            await asyncio.wait(cls._writes)
+        if cls._store is not None:
+            await cls._store.close()
+        cls._memory.clear()
 
-            if createdDate < time.time() - cls._CACHE_EXPIRY_SECONDS:
-                del db[postcode]
+    @classmethod
+    async def getCacheLocation(cls, postcode: str) -> Optional[Dict]:
+        locationData = cls._memory.get(postcode)
+        if locationData is None:
+            rawLocationData = await cls._readLocation(postcode)
+            if not rawLocationData:
+                LOCATION_CACHE.inc("miss")
                 return None
+            locationData = json.loads(rawLocationData)
+            cls._remember(postcode, locationData)
+            result = "store_hit"
+        else:
+            cls._memory.move_to_end(postcode)
+            result = "memory_hit"
 
-            return locationData
+        if cls._isExpired(locationData):
+            # the store expires its copy by itself
+            cls._memory.pop(postcode, None)
+            LOCATION_CACHE.inc("expired")
+            return None
+
+        LOCATION_CACHE.inc(result)
+
+        location = dict(locationData)
+        location.pop("create_date")
+        return location
 
     @classmethod
     def setCacheLocation(cls, postcode: str, location: Dict):
-        with dbm.open(cls._CACHE_NAME, "c") as db:
-            location["create_date"] = time.time()
+        locationData = dict(location, create_date=time.time())
+        cls._remember(postcode, locationData)
+        write = asyncio.create_task(
+            cls._writeLocation(postcode, json.dumps(locationData, separators=(",", ":")).encode())
+        )
+        cls._writes.add(write)
+        write.add_done_callback(cls._writes.discard)
+
+    @classmethod
+    async def sweep(cls) -> int:
+        """
+        Remove expired entries from both tiers, returning the number removed
+        from the persistent store.
+        """
+        for postcode, locationData in list(cls._memory.items()):
+            if cls._isExpired(locationData):
+                del cls._memory[postcode]
+        try:
+            removed = await cls._getStore().sweep()
+        except Exception:
+            CACHE_STORE_ERRORS.inc("ue_location")
+            return 0
+        LOCATION_CACHE.inc("swept", amount=removed)
+        return removed
+
+    @classmethod
+    async def _sweepPeriodically(cls):
+        while True:
+            await asyncio.sleep(settings.ue_location_cache_sweep_interval_seconds)
+            await cls.sweep()
+
+    @classmethod
+    def _remember(cls, postcode: str, locationData: Dict):
+        cls._memory[postcode] = locationData
+        cls._memory.move_to_end(postcode)
+        while len(cls._memory) > settings.ue_location_cache_memory_size:
+            cls._memory.popitem(last=False)
+
+    @classmethod
+    def _isExpired(cls, locationData: Dict) -> bool:
+        return locationData["create_date"] < time.time() - cls._CACHE_EXPIRY_SECONDS
 
-            db[postcode] = json.dumps(location)
+    @classmethod
+    def _getStore(cls) -> CacheStore:
+        if cls._store is None:
+            cls._store = createStore(settings.ue_location_cache_store_url)
+        return cls._store
+
+    @classmethod
+    async def _readLocation(cls, postcode: str) -> Optional[bytes]:
+        try:
+            return await cls._getStore().get(cls._KEY_PREFIX + postcode)
+        except Exception:
+            CACHE_STORE_ERRORS.inc("ue_location")
+            return None
+
+    @classmethod
+    async def _writeLocation(cls, postcode: str, rawLocationData: bytes):
+        try:
+            await cls._getStore().set(
+                cls._KEY_PREFIX + postcode, rawLocationData, cls._CACHE_EXPIRY_SECONDS
+            )
+        except Exception:
+            CACHE_STORE_ERRORS.inc("ue_location")
@@ -0,0 +1,228 @@
+import asyncio
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from deliveryAPI.settings import settings
+from deliveryAPI.metrics import NEGATIVE_POSTCODES
+
+
+# the scope of a postcode no service can deliver to, e.g. one that doesn't exist
+ALL_SERVICES = "*"
+
+_MAGIC = b"DNEGPC1\0"
+# scope count, then per scope: name length, name, entry count, keys, expiries
+_COUNT = struct.Struct("<I")
+_NAME_LENGTH = struct.Struct("<H")
+
+
+def _packPostcode(postcode: str) -> int:
+    """
+    A normalized postcode, at most 8 characters, as a 64 bit integer that
+    sorts the same way as the postcode.
+    """
+    return int.from_bytes(postcode.encode("ascii").ljust(8, b"\0"), "big")
+
+
+class _SortedKeys:
+    """
+    Packed postcodes in a sorted array with a parallel array of expiry
+    times, 12 bytes an entry, searched by bisection.
+    """
+
+    def __init__(self, keys: Optional[array] = None, expiries: Optional[array] = None):
+        self.keys = keys if keys is not None else array("Q")
+        self.expiries = expiries if expiries is not None else array("I")
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get(self, key: int) -> Optional[int]:
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.expiries[index]
+        return None
+
+    def set(self, key: int, expiry: int):
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            self.expiries[index] = max(self.expiries[index], expiry)
+        else:
+            self.keys.insert(index, key)
+            self.expiries.insert(index, expiry)
+
+
+def _merge(scopes: List[Dict[str, _SortedKeys]], now: float) -> Dict[str, _SortedKeys]:
+    """
+    The union of the scopes without the expired entries, keeping the later
+    expiry of a postcode in more than one.
+    """
+    merged: Dict[str, _SortedKeys] = {}
+    for scope in {name for scopeKeys in scopes for name in scopeKeys}:
+        expiries: Dict[int, int] = {}
+        for scopeKeys in scopes:
+            sortedKeys = scopeKeys.get(scope)
+            if not sortedKeys:
+                continue
+            for key, expiry in zip(sortedKeys.keys, sortedKeys.expiries):
+                if expiry > now and expiry > expiries.get(key, 0):
+                    expiries[key] = expiry
+        keys = sorted(expiries)[:settings.negative_postcodes_max_entries]
+        merged[scope] = _SortedKeys(
+            array("Q", keys), array("I", (expiries[key] for key in keys))
+        )
+    return merged
+
+
+def _read(path: str) -> Dict[str, _SortedKeys]:
+    try:
+        with open(path, "rb") as filterFile:
+            data = filterFile.read()
+    except FileNotFoundError:
+        return {}
+    if not data.startswith(_MAGIC):
+        # not ours or only partly written, it is replaced on the next save
+        return {}
+
+    scopes = {}
+    offset = len(_MAGIC)
+    scopeCount, = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    for _scope in range(scopeCount):
+        nameLength, = _NAME_LENGTH.unpack_from(data, offset)
+        offset += _NAME_LENGTH.size
+        name = data[offset:offset + nameLength].decode()
+        offset += nameLength
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        sortedKeys = _SortedKeys()
+        sortedKeys.keys.frombytes(data[offset:offset + count * sortedKeys.keys.itemsize])
+        offset += count * sortedKeys.keys.itemsize
+        sortedKeys.expiries.frombytes(data[offset:offset + count * sortedKeys.expiries.itemsize])
+        offset += count * sortedKeys.expiries.itemsize
+        scopes[name] = sortedKeys
+    return scopes
+
+
+def _write(path: str, scopes: Dict[str, _SortedKeys]):
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "wb") as filterFile:
+        filterFile.write(_MAGIC + _COUNT.pack(len(scopes)))
+        for name, sortedKeys in scopes.items():
+            encodedName = name.encode()
+            filterFile.write(_NAME_LENGTH.pack(len(encodedName)) + encodedName)
+            filterFile.write(_COUNT.pack(len(sortedKeys)))
+            filterFile.write(sortedKeys.keys.tobytes())
+            filterFile.write(sortedKeys.expiries.tobytes())
+    os.replace(temporaryPath, path)
+
+
+def _mergeFile(path: str, scopes: Dict[str, _SortedKeys]) -> Dict[str, _SortedKeys]:
+    merged = _merge([_read(path), scopes], time.time())
+    _write(path, merged)
+    return merged
+
+
+class NegativePostcodes:
+    """
+    Postcodes the upstreams have told us can't be delivered to, so they are
+    answered without running the models until the entry expires. A postcode
+    Uber Eats doesn't know is negative for every service, one without a
+    nearby store only for that service. Entries are exact, unlike a Bloom
+    filter's, as a false positive would wrongly turn a customer away.
+
+    Each worker keeps its own copy and periodically merges it with the file,
+    which picks up what the other workers have learnt too. Nothing is
+    recorded until it is opened, e.g. outside the app.
+    """
+
+    _scopes: Dict[str, _SortedKeys] = {}
+    # added since the copy being merged with the file was taken
+    _added: List[Tuple[str, int, int]] = []
+    _open: bool = False
+    _saver: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def open(cls):
+        if settings.negative_postcodes_file:
+            cls._scopes = await asyncio.to_thread(
+                lambda: _merge([_read(settings.negative_postcodes_file)], time.time())
+            )
+            if not cls._saver:
+                cls._saver = asyncio.create_task(cls._savePeriodically())
+        cls._open = True
+
+    @classmethod
+    async def close(cls):
+        if cls._saver:
+            cls._saver.cancel()
+            cls._saver = None
+        if cls._open:
+            await cls.save()
+        cls._open = False
+        cls._scopes = {}
+        cls._added = []
+
+    @classmethod
+    def isNegative(cls, name: str, postcode: str) -> bool:
+        if not cls._scopes:
+            return False
+        key = _packPostcode(postcode)
+        now = time.time()
+        for scope in (ALL_SERVICES, name):
+            sortedKeys = cls._scopes.get(scope)
+            expiry = sortedKeys.get(key) if sortedKeys else None
+            if expiry is not None and expiry > now:
+                NEGATIVE_POSTCODES.inc(name)
+                return True
+        return False
+
+    @classmethod
+    def add(cls, scope: str, postcode: str):
+        """
+        Record that the postcode can't be delivered to by the service, or by
+        any service for ALL_SERVICES.
+        """
+        if not cls._open:
+            return
+        sortedKeys = cls._scopes.setdefault(scope, _SortedKeys())
+        if len(sortedKeys) >= settings.negative_postcodes_max_entries:
+            return
+        key = _packPostcode(postcode)
+        expiry = int(time.time() + settings.negative_postcodes_ttl_seconds)
+        sortedKeys.set(key, expiry)
+        cls._added.append((scope, key, expiry))
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        return {scope: len(sortedKeys) for scope, sortedKeys in cls._scopes.items()}
+
+    @classmethod
+    async def save(cls):
+        """
+        Merge with the file, dropping expired entries, so it and this worker
+        have what every worker has learnt.
+        """
+        if not settings.negative_postcodes_file:
+            return
+        snapshot = {
+            scope: _SortedKeys(array("Q", sortedKeys.keys), array("I", sortedKeys.expiries))
+            for scope, sortedKeys in cls._scopes.items()
+        }
+        cls._added = []
+        merged = await asyncio.to_thread(
+            _mergeFile, settings.negative_postcodes_file, snapshot
+        )
+        # keep what was added while the merge ran
+        for scope, key, expiry in cls._added:
+            merged.setdefault(scope, _SortedKeys()).set(key, expiry)
+        cls._scopes = merged
+
+    @classmethod
+    async def _savePeriodically(cls):
+        while True:
+            await asyncio.sleep(settings.negative_postcodes_save_interval_seconds)
+            await cls.save()
@@ -0,0 +1,320 @@
+import asyncio
+import struct
+import time
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+from deliveryAPI.metrics import RESULT_CACHE, CACHE_STORE_ERRORS
+from deliveryAPI.cache.CacheStore import CacheStore
+
+
+class CacheEntry(NamedTuple):
+    canDeliver: bool
+    fetchedAt: float
+    expiry: float
+    # expired entries are kept until then, to be served stale
+    staleUntil: float
+
+    _FORMAT = struct.Struct("!?ddd")
+
+    def dumps(self) -> bytes:
+        return self._FORMAT.pack(*self)
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CacheEntry":
+        return cls(*cls._FORMAT.unpack(data))
+
+
+def _withTimeout(
+        fetch: Callable[[], Awaitable[bool]], timeout: float
+) -> Callable[[], Awaitable[bool]]:
+    async def fetchWithTimeout() -> bool:
+        return await asyncio.wait_for(fetch(), timeout)
+    return fetchWithTimeout
+
+
+class DeliveryResultCache:
+    """
+    Bounded LRU cache of can_deliver answers keyed by (service, postcode).
+    Concurrent lookups for the same key share a single upstream call.
+    Answers can be kept for maxStale seconds after they expire, so a caller
+    can choose to serve them while they are revalidated or the upstream fails.
+
+    With a shared store, answers are also kept there for the other workers
+    and a miss only goes upstream from the worker holding the store's lock
+    for the key, the others wait for its answer to appear in the store.
+    """
+
+    # how often a worker waiting on another worker's fetch checks the store
+    _POLL_INTERVAL_SECONDS = 0.05
+
+    def __init__(self, maxSize: int, store: Optional[CacheStore] = None, lockTtl: float = 10):
+        self._maxSize = maxSize
+        self._store = store
+        # longer than any upstream fetch, the lock is only released by expiry if its holder dies
+        self._lockTtl = lockTtl
+        self._entries: OrderedDict[Tuple[str, str], CacheEntry] = OrderedDict()
+        self._inFlight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._waiters: Dict[Tuple[str, str], int] = defaultdict(int)
+        self._revalidations: Set[asyncio.Task] = set()
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {
+            "hits": 0, "misses": 0, "coalesced": 0, "refreshes": 0, "stale": 0, "evictions": 0,
+            "shared_hits": 0, "shared_waits": 0
+        })
+
+    async def get(
+            self, service: str, postcode: str, fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float = 0
+    ) -> bool:
+        key = (service, postcode)
+        entry = self._entries.get(key)
+        if entry:
+            now = time.time()
+            if entry.expiry > now:
+                self._entries.move_to_end(key)
+                self._stats[service]["hits"] += 1
+                RESULT_CACHE.inc(service, "hit")
+                return entry.canDeliver
+            if entry.staleUntil <= now:
+                del self._entries[key]
+
+        task = self._inFlight.get(key)
+        if task:
+            self._stats[service]["coalesced"] += 1
+            RESULT_CACHE.inc(service, "coalesced")
+        else:
+            self._stats[service]["misses"] += 1
+            RESULT_CACHE.inc(service, "miss")
+            task = self._startFetch(key, fetch, ttl, negativeTtl, maxStale, refresh=False)
+        return await self._wait(key, task)
+
+    async def refresh(
+            self, service: str, postcode: str, fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float = 0,
+            timeout: Optional[float] = None
+    ) -> bool:
+        """
+        Fetch a new answer even if one is cached, e.g. to replace an entry
+        before it expires. The cached answer is still served until then. A
+        fetch still running after timeout seconds is abandoned.
+        """
+        key = (service, postcode)
+        task = self._inFlight.get(key)
+        if not task:
+            self._stats[service]["refreshes"] += 1
+            RESULT_CACHE.inc(service, "refresh")
+            if timeout is not None:
+                fetch = _withTimeout(fetch, timeout)
+            task = self._startFetch(key, fetch, ttl, negativeTtl, maxStale, refresh=True)
+        return await self._wait(key, task)
+
+    def revalidate(
+            self, service: str, postcode: str, fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float = 0,
+            timeout: Optional[float] = None
+    ):
+        """
+        Refresh an entry in the background, without waiting for the answer.
+        Failures are left for the next caller to find. Nobody waits on it,
+        so it needs a timeout for a hung fetch not to hold up the callers
+        that join it once the entry is too stale to serve.
+        """
+        if (service, postcode) in self._inFlight:
+            return
+        revalidation = asyncio.create_task(
+            self.refresh(service, postcode, fetch, ttl, negativeTtl, maxStale, timeout)
+        )
+        self._revalidations.add(revalidation)
+        revalidation.add_done_callback(self._revalidated)
+
+    def stale(self, service: str, postcode: str) -> Optional[Tuple[bool, float]]:
+        """
+        The expired answer for a key and its age in seconds, if it is still
+        within its maximum staleness.
+        """
+        entry = self._entries.get((service, postcode))
+        now = time.time()
+        if not entry or entry.expiry > now or entry.staleUntil <= now:
+            return None
+        self._stats[service]["stale"] += 1
+        RESULT_CACHE.inc(service, "stale")
+        return entry.canDeliver, now - entry.fetchedAt
+
+    def expiresIn(self, service: str, postcode: str) -> Optional[float]:
+        """
+        Seconds until the cached answer expires, None if nothing is cached.
+        """
+        entry = self._entries.get((service, postcode))
+        if not entry:
+            return None
+        remaining = entry.expiry - time.time()
+        return remaining if remaining > 0 else None
+
+    def _startFetch(
+            self, key: Tuple[str, str], fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float, refresh: bool
+    ) -> asyncio.Task:
+        task = self._inFlight[key] = asyncio.create_task(
+            self._fetch(key, fetch, ttl, negativeTtl, maxStale, refresh)
+        )
+        return task
+
+    async def _wait(self, key: Tuple[str, str], task: asyncio.Task) -> bool:
+        self._waiters[key] += 1
+        try:
+            # shield so a cancelled caller does not cancel the fetch for other waiters
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1:
+                # nobody else is waiting for the answer, stop the upstream work
+                task.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def _revalidated(self, revalidation: asyncio.Task):
+        self._revalidations.discard(revalidation)
+        if not revalidation.cancelled():
+            # retrieve the error so it isn't logged as never retrieved
+            revalidation.exception()
+
+    async def _fetch(
+            self, key: Tuple[str, str], fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float, refresh: bool
+    ) -> bool:
+        try:
+            if self._store is not None and max(ttl, negativeTtl) > 0:
+                entry = await self._fetchShared(key, fetch, ttl, negativeTtl, maxStale, refresh)
+                self._remember(key, entry)
+                return entry.canDeliver
+            canDeliver = await fetch()
+        finally:
+            del self._inFlight[key]
+
+        self.set(key[0], key[1], canDeliver, ttl if canDeliver else negativeTtl, maxStale)
+        return canDeliver
+
+    async def _fetchShared(
+            self, key: Tuple[str, str], fetch: Callable[[], Awaitable[bool]],
+            ttl: float, negativeTtl: float, maxStale: float, refresh: bool
+    ) -> CacheEntry:
+        storeKey = self._storeKey(key)
+        # a refresh only takes an answer fetched after the one it is replacing
+        local = self._entries.get(key)
+        fetchedAfter = local.fetchedAt if refresh and local else 0
+        waitUntil = time.time() + self._lockTtl
+        waiting = False
+        token = None
+        while True:
+            entry = await self._readShared(storeKey)
+            if entry and entry.expiry > time.time() and entry.fetchedAt > fetchedAfter:
+                self._stats[key[0]]["shared_hits"] += 1
+                RESULT_CACHE.inc(key[0], "shared_hit")
+                return entry
+            if time.time() >= waitUntil:
+                # the holder is taking too long, fetch without the lock
+                break
+            token = await self._acquireShared(storeKey)
+            if token is not None:
+                break
+            if not waiting:
+                # another worker is fetching it
+                waiting = True
+                self._stats[key[0]]["shared_waits"] += 1
+                RESULT_CACHE.inc(key[0], "shared_wait")
+            await asyncio.sleep(self._POLL_INTERVAL_SECONDS)
+
+        try:
+            canDeliver = await fetch()
+            entry = self._entry(canDeliver, ttl if canDeliver else negativeTtl, maxStale)
+            await self._writeShared(storeKey, entry)
+            return entry
+        finally:
+            if token:
+                await self._releaseShared(storeKey, token)
+
+    def _storeKey(self, key: Tuple[str, str]) -> str:
+        return f"result:{key[0]}:{key[1]}"
+
+    # a failing store only costs the sharing, the answer is still fetched and cached locally
+
+    async def _readShared(self, storeKey: str) -> Optional[CacheEntry]:
+        try:
+            data = await self._store.get(storeKey)
+            return CacheEntry.loads(data) if data else None
+        except Exception:
+            CACHE_STORE_ERRORS.inc("result")
+            return None
+
+    async def _acquireShared(self, storeKey: str) -> Optional[str]:
+        """
+        The lock's token, None if another worker holds it or an empty token
+        if the store failed, in which case the fetch goes ahead unlocked.
+        """
+        try:
+            return await self._store.acquireLock(f"lock:{storeKey}", self._lockTtl)
+        except Exception:
+            CACHE_STORE_ERRORS.inc("result")
+            return ""
+
+    async def _writeShared(self, storeKey: str, entry: CacheEntry):
+        lifetime = entry.staleUntil - time.time()
+        if lifetime <= 0:
+            return
+        try:
+            await self._store.set(storeKey, entry.dumps(), lifetime)
+        except Exception:
+            CACHE_STORE_ERRORS.inc("result")
+
+    async def _releaseShared(self, storeKey: str, token: str):
+        try:
+            await self._store.releaseLock(f"lock:{storeKey}", token)
+        except Exception:
+            CACHE_STORE_ERRORS.inc("result")
+
+    @staticmethod
+    def _entry(canDeliver: bool, ttl: float, maxStale: float) -> CacheEntry:
+        now = time.time()
+        return CacheEntry(canDeliver, now, now + ttl, now + ttl + maxStale)
+
+    def set(self, service: str, postcode: str, canDeliver: bool, ttl: float, maxStale: float = 0):
+        if ttl <= 0:
+            return
+        self._remember((service, postcode), self._entry(canDeliver, ttl, maxStale))
+
+    def _remember(self, key: Tuple[str, str], entry: CacheEntry):
+        if entry.expiry <= entry.fetchedAt:
+            return
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxSize:
+            (evictedService, _postcode), _entry = self._entries.popitem(last=False)
+            self._stats[evictedService]["evictions"] += 1
+            RESULT_CACHE.inc(evictedService, "eviction")
+
+    async def close(self, drainSeconds: float = 0):
+        """
+        Give background revalidations up to drainSeconds to finish, cancel
+        any still running, then close the store.
+        """
+        if self._revalidations:
+            _done, pending = await asyncio.wait(self._revalidations, timeout=drainSeconds)
+            for revalidation in pending:
+                revalidation.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._store is not None:
+            await self._store.close()
+
+    def clear(self):
+        self._entries.clear()
+        self._stats.clear()
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {service: dict(counters) for service, counters in self._stats.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
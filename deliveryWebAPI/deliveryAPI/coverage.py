@@ -0,0 +1,96 @@
+"""
+Compile the results of bulk jobs into a coverage table for the API to
+answer from, e.g.
+
+    python -m deliveryAPI.coverage Bulk_Jobs/* --output Coverage_Table.bin
+
+Only answers the upstream gave are used, not timeouts, errors or stale
+answers, and a later job's answer replaces an earlier one. Set
+DELIVERY_API_COVERAGE_TABLE_PATH to the output for the API to load it.
+"""
+import argparse
+import json
+import os
+from typing import Dict, Iterator, List, Tuple
+
+from deliveryAPI.settings import settings
+from deliveryAPI.cache.CoverageTable import CoverageTableBuilder
+from deliveryAPI.jobs.BulkJobs import JobState
+from deliveryAPI.models.BackendRegistry import BackendRegistry
+
+
+def _parseArguments(arguments=None):
+    parser = argparse.ArgumentParser(description="Compile bulk job results into a coverage table")
+    parser.add_argument("jobs", nargs="+", help="bulk job directories")
+    parser.add_argument("--output", default=settings.coverage_table_path or "Coverage_Table.bin")
+    parser.add_argument(
+        "--min-sector-postcodes", type=int, default=settings.catchment_min_observations,
+        help="answered postcodes that must agree before a sector is answered as a whole"
+    )
+    parser.add_argument("--no-sectors", action="store_true", help="only answer swept postcodes")
+    return parser.parse_args(arguments)
+
+
+def loadJobs(directories: List[str]) -> List[Tuple[str, JobState]]:
+    """
+    The jobs in the order they were created, so later answers come last.
+    """
+    jobs = [
+        (directory, JobState.parse_file(os.path.join(directory, "state.json")))
+        for directory in directories
+    ]
+    return sorted(jobs, key=lambda job: job[1].created_at)
+
+
+def jobResults(directory: str, state: JobState) -> Iterator[Dict]:
+    """
+    The job's results up to its last checkpoint, so an unfinished job can be
+    compiled too.
+    """
+    with open(os.path.join(directory, "results.ndjson"), "rb") as resultsFile:
+        read = 0
+        for line in resultsFile:
+            read += len(line)
+            if read > state.results_size:
+                return
+            yield json.loads(line)
+
+
+def buildCoverageTable(
+        directories: List[str], serviceNames: Dict[str, str]
+) -> CoverageTableBuilder:
+    """
+    Rows are named after the services, as the models are, rather than the
+    endpoints the jobs were given.
+    """
+    builder = CoverageTableBuilder()
+    for directory, state in loadJobs(directories):
+        for result in jobResults(directory, state):
+            for service, response in result["results"].items():
+                if response["status"] == "ok" and response["can_deliver"] is not None:
+                    builder.add(
+                        serviceNames.get(service, service), result["postcode"],
+                        response["can_deliver"], state.created_at
+                    )
+    return builder
+
+
+def main(arguments=None):
+    arguments = _parseArguments(arguments)
+    serviceNames = {
+        spec.slug: spec.displayName
+        for spec in BackendRegistry.discover(settings.backends_config).backends()
+    }
+    builder = buildCoverageTable(arguments.jobs, serviceNames)
+    postcodes = len(builder)
+    if not arguments.no_sectors:
+        builder.addSectors(arguments.min_sector_postcodes)
+    builder.write(arguments.output)
+    print(
+        f"wrote {arguments.output}, {postcodes} postcodes and "
+        f"{len(builder) - postcodes} sectors"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import json
+from typing import Any, Union
+
+from deliveryAPI.settings import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def enabled() -> bool:
+    """
+    Whether JSON goes through orjson, which has to be installed as well as
+    switched on with the fast_json setting.
+    """
+    return settings.fast_json and orjson is not None
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    if enabled():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: Any) -> str:
+    if enabled():
+        # keys can be str subclasses, such as validated postcodes
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value)
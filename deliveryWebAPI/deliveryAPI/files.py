@@ -0,0 +1,13 @@
+import os
+
+
+def writeAtomically(path: str, data: str):
+    """
+    Replace the file with data through a temporary file per process, so
+    neither a reader nor another worker saving at the same time sees it
+    half written.
+    """
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w") as dataFile:
+        dataFile.write(data)
+    os.replace(temporaryPath, path)
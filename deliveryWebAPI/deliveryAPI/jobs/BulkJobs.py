@@ -0,0 +1,463 @@
+import asyncio
+import csv
+import fcntl
+import io
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import deque
+from enum import Enum
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from pydantic import BaseModel
+
+from deliveryAPI.settings import settings
+from deliveryAPI.files import writeAtomically
+from deliveryAPI.postcodes import normalizePostcode, InvalidPostcodeError
+from deliveryAPI import fastjson
+
+
+_BLOCK_BYTES = 64 * 1024
+# a postcode is a few bytes, anything much longer without a newline isn't a list of them
+_MAX_LINE_BYTES = 4096
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class InvalidInputError(ValueError):
+    pass
+
+
+class JobStatus(str, Enum):
+    UPLOADING = "uploading"
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+FINISHED_STATUSES = {JobStatus.COMPLETED, JobStatus.FAILED}
+
+
+class JobState(BaseModel):
+    id: str
+    status: JobStatus = JobStatus.UPLOADING
+    services: List[str]
+    total: Optional[int] = None  # postcodes, known once the upload has finished
+    rejected: int = 0  # input lines that weren't a valid postcode
+    processed: int = 0  # postcodes with results up to the last checkpoint
+    input_offset: int = 0  # bytes of the input file those postcodes take up
+    results_size: int = 0  # bytes of the results file up to the last checkpoint
+    created_at: float
+    updated_at: float
+    error: Optional[str] = None
+
+
+def _appendDurably(path: str, data: bytes):
+    with open(path, "ab") as appendFile:
+        appendFile.write(data)
+        appendFile.flush()
+        # the checkpoint written after this must never point past what is on disk
+        os.fsync(appendFile.fileno())
+
+
+def _readBlock(path: str, position: int, end: int) -> bytes:
+    with open(path, "rb") as readFile:
+        readFile.seek(position)
+        return readFile.read(min(_BLOCK_BYTES, end - position))
+
+
+def _truncate(path: str, size: int):
+    with open(path, "ab") as truncateFile:
+        truncateFile.truncate(size)
+
+
+class _InputParser:
+    """
+    Picks the postcodes out of the lines of an upload. A CSV upload uses the
+    column headed "postcode" if it has one, otherwise its first column. An
+    NDJSON line is either a string or an object with a "postcode" key.
+    """
+
+    def __init__(self, inputFormat: str):
+        self._inputFormat = inputFormat
+        self._column: Optional[int] = None
+
+    def postcodes(self, lines: List[bytes]) -> Tuple[List[str], int]:
+        """
+        The normalized postcodes, each with its newline, and the number of
+        lines rejected as not being a postcode.
+        """
+        postcodes = []
+        rejected = 0
+        for line in lines:
+            text = line.decode(errors="replace").strip()
+            if not text or self._isHeader(text):
+                continue
+            try:
+                postcodes.append(normalizePostcode(self._postcode(text)) + "\n")
+            except (InvalidPostcodeError, TypeError, AttributeError):
+                rejected += 1
+        return postcodes, rejected
+
+    def _isHeader(self, line: str) -> bool:
+        if self._inputFormat != "csv" or self._column is not None:
+            return False
+        header = [cell.strip().lower() for cell in next(csv.reader([line]))]
+        self._column = header.index("postcode") if "postcode" in header else 0
+        return "postcode" in header
+
+    def _postcode(self, line: str) -> Optional[str]:
+        if self._inputFormat == "ndjson":
+            try:
+                value = json.loads(line)
+            except ValueError:
+                return None
+            return value.get("postcode") if isinstance(value, dict) else value
+
+        row = next(csv.reader([line]))
+        return row[self._column] if self._column < len(row) else None
+
+
+class BulkJob:
+    """
+    A list of postcodes checked against a set of services in the background.
+    Everything is kept in the job's directory, so memory doesn't grow with
+    the list and the job survives a restart: the normalized postcodes, one
+    per line, the results as NDJSON in the same order, and a checkpoint of
+    how far through both the job is. Results are only ever read up to the
+    checkpoint, so results redone after a restart are never read twice.
+    """
+
+    def __init__(self, directory: str, state: JobState):
+        self.directory = directory
+        self.state = state
+        self._lockFile = None
+
+    @property
+    def id(self) -> str:
+        return self.state.id
+
+    @property
+    def inputPath(self) -> str:
+        return os.path.join(self.directory, "input.txt")
+
+    @property
+    def resultsPath(self) -> str:
+        return os.path.join(self.directory, "results.ndjson")
+
+    @property
+    def statePath(self) -> str:
+        return os.path.join(self.directory, "state.json")
+
+    @classmethod
+    async def create(cls, jobsDirectory: str, services: List[str]) -> "BulkJob":
+        jobId = uuid.uuid4().hex
+        now = time.time()
+        job = cls(
+            os.path.join(jobsDirectory, jobId),
+            JobState(id=jobId, services=services, created_at=now, updated_at=now)
+        )
+        await asyncio.to_thread(os.makedirs, job.directory)
+        job.lock()
+        await job.save()
+        return job
+
+    @classmethod
+    async def load(cls, jobsDirectory: str, jobId: str) -> Optional["BulkJob"]:
+        if not _JOB_ID_PATTERN.match(jobId):
+            return None
+        job = cls(os.path.join(jobsDirectory, jobId), None)
+        try:
+            job.state = await asyncio.to_thread(JobState.parse_file, job.statePath)
+        except (OSError, ValueError):
+            return None
+        return job
+
+    def lock(self) -> bool:
+        """
+        Take the job's file lock without waiting, so only one worker process
+        runs it. The lock goes with the process if it dies.
+        """
+        if self._lockFile:
+            return True
+        lockFile = open(os.path.join(self.directory, "lock"), "a")
+        try:
+            fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lockFile.close()
+            return False
+        self._lockFile = lockFile
+        return True
+
+    def unlock(self):
+        if self._lockFile:
+            self._lockFile.close()
+            self._lockFile = None
+
+    async def reload(self):
+        self.state = await asyncio.to_thread(JobState.parse_file, self.statePath)
+
+    async def save(self):
+        self.state.updated_at = time.time()
+        await asyncio.to_thread(writeAtomically, self.statePath, self.state.json())
+
+    async def fail(self, error: str):
+        self.state.status = JobStatus.FAILED
+        self.state.error = error
+        await self.save()
+
+    async def upload(self, chunks: AsyncIterator[bytes], inputFormat: str):
+        """
+        Write the postcodes in an uploaded list to the input file as the
+        chunks arrive, then queue the job.
+        """
+        parser = _InputParser(inputFormat)
+        total = rejected = 0
+        remainder = b""
+        inputFile = await asyncio.to_thread(open, self.inputPath, "wb")
+        try:
+            async for chunk in chunks:
+                *lines, remainder = (remainder + chunk).split(b"\n")
+                if len(remainder) > _MAX_LINE_BYTES:
+                    raise InvalidInputError(f"a line is longer than {_MAX_LINE_BYTES} bytes")
+                postcodes, lineRejected = parser.postcodes(lines)
+                total += len(postcodes)
+                rejected += lineRejected
+                if postcodes:
+                    await asyncio.to_thread(inputFile.write, "".join(postcodes).encode())
+            postcodes, lineRejected = parser.postcodes([remainder])
+            total += len(postcodes)
+            rejected += lineRejected
+            await asyncio.to_thread(inputFile.write, "".join(postcodes).encode())
+        finally:
+            await asyncio.to_thread(inputFile.close)
+
+        self.state.total = total
+        self.state.rejected = rejected
+        self.state.status = JobStatus.QUEUED
+        await self.save()
+
+    async def run(
+            self, checkPostcode: Callable[[str, str], Awaitable[Dict]],
+            concurrency: int, checkpointEvery: int
+    ):
+        """
+        Check the postcodes from the last checkpoint on, with up to
+        concurrency postcodes in flight. Results are written in input order,
+        every checkpointEvery postcodes, so the checkpoint always marks a
+        prefix of the input that is done.
+        """
+        # results past the checkpoint are from a run that stopped, they are redone
+        await asyncio.to_thread(_truncate, self.resultsPath, self.state.results_size)
+        self.state.status = JobStatus.RUNNING
+        await self.save()
+
+        inFlight: deque = deque()
+        results: List[str] = []
+        inputBytes = 0
+
+        async def collectOldest():
+            nonlocal inputBytes
+            postcode, size, tasks = inFlight.popleft()
+            responses = {service: await task for service, task in tasks.items()}
+            results.append(fastjson.dumps({"postcode": postcode, "results": responses}) + "\n")
+            inputBytes += size
+            if len(results) >= checkpointEvery:
+                await checkpoint()
+
+        async def checkpoint():
+            nonlocal inputBytes
+            data = "".join(results).encode()
+            await asyncio.to_thread(_appendDurably, self.resultsPath, data)
+            self.state.results_size += len(data)
+            self.state.processed += len(results)
+            self.state.input_offset += inputBytes
+            await self.save()
+            results.clear()
+            inputBytes = 0
+
+        try:
+            async for line in self._inputLines(self.state.input_offset):
+                postcode = line.decode().strip()
+                inFlight.append((postcode, len(line), {
+                    service: asyncio.create_task(checkPostcode(service, postcode))
+                    for service in self.state.services
+                }))
+                if len(inFlight) >= concurrency:
+                    await collectOldest()
+            while inFlight:
+                await collectOldest()
+            await checkpoint()
+        except Exception as error:
+            await self.fail(str(error) or type(error).__name__)
+            return
+        finally:
+            # also when cancelled on shutdown, the job resumes from the checkpoint
+            for _postcode, _size, tasks in inFlight:
+                for task in tasks.values():
+                    task.cancel()
+
+        self.state.status = JobStatus.COMPLETED
+        await self.save()
+
+    async def _inputLines(self, position: int) -> AsyncIterator[bytes]:
+        end = await asyncio.to_thread(os.path.getsize, self.inputPath)
+        remainder = b""
+        while position < end:
+            block = await asyncio.to_thread(_readBlock, self.inputPath, position, end)
+            position += len(block)
+            *lines, remainder = (remainder + block).split(b"\n")
+            for line in lines:
+                yield line + b"\n"
+
+    async def results(
+            self, outputFormat: str, pollIntervalSeconds: float
+    ) -> AsyncIterator[str]:
+        """
+        The results so far, then each checkpoint's results as it is written
+        until the job finishes. The checkpoint is read from the state file,
+        so this works in any worker, not just the one running the job.
+        """
+        if outputFormat == "csv":
+            yield self._csvRows([["postcode", *self.state.services]])
+
+        position = 0
+        while True:
+            state = await asyncio.to_thread(JobState.parse_file, self.statePath)
+            while position < state.results_size:
+                block = await asyncio.to_thread(
+                    _readBlock, self.resultsPath, position, state.results_size
+                )
+                # checkpoints end on a line, a block might not
+                block = block[:block.rfind(b"\n") + 1]
+                position += len(block)
+                if outputFormat == "csv":
+                    yield self._csvRows(
+                        self._csvRow(json.loads(line), state.services)
+                        for line in block.splitlines()
+                    )
+                else:
+                    yield block.decode()
+            if state.status in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(pollIntervalSeconds)
+
+    @staticmethod
+    def _csvRow(result: Dict, services: List[str]) -> List[str]:
+        row = [result["postcode"]]
+        for service in services:
+            response = result["results"][service]
+            if response["can_deliver"] is None:
+                # no answer, give the reason instead
+                row.append(response["status"])
+            else:
+                row.append("true" if response["can_deliver"] else "false")
+        return row
+
+    @staticmethod
+    def _csvRows(rows) -> str:
+        output = io.StringIO()
+        csv.writer(output, lineterminator="\n").writerows(rows)
+        return output.getvalue()
+
+
+class BulkJobs:
+    """
+    The bulk jobs kept in a directory shared by the worker processes. A job
+    is run by the worker it was uploaded to, up to maxRunning at a time,
+    and any worker picks up unfinished jobs no process holds the lock for,
+    at startup and then periodically, so jobs resume after a restart or the
+    loss of a worker. Finished jobs are deleted after the retention period.
+    """
+
+    def __init__(
+            self, directory: str, checkPostcode: Callable[[str, str], Awaitable[Dict]],
+            maxRunning: int
+    ):
+        self._directory = directory
+        # the response for a service and postcode, it should report failures rather than raise
+        self._checkPostcode = checkPostcode
+        self._running: Dict[str, asyncio.Task] = {}
+        self._limit = asyncio.Semaphore(maxRunning)
+        self._scanTask: Optional[asyncio.Task] = None
+
+    async def open(self):
+        await asyncio.to_thread(os.makedirs, self._directory, exist_ok=True)
+        if not self._scanTask:
+            self._scanTask = asyncio.create_task(self._scanPeriodically())
+
+    async def close(self):
+        """
+        Stop the running jobs where they are, they resume from their last
+        checkpoint once a worker picks them up again.
+        """
+        tasks: Set[asyncio.Task] = set(self._running.values())
+        if self._scanTask:
+            tasks.add(self._scanTask)
+            self._scanTask = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def create(
+            self, chunks: AsyncIterator[bytes], inputFormat: str, services: List[str]
+    ) -> JobState:
+        job = await BulkJob.create(self._directory, services)
+        try:
+            await job.upload(chunks, inputFormat)
+        except BaseException as error:
+            await job.fail(f"the upload failed: {str(error) or type(error).__name__}")
+            job.unlock()
+            raise
+        self._start(job)
+        return job.state
+
+    async def get(self, jobId: str) -> Optional[BulkJob]:
+        return await BulkJob.load(self._directory, jobId)
+
+    def _start(self, job: BulkJob):
+        self._running[job.id] = asyncio.create_task(self._run(job))
+
+    async def _run(self, job: BulkJob):
+        try:
+            async with self._limit:
+                await job.run(
+                    self._checkPostcode,
+                    settings.bulk_job_concurrency, settings.bulk_job_checkpoint_every
+                )
+        finally:
+            job.unlock()
+            del self._running[job.id]
+
+    async def scan(self):
+        """
+        Resume the unfinished jobs that no worker is running, and delete
+        finished jobs past the retention period.
+        """
+        jobIds = await asyncio.to_thread(os.listdir, self._directory)
+        for jobId in jobIds:
+            if jobId in self._running:
+                continue
+            job = await BulkJob.load(self._directory, jobId)
+            if not job or not job.lock():
+                continue
+            # another worker could have moved it on before the lock was taken
+            await job.reload()
+
+            if job.state.status in FINISHED_STATUSES:
+                if job.state.updated_at + settings.bulk_jobs_retention_seconds <= time.time():
+                    await asyncio.to_thread(shutil.rmtree, job.directory, ignore_errors=True)
+                job.unlock()
+            elif job.state.status == JobStatus.UPLOADING:
+                await job.fail("the upload was interrupted")
+                job.unlock()
+            else:
+                self._start(job)
+
+    async def _scanPeriodically(self):
+        while True:
+            await self.scan()
+            await asyncio.sleep(settings.bulk_jobs_scan_interval_seconds)
@@ -0,0 +1,206 @@
+import bisect
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+from deliveryAPI.settings import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _formatLabels(labelNames: Sequence[str], labelValues: Sequence[str]) -> str:
+    if not labelNames:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in zip(labelNames, labelValues)
+    )
+    return f"{{{labels}}}"
+
+
+def workerId() -> str:
+    """
+    The worker serving this request. Metrics are kept per worker process, so
+    they are labelled with it and summed across workers by Prometheus.
+    """
+    return str(os.getpid())
+
+
+class Metric(ABC):
+    """
+    Minimal Prometheus style metric. Label values are passed positionally in
+    the order of labelNames. Recording does nothing while metrics are
+    disabled, so instrumentation on the hot path costs a single attribute check.
+    Labels common to every sample, such as the worker, are added when rendering.
+    """
+
+    TYPE: str
+
+    def __init__(self, name: str, description: str, labelNames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+
+    def render(self, constLabels: Optional[Mapping[str, str]] = None) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.TYPE}"]
+        constLabels = constLabels or {}
+        lines.extend(self._renderSamples(tuple(constLabels), tuple(constLabels.values())))
+        return lines
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    @abstractmethod
+    def _renderSamples(self, constNames: Tuple[str, ...], constValues: Tuple[str, ...]) -> List[str]:
+        pass
+
+
+class Counter(Metric):
+
+    TYPE = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, *labelValues: str, amount: float = 1):
+        if settings.metrics_enabled:
+            self._values[labelValues] += amount
+
+    def value(self, *labelValues: str) -> float:
+        return self._values.get(labelValues, 0)
+
+    def clear(self):
+        self._values.clear()
+
+    def _renderSamples(self, constNames: Tuple[str, ...], constValues: Tuple[str, ...]) -> List[str]:
+        labelNames = constNames + self.labelNames
+        return [
+            f"{self.name}{_formatLabels(labelNames, constValues + labelValues)} {value}"
+            for labelValues, value in self._values.items()
+        ]
+
+
+class Gauge(Counter):
+
+    TYPE = "gauge"
+
+    def dec(self, *labelValues: str, amount: float = 1):
+        self.inc(*labelValues, amount=-amount)
+
+
+class Histogram(Metric):
+
+    TYPE = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # per label set: a count per bucket (plus +Inf), then the sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labelValues: str):
+        if not settings.metrics_enabled:
+            return
+
+        counts, total = self._values.setdefault(
+            labelValues, ([0] * (len(self.buckets) + 1), [0.0])
+        )
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def count(self, *labelValues: str) -> int:
+        if labelValues not in self._values:
+            return 0
+        return sum(self._values[labelValues][0])
+
+    def clear(self):
+        self._values.clear()
+
+    def _renderSamples(self, constNames: Tuple[str, ...], constValues: Tuple[str, ...]) -> List[str]:
+        lines = []
+        labelNames = constNames + self.labelNames
+        bucketLabelNames = labelNames + ("le",)
+        for labelValues, (counts, total) in self._values.items():
+            labelValues = constValues + labelValues
+            cumulative = 0
+            for bucket, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bucket == float("inf") else str(bucket)
+                lines.append(
+                    f"{self.name}_bucket{_formatLabels(bucketLabelNames, labelValues + (le,))} "
+                    f"{cumulative}"
+                )
+            labels = _formatLabels(labelNames, labelValues)
+            lines.append(f"{self.name}_sum{labels} {total[0]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, constLabels: Optional[Mapping[str, str]] = None) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(constLabels))
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+registry = MetricsRegistry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    "delivery_request_seconds", "Time taken to serve API requests", ["method", "route", "status"]
+))
+BACKEND_SECONDS = registry.register(Histogram(
+    "delivery_backend_seconds", "Time taken for a backend to answer can_deliver",
+    ["backend", "outcome"]
+))
+UPSTREAM_STEP_SECONDS = registry.register(Histogram(
+    "delivery_upstream_step_seconds", "Time taken by each upstream HTTP step attempt",
+    ["backend", "step"]
+))
+UPSTREAM_ERRORS = registry.register(Counter(
+    "delivery_upstream_errors_total", "Failed upstream HTTP step attempts by status code or error",
+    ["backend", "step", "status"]
+))
+UPSTREAM_IN_FLIGHT = registry.register(Gauge(
+    "delivery_upstream_in_flight", "Upstream can_deliver checks currently running", ["backend"]
+))
+RESULT_CACHE = registry.register(Counter(
+    "delivery_result_cache_total", "can_deliver result cache lookups", ["service", "result"]
+))
+LOCATION_CACHE = registry.register(Counter(
+    "delivery_ue_location_cache_total", "Uber Eats location cache lookups and expirations",
+    ["result"]
+))
+CACHE_STORE_ERRORS = registry.register(Counter(
+    "delivery_cache_store_errors_total", "Failed shared cache store operations", ["cache"]
+))
+CATCHMENT_INDEX = registry.register(Counter(
+    "delivery_catchment_index_total", "Catchment index lookups answered locally or sent upstream",
+    ["backend", "result"]
+))
+COVERAGE_TABLE = registry.register(Counter(
+    "delivery_coverage_table_total", "Coverage table lookups answered, missed or too old",
+    ["service", "result"]
+))
+NEGATIVE_POSTCODES = registry.register(Counter(
+    "delivery_negative_postcodes_total", "Checks answered by the negative postcode filter",
+    ["service"]
+))
@@ -0,0 +1,113 @@
+import importlib
+import json
+from enum import Enum
+from importlib.metadata import entry_points
+from typing import Dict, Iterable, List, Optional, Union
+
+
+class Capability(str, Enum):
+    AGGREGATE = "aggregate"  # checked by /delivery/food and its stream
+    DIRECT = "direct"  # served by /delivery/food/{slug} and the batch endpoint
+
+
+DEFAULT_CAPABILITIES = (Capability.AGGREGATE, Capability.DIRECT)
+
+
+class BackendSpec:
+    """
+    Everything the API needs to know about a backend without importing it.
+    The model is given as "package.module:ClassName" and only imported the
+    first time it is used. The display name must match the model's name.
+    """
+
+    def __init__(
+            self, slug: str, displayName: str, modelPath: str,
+            capabilities: Iterable[Union[Capability, str]] = DEFAULT_CAPABILITIES
+    ):
+        self.slug = slug
+        self.displayName = displayName
+        self.modelPath = modelPath
+        self.capabilities = frozenset(Capability(capability) for capability in capabilities)
+        self._model = None
+
+    @classmethod
+    def fromDict(cls, backend: Dict) -> "BackendSpec":
+        return cls(
+            backend["slug"], backend["name"], backend["model"],
+            backend.get("capabilities", DEFAULT_CAPABILITIES)
+        )
+
+    def load(self) -> type:
+        if self._model is None:
+            moduleName, _, className = self.modelPath.partition(":")
+            self._model = getattr(importlib.import_module(moduleName), className)
+        return self._model
+
+    def hasCapability(self, capability: Capability) -> bool:
+        return capability in self.capabilities
+
+
+BUILTIN_BACKENDS = [
+    BackendSpec("pizzahut", "Pizza Hut", "deliveryAPI.models.FoodModels:PizzaHut"),
+    BackendSpec("dominos", "Dominos", "deliveryAPI.models.FoodModels:Dominos"),
+    BackendSpec("mcdonalds", "Uber Eats McDonalds", "deliveryAPI.models.FoodModels:McDonalds"),
+    BackendSpec("kfc", "Uber Eats KFC", "deliveryAPI.models.FoodModels:KFC"),
+    BackendSpec("burgerking", "Uber Eats Burger King", "deliveryAPI.models.FoodModels:BurgerKing"),
+]
+
+
+class BackendRegistry:
+    """
+    Delivery service backends keyed by slug, in registration order. A later
+    registration with the same slug replaces the earlier one, so a config file
+    or plugin can override a built in backend.
+    """
+
+    ENTRY_POINT_GROUP = "deliveryAPI.backends"
+
+    def __init__(self, specs: Iterable[BackendSpec] = ()):
+        self._specs: Dict[str, BackendSpec] = {}
+        for spec in specs:
+            self.register(spec)
+
+    @classmethod
+    def discover(cls, configPath: Optional[str] = None) -> "BackendRegistry":
+        """
+        The built in backends, then those in the config file, then those
+        published by installed packages under the entry point group. Entry
+        points must refer to a BackendSpec, or a list of them, rather than the
+        model itself so the model is still imported lazily.
+        """
+        registry = cls(BUILTIN_BACKENDS)
+        if configPath:
+            registry.loadConfig(configPath)
+        for entryPoint in entry_points(group=cls.ENTRY_POINT_GROUP):
+            specs = entryPoint.load()
+            for spec in specs if isinstance(specs, list) else [specs]:
+                registry.register(spec)
+        return registry
+
+    def loadConfig(self, configPath: str):
+        """
+        Read a JSON list of backends, each with a slug, name, model and
+        optionally capabilities. A backend with "enabled": false is removed.
+        """
+        with open(configPath) as configFile:
+            backends = json.load(configFile)
+        for backend in backends:
+            if backend.get("enabled", True):
+                self.register(BackendSpec.fromDict(backend))
+            else:
+                self._specs.pop(backend["slug"], None)
+
+    def register(self, spec: BackendSpec):
+        self._specs[spec.slug] = spec
+
+    def get(self, slug: str) -> BackendSpec:
+        return self._specs[slug]
+
+    def backends(self, capability: Optional[Capability] = None) -> List[BackendSpec]:
+        return [
+            spec for spec in self._specs.values()
+            if capability is None or spec.hasCapability(capability)
+        ]
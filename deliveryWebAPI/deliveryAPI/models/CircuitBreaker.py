@@ -0,0 +1,79 @@
+import time
+from enum import Enum
+from typing import Dict
+
+from deliveryAPI.settings import settings
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Per backend circuit breaker. Consecutive failures, or calls slower than the
+    latency threshold, open the circuit and calls fail fast until it has been
+    open for long enough. After that a limited number of probe calls are let
+    through, closing the circuit again if they succeed.
+    """
+
+    _breakers: Dict[str, "CircuitBreaker"] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CircuitState.CLOSED
+        self._failures = 0
+        self._openedAt = 0.0
+        self._probesInFlight = 0
+
+    @classmethod
+    def forBackend(cls, name: str) -> "CircuitBreaker":
+        breaker = cls._breakers.get(name)
+        if not breaker:
+            breaker = cls._breakers[name] = cls(name)
+        return breaker
+
+    def beforeCall(self):
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self._openedAt < settings.circuit_open_seconds:
+                raise CircuitOpenError(f"{self.name} is unavailable, circuit open")
+            self.state = CircuitState.HALF_OPEN
+            self._probesInFlight = 0
+
+        if self.state is CircuitState.HALF_OPEN:
+            if self._probesInFlight >= settings.circuit_half_open_probes:
+                raise CircuitOpenError(f"{self.name} is unavailable, circuit half open")
+            self._probesInFlight += 1
+
+    def afterCall(self, latency: float, failed: bool):
+        if self.state is CircuitState.HALF_OPEN:
+            self._probesInFlight -= 1
+
+        if failed or latency > settings.circuit_latency_threshold_seconds:
+            self._recordFailure()
+        else:
+            self._failures = 0
+            self.state = CircuitState.CLOSED
+
+    def cancelCall(self):
+        """
+        A call cancelled by the caller says nothing about the backend, so it
+        only gives back its probe slot.
+        """
+        if self.state is CircuitState.HALF_OPEN:
+            self._probesInFlight -= 1
+
+    def _recordFailure(self):
+        self._failures += 1
+        if (
+            self.state is CircuitState.HALF_OPEN or
+            self._failures >= settings.circuit_failure_threshold
+        ):
+            self.state = CircuitState.OPEN
+            self._openedAt = time.monotonic()
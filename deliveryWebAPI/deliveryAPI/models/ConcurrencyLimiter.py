@@ -0,0 +1,62 @@
+import asyncio
+from collections import deque
+from typing import Deque, Dict
+
+from deliveryAPI.settings import settings
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent upstream calls to a backend. The limit grows by
+    roughly one per limit's worth of fast successful calls, and is cut by the
+    backoff ratio whenever a call fails or is slower than the latency threshold.
+    """
+
+    _limiters: Dict[str, "AdaptiveConcurrencyLimiter"] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = float(settings.concurrency_initial_limit)
+        self.inFlight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @classmethod
+    def forBackend(cls, name: str) -> "AdaptiveConcurrencyLimiter":
+        limiter = cls._limiters.get(name)
+        if not limiter:
+            limiter = cls._limiters[name] = cls(name)
+        return limiter
+
+    async def acquire(self):
+        while self.inFlight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                else:
+                    # woken but cancelled before taking the slot, pass it on
+                    self._wakeWaiters()
+                raise
+        self.inFlight += 1
+
+    def release(self, latency: float, failed: bool):
+        self.inFlight -= 1
+        if failed or latency > settings.concurrency_latency_threshold_seconds:
+            self.limit = max(
+                settings.concurrency_min_limit,
+                self.limit * settings.concurrency_backoff_ratio
+            )
+        else:
+            self.limit = min(settings.concurrency_max_limit, self.limit + 1 / self.limit)
+        self._wakeWaiters()
+
+    def _wakeWaiters(self):
+        freeSlots = int(self.limit) - self.inFlight
+        while freeSlots > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                freeSlots -= 1
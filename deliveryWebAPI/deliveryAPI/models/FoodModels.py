@@ -1,19 +1,36 @@
-from typing import Dict, List, Type
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+import asyncio
 import json
+import time
 
-from aiohttp import ClientSession, CookieJar
+from aiohttp import ClientResponse, ClientSession, CookieJar
 from aiohttp.client_exceptions import ClientResponseError
 
-from deliveryAPI.models import USER_AGENT
+from deliveryAPI.models import USER_AGENT, upstreamUrl
+from deliveryAPI.settings import settings
+from deliveryAPI import fastjson
 from deliveryAPI.cache.LocationCache import UELocationCache
+from deliveryAPI.cache.CatchmentIndex import CatchmentIndex
+from deliveryAPI.cache.NegativePostcodes import ALL_SERVICES, NegativePostcodes
+from deliveryAPI.models.SessionPool import SessionPool
+from deliveryAPI.models.CircuitBreaker import CircuitBreaker
+from deliveryAPI.models.ConcurrencyLimiter import AdaptiveConcurrencyLimiter
+from deliveryAPI.models.RetryPolicy import RetryPolicy
+from deliveryAPI.models.JsonStream import JsonArrayStream
+from deliveryAPI.metrics import BACKEND_SECONDS, UPSTREAM_IN_FLIGHT
+
+
+T = TypeVar("T")
 
 
 class BaseFoodModel(ABC):
 
     def __init__(self, postcode: str):
         self._postcode = postcode
-        self._session = self._createSession()
+        # only created once an upstream request is needed, so instances are cheap
+        self._session: Optional[ClientSession] = None
 
     @property
     @abstractmethod
@@ -25,34 +42,101 @@ class BaseFoodModel(ABC):
         pass
 
     async def canDeliver(self) -> bool:
+        return await self.canDeliverUpstream()
+
+    async def canDeliverUpstream(self) -> bool:
+        """
+        Ask the upstream, even where a model could answer from a local index,
+        e.g. for a sweep whose answers are compiled into the coverage table.
+        """
+        circuitBreaker = CircuitBreaker.forBackend(self.name)
+        concurrencyLimiter = AdaptiveConcurrencyLimiter.forBackend(self.name)
+        circuitBreaker.beforeCall()
+        latency, failed, cancelled = 0.0, False, False
+        try:
+            await concurrencyLimiter.acquire()
+            UPSTREAM_IN_FLIGHT.inc(self.name)
+            startTime = time.monotonic()
+            outcome = "cancelled"
+            try:
+                canDeliver = await self._canDeliverWithSession()
+                outcome = "ok"
+                return canDeliver
+            except Exception:
+                failed = True
+                outcome = "error"
+                raise
+            finally:
+                latency = time.monotonic() - startTime
+                concurrencyLimiter.release(latency, failed)
+                UPSTREAM_IN_FLIGHT.dec(self.name)
+                BACKEND_SECONDS.observe(latency, self.name, outcome)
+        except asyncio.CancelledError:
+            # e.g. mode=any has its answer, or the client went away
+            cancelled = True
+            raise
+        finally:
+            if cancelled:
+                circuitBreaker.cancelCall()
+            else:
+                circuitBreaker.afterCall(latency, failed)
+
+    async def _canDeliverWithSession(self) -> bool:
+        self._session = self._createSession()
         try:
             return await self._canDeliver()
         finally:
-            await self._session.close()
+            await self._closeSession()
 
     @abstractmethod
     def _createSession(self) -> ClientSession:
         pass
 
+    async def _closeSession(self):
+        await self._session.close()
+
+    async def _callStep(self, stepName: str, step: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        return await RetryPolicy.forBackend(self.name).call(stepName, step, hedge=hedge)
+
 
 class IndependentDeliveryModel(BaseFoodModel, ABC):
 
+    _HOST: str
+
     def __init__(self, postcode):
         super().__init__(postcode)
+        # the store the upstream matched the postcode to, if any
+        self._storeId: Optional[str] = None
+
+    async def canDeliver(self) -> bool:
+        if self.name not in settings.catchment_index_services:
+            return await self.canDeliverUpstream()
+
+        catchmentIndex = CatchmentIndex.forBackend(self.name)
+        canDeliver = catchmentIndex.lookup(self._postcode)
+        if canDeliver is None:
+            canDeliver = await self.canDeliverUpstream()
+            catchmentIndex.record(self._postcode, canDeliver, self._storeId)
+        return canDeliver
 
     def _createSession(self) -> ClientSession:
-        return ClientSession()
+        connector = SessionPool.getConnector(self._HOST)
+        return ClientSession(connector=connector, connector_owner=connector is None)
 
 
 class PizzaHut(IndependentDeliveryModel):
 
+    _HOST = "api.pizzahut.io"
+
     @property
     def name(self):
         return "Pizza Hut"
 
     async def _canDeliver(self):
-        locations = await self._getLocations()
+        locations = await self._callStep("getLocations", self._getLocations, hedge=True)
         canDeliver = bool(locations)
+        if canDeliver:
+            self._storeId = locations[0].get("id")
         return canDeliver
 
     async def _getLocations(self) -> Dict:
@@ -60,23 +144,25 @@ class PizzaHut(IndependentDeliveryModel):
             "postcode": self._postcode
         }
         response = await self._session.get(
-            "https://api.pizzahut.io/v1/huts",
+            upstreamUrl(self._HOST, "/v1/huts"),
             headers={"Content-Type": "application/json", "User-Agent": USER_AGENT},
             params=requestParams
         )
         response.raise_for_status()
-        locations = await response.json()
+        locations = await response.json(loads=fastjson.loads)
         return locations
 
 
 class Dominos(IndependentDeliveryModel):
 
+    _HOST = "www.dominos.co.uk"
+
     @property
     def name(self):
         return "Dominos"
 
     async def _canDeliver(self):
-        locations = await self._getLocations()
+        locations = await self._callStep("getLocations", self._getLocations, hedge=True)
         canDeliver = self._parseLocations(locations)
         return canDeliver
 
@@ -87,7 +173,7 @@ class Dominos(IndependentDeliveryModel):
             "limit": "10"
         }
         response = await self._session.get(
-            "https://www.dominos.co.uk/api/stores/v1/stores",
+            upstreamUrl(self._HOST, "/api/stores/v1/stores"),
             headers={"Content-Type": "application/json", "User-Agent": USER_AGENT},
             params=requestParams
         )
@@ -96,26 +182,32 @@ class Dominos(IndependentDeliveryModel):
         except ClientResponseError as httpError:
             if httpError.status == 404:
                 # no locations exist
+                NegativePostcodes.add(self.name, self._postcode)
                 return {}
             raise
-        return await response.json()
+        return await response.json(loads=fastjson.loads)
 
     def _parseLocations(self, locations: Dict) -> bool:
         try:
             localStore = locations["data"]["localStore"]
-            return localStore["catchmentServiceability"]["reason"] == "None"
+            canDeliver = localStore["catchmentServiceability"]["reason"] == "None"
         except KeyError:
             return False
+        self._storeId = localStore.get("id")
+        return canDeliver
 
 
 class UberEatsSession(ClientSession):
 
     X_CSRF_TOKEN: str = "x"  # Seems to always be "x" for now, luckily
 
-    def __init__(self, postcode):
+    def __init__(self, postcode, connector=None):
         # don't quote the cookie, otherwise it doesn't work
+        # each session has its own cookie jar, even when the connector is shared
         cookieJar = CookieJar(quote_cookie=False)
-        super().__init__(cookie_jar=cookieJar)
+        super().__init__(
+            cookie_jar=cookieJar, connector=connector, connector_owner=connector is None
+        )
         self.postcode = postcode
 
     def setCookie(self, key, value):
@@ -129,49 +221,202 @@ class UberEatsSession(ClientSession):
         return await super().post(*args, headers=headers, **kwargs)
 
 
-class UberEats(BaseFoodModel, ABC):
-
-    def __init__(self, postcode):
-        super().__init__(postcode)
-        self._addressInformation = None
-        self._locationInformation = None
-
-    @property
-    @abstractmethod
-    def searchParameter(self) -> str:
-        pass
-
-    @property
-    def name(self):
-        return "Uber Eats"
+def uberEatsLocationKey(location) -> str:
+    """
+    The canonical form of a resolved Uber Eats location, the same for every
+    postcode that resolves to it.
+    """
+    return json.dumps(location, sort_keys=True, separators=(",", ":"))
+
+
+class PinnedUberEatsSession:
+    """
+    An UberEatsSession with its location set, kept warm between requests by
+    UberEatsSessionPool. A failed search marks it unhealthy, so the location
+    is set again before the next search on it.
+    """
+
+    def __init__(self, locationKey: str, session: UberEatsSession):
+        self.locationKey = locationKey
+        self.session = session
+        self.users = 0
+        self.lastUsed = time.monotonic()
+        self._pinned = False
+        self._pinLock = asyncio.Lock()
+        self._retryPolicy = RetryPolicy.forBackend("Uber Eats")
+
+    async def pin(self, location):
+        async with self._pinLock:
+            if self._pinned:
+                return
+            self.session.setCookie("uev2.loc", json.dumps(location))
+            await self._retryPolicy.call("setTargetLocation", self._setTargetLocation)
+            self._pinned = True
+
+    def markFailed(self):
+        self._pinned = False
+
+    async def _setTargetLocation(self):
+        # ensure location cookie has been set correctly
+        response = await self.session.post(
+            upstreamUrl(UberEats._HOST, "/_p/api/setTargetLocationV1?localeCode=gb"),
+            headers={"User-Agent": USER_AGENT}
+        )
+        jsonResponse = await response.json(loads=fastjson.loads)
+        if jsonResponse["status"] != "success":
+            raise Exception(
+                "Something went wrong setting the location cookie for UE"
+            )
 
-    def _createSession(self) -> UberEatsSession:
-        return UberEatsSession(self._postcode)
 
-    async def _canDeliver(self):
-        if await self._setAddressInformation() is False:
-            return False
+class UberEatsSessionPool:
+    """
+    Location pinned Uber Eats sessions keyed by location, so a request for a
+    location that has been seen recently goes straight to the search. Idle
+    sessions are closed once they have been unused for the idle timeout, or
+    least recently used first when the pool is over its maximum size. Both
+    are checked as sessions are released, and idle sessions periodically
+    while the pool is open. A session in use is never closed.
+    """
+
+    _sessions: OrderedDict[str, PinnedUberEatsSession] = OrderedDict()
+    _sweeper: Optional[asyncio.Task] = None
+
+    @classmethod
+    def open(cls):
+        if not cls._sweeper:
+            cls._sweeper = asyncio.create_task(cls._evictPeriodically())
+
+    @classmethod
+    def acquire(
+            cls, locationKey: str, postcode: str, session: Optional[UberEatsSession] = None
+    ) -> PinnedUberEatsSession:
+        """
+        The pooled session for the location, using the given session, if any,
+        when there isn't one yet.
+        """
+        pinnedSession = cls._sessions.get(locationKey)
+        if pinnedSession is None:
+            pinnedSession = cls._sessions[locationKey] = PinnedUberEatsSession(
+                locationKey,
+                session or UberEatsSession(
+                    postcode, connector=SessionPool.getConnector(UberEats._HOST)
+                )
+            )
+        cls._sessions.move_to_end(locationKey)
+        pinnedSession.users += 1
+        return pinnedSession
+
+    @classmethod
+    async def release(cls, pinnedSession: PinnedUberEatsSession):
+        pinnedSession.users -= 1
+        pinnedSession.lastUsed = time.monotonic()
+        await cls._evict()
+
+    @classmethod
+    async def close(cls):
+        if cls._sweeper:
+            cls._sweeper.cancel()
+            cls._sweeper = None
+        sessions, cls._sessions = cls._sessions, OrderedDict()
+        for pinnedSession in sessions.values():
+            await pinnedSession.session.close()
+
+    @classmethod
+    def stats(cls) -> Dict[str, int]:
+        return {
+            "sessions": len(cls._sessions),
+            "in_use": sum(1 for pinnedSession in cls._sessions.values() if pinnedSession.users)
+        }
 
-        locations = await self._findLocations()
-        canDeliver = self._parseResponse(locations)
-        return canDeliver
+    @classmethod
+    async def _evict(cls):
+        idleSince = time.monotonic() - settings.ue_session_pool_idle_seconds
+        excess = len(cls._sessions) - settings.ue_session_pool_max_size
+        # least recently acquired first
+        for locationKey, pinnedSession in list(cls._sessions.items()):
+            if excess <= 0 and pinnedSession.lastUsed > idleSince:
+                break
+            # skip a session acquired, or replaced, while an earlier one was closing
+            if pinnedSession.users or cls._sessions.get(locationKey) is not pinnedSession:
+                continue
+            del cls._sessions[locationKey]
+            excess -= 1
+            await pinnedSession.session.close()
+
+    @classmethod
+    async def _evictPeriodically(cls):
+        while True:
+            await asyncio.sleep(settings.ue_session_pool_sweep_interval_seconds)
+            await cls._evict()
+
+
+class UberEatsLocationContext:
+    """
+    Resolves a postcode to a location pinned UberEatsSession once, and shares
+    it between every UberEats brand checking that postcode at the same time.
+    The session comes from UberEatsSessionPool, so it outlives the context.
+    Contexts are reference counted and released by the last user.
+    """
+
+    _contexts: Dict[str, "UberEatsLocationContext"] = {}
 
-    async def _findLocations(self) -> Dict:
-        requestData = {
-            "userQuery": self.searchParameter,
-            "date": "",
-            "startTime": 0,
-            "endTime": 0,
-            "vertical": "ALL",
-        }
-        response = await self._session.post(
-            "https://www.ubereats.com/api/getSearchSuggestionsV1?localeCode=gb",
-            headers={"User-Agent": USER_AGENT},
-            data=requestData
-        )
-        response.raise_for_status()
+    def __init__(self, postcode: str):
+        self._postcode = postcode
+        self._users = 0
+        self._resolveTask: Optional[asyncio.Task] = None
+        self._addressInformation = None
+        self._locationInformation = None
+        self._retryPolicy = RetryPolicy.forBackend("Uber Eats")
+        # only created to look up a location that isn't cached, then handed to the pool
+        self._lookupSession: Optional[UberEatsSession] = None
+        self._pinnedSession: Optional[PinnedUberEatsSession] = None
 
-        return await response.json()
+    @property
+    def session(self) -> Optional[UberEatsSession]:
+        return self._pinnedSession.session if self._pinnedSession else None
+
+    @classmethod
+    def acquire(cls, postcode: str) -> "UberEatsLocationContext":
+        context = cls._contexts.get(postcode)
+        if not context:
+            context = cls._contexts[postcode] = cls(postcode)
+        context._users += 1
+        return context
+
+    async def release(self):
+        self._users -= 1
+        if self._users:
+            return
+
+        if self._contexts.get(self._postcode) is self:
+            del self._contexts[self._postcode]
+        if self._resolveTask and not self._resolveTask.done():
+            self._resolveTask.cancel()
+        if self._pinnedSession:
+            await UberEatsSessionPool.release(self._pinnedSession)
+        if self._lookupSession:
+            await self._lookupSession.close()
+
+    async def resolve(self) -> bool:
+        """
+        Pin a session to the location, returning False when Uber Eats does not
+        know the postcode.
+        """
+        if not self._resolveTask:
+            self._resolveTask = asyncio.create_task(self._setAddressInformation())
+        # shield so one cancelled brand does not cancel the others' resolution
+        return await asyncio.shield(self._resolveTask) is not False
+
+    async def pin(self):
+        """
+        Set the location again if a search on the session has failed since
+        it was last set.
+        """
+        await self._pinnedSession.pin(self._locationInformation)
+
+    def markFailed(self):
+        self._pinnedSession.markFailed()
 
     async def _setAddressInformation(self):
         await self._getAddressInformation()
@@ -179,24 +424,25 @@ class UberEats(BaseFoodModel, ABC):
             return False
 
         if not self._locationInformation:
-            await self._setLocationInformation()
-
-        self._session.setCookie("uev2.loc", json.dumps(self._locationInformation))
+            await self._retryPolicy.call("getDeliveryLocation", self._setLocationInformation)
 
-        # ensure location cookie has been set correctly
-        response = await self._session.post(
-            "https://www.ubereats.com/_p/api/setTargetLocationV1?localeCode=gb",
-            headers={"User-Agent": USER_AGENT}
+        self._pinnedSession = UberEatsSessionPool.acquire(
+            uberEatsLocationKey(self._locationInformation), self._postcode, self._lookupSession
         )
-        jsonResponse = await response.json()
-        if jsonResponse["status"] != "success":
-            raise Exception(
-                "Something went wrong setting the location cookie for UE"
+        if self._pinnedSession.session is self._lookupSession:
+            self._lookupSession = None
+        await self.pin()
+
+    def _getLookupSession(self) -> UberEatsSession:
+        if not self._lookupSession:
+            self._lookupSession = UberEatsSession(
+                self._postcode, connector=SessionPool.getConnector(UberEats._HOST)
             )
+        return self._lookupSession
 
     async def _setLocationInformation(self):
-        response = await self._session.post(
-            "https://www.ubereats.com/_p/api/getDeliveryLocationV1?localeCode=gb",
+        response = await self._getLookupSession().post(
+            upstreamUrl(UberEats._HOST, "/_p/api/getDeliveryLocationV1?localeCode=gb"),
             headers={"User-Agent": USER_AGENT},
             json={
                 "placeId": self._addressInformation["id"],
@@ -204,43 +450,141 @@ class UberEats(BaseFoodModel, ABC):
                 "source": "manual_auto_complete"
             }
         )
-        jsonResponse = await response.json()
+        jsonResponse = await response.json(loads=fastjson.loads)
         self._locationInformation = jsonResponse["data"]
         UELocationCache.setCacheLocation(self._postcode, self._locationInformation)
 
     async def _getAddressInformation(self):
-        cachedLocation = UELocationCache.getCacheLocation(self._postcode)
+        cachedLocation = await UELocationCache.getCacheLocation(self._postcode)
         if cachedLocation:
             self._addressInformation = True
             self._locationInformation = cachedLocation
         else:
-            await self._getAddressInformationFromUE()
+            await self._retryPolicy.call("getLocationAutocomplete", self._getAddressInformationFromUE)
 
     async def _getAddressInformationFromUE(self):
         requestParams = {
             "query": self._postcode,
         }
-        response = await self._session.post(
-            "https://www.ubereats.com/api/getLocationAutocompleteV1?localeCode=gb",
+        response = await self._getLookupSession().post(
+            upstreamUrl(UberEats._HOST, "/api/getLocationAutocompleteV1?localeCode=gb"),
             headers={"User-Agent": USER_AGENT},
             data=requestParams
         )
         response.raise_for_status()
-        jsonResponse = await response.json()
+        jsonResponse = await response.json(loads=fastjson.loads)
 
         if jsonResponse["data"]:
             self._addressInformation = jsonResponse["data"][0]
+        else:
+            # Uber Eats doesn't know the postcode, so nobody delivers to it
+            NegativePostcodes.add(ALL_SERVICES, self._postcode)
+
+
+class UberEats(BaseFoodModel, ABC):
+
+    _HOST = "www.ubereats.com"
+
+    def __init__(self, postcode):
+        super().__init__(postcode)
+        self._locationContext: Optional[UberEatsLocationContext] = None
+
+    @property
+    @abstractmethod
+    def searchParameter(self) -> str:
+        pass
+
+    @property
+    def name(self):
+        return "Uber Eats"
+
+    def _createSession(self) -> Optional[UberEatsSession]:
+        self._locationContext = UberEatsLocationContext.acquire(self._postcode)
+        # the pinned session is only known once the location is resolved
+        return self._locationContext.session
+
+    async def _closeSession(self):
+        await self._locationContext.release()
+
+    async def _canDeliver(self):
+        if not await self._locationContext.resolve():
+            return False
+        self._session = self._locationContext.session
+
+        if settings.ue_search_streaming:
+            return await self._callStep(
+                "getSearchSuggestions", lambda: self._searchPinned(self._searchForStore)
+            )
+
+        locations = await self._callStep(
+            "getSearchSuggestions", lambda: self._searchPinned(self._findLocations)
+        )
+        canDeliver = self._parseResponse(locations)
+        return canDeliver
+
+    async def _searchPinned(self, search: Callable[[], Awaitable[T]]) -> T:
+        """
+        Search on the pinned session, setting its location again first if an
+        earlier search on it failed, e.g. when this is a retry.
+        """
+        await self._locationContext.pin()
+        try:
+            return await search()
+        except Exception:
+            self._locationContext.markFailed()
+            raise
+
+    async def _postSearch(self) -> ClientResponse:
+        requestData = {
+            "userQuery": self.searchParameter,
+            "date": "",
+            "startTime": 0,
+            "endTime": 0,
+            "vertical": "ALL",
+        }
+        response = await self._session.post(
+            upstreamUrl(self._HOST, "/api/getSearchSuggestionsV1?localeCode=gb"),
+            headers={"User-Agent": USER_AGENT},
+            data=requestData
+        )
+        response.raise_for_status()
+        return response
+
+    async def _findLocations(self) -> Dict:
+        response = await self._postSearch()
+        return await response.json(loads=fastjson.loads)
+
+    async def _searchForStore(self) -> bool:
+        """
+        Parse the search suggestions as they arrive, stopping at the first
+        matching store rather than downloading the whole response.
+        """
+        response = await self._postSearch()
+        suggestions = JsonArrayStream(
+            response.content.iter_any(), "data", settings.ue_search_max_bytes
+        )
+        try:
+            async for responseItem in suggestions:
+                if self._isSearchedStore(responseItem):
+                    return True
+            return False
+        finally:
+            # drops the connection if the body wasn't read to the end
+            response.close()
 
     def _parseResponse(self, response) -> bool:
         responseData = response["data"]
         for responseItem in responseData:
-            if (
-                responseItem["type"] == "store" and
-                self.searchParameter.lower() in responseItem["store"]["title"].lower()
-            ):
+            if self._isSearchedStore(responseItem):
                 return True
         return False
 
+    def _isSearchedStore(self, responseItem: Dict) -> bool:
+        return (
+            responseItem["type"] == "store" and
+            self.searchParameter.lower() in responseItem["store"]["title"].lower()
+        )
+
 
 class McDonalds(UberEats):
 
@@ -274,11 +618,3 @@ class BurgerKing(UberEats):
     def searchParameter(self):
         return "burger king"
 
-
-foodItems: List[Type[BaseFoodModel]] = [
-    PizzaHut,
-    Dominos,
-    McDonalds,
-    KFC,
-    BurgerKing
-]
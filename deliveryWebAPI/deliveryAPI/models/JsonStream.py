@@ -0,0 +1,136 @@
+import codecs
+import json
+import re
+from typing import Any, AsyncIterator
+
+
+class ResponseTooLargeError(Exception):
+    pass
+
+
+class JsonArrayStream:
+    """
+    Reads the array under one key of a JSON object as it is streamed,
+    yielding each item as soon as it has arrived in full, so a caller can
+    stop reading once it has found what it is looking for. The values of
+    the other keys are parsed and thrown away. Items are decoded with the
+    standard library's decoder, which fails on an incomplete item, and the
+    item is tried again once what has arrived of it has doubled, so a large
+    value costs linear rather than quadratic time.
+    """
+
+    _WHITESPACE = " \t\n\r"
+    # what could still be part of a number cut off at the end of the buffer, e.g. "12." or "1e"
+    _NUMBER_TAIL = re.compile(r"[0-9+\-.eE]*\Z")
+
+    def __init__(self, chunks: AsyncIterator[bytes], key: str, maxBytes: int):
+        self._chunks = chunks
+        self._key = key
+        self._maxBytes = maxBytes
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._bytesRead = 0
+        self._finished = False
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        await self._expect("{")
+        if await self._peek() == "}":
+            return
+        while True:
+            name = await self._value()
+            await self._expect(":")
+            if name == self._key:
+                async for item in self._array():
+                    yield item
+            else:
+                await self._value()
+            if await self._next("}"):
+                return
+
+    async def _array(self) -> AsyncIterator[Any]:
+        await self._expect("[")
+        if await self._peek() == "]":
+            self._position += 1
+            return
+        while True:
+            yield await self._value()
+            if await self._next("]"):
+                return
+
+    async def _next(self, closing: str) -> bool:
+        """
+        Step over the separator after a value, True if it ended the container.
+        """
+        character = await self._peek()
+        self._position += 1
+        if character == closing:
+            return True
+        if character != ",":
+            raise ValueError(f"expected ',' or {closing!r} at {self._position - 1}")
+        return False
+
+    async def _expect(self, character: str):
+        if await self._peek() != character:
+            raise ValueError(f"expected {character!r} at {self._position}")
+        self._position += 1
+
+    async def _peek(self) -> str:
+        while True:
+            while (
+                    self._position < len(self._buffer) and
+                    self._buffer[self._position] in self._WHITESPACE
+            ):
+                self._position += 1
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            await self._read()
+
+    async def _value(self) -> Any:
+        await self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+            except json.JSONDecodeError:
+                # most likely cut off at the end of the buffer
+                await self._read(2 * (len(self._buffer) - self._position))
+                continue
+            if (
+                    isinstance(value, (int, float)) and not self._finished and
+                    self._NUMBER_TAIL.match(self._buffer, end)
+            ):
+                # the number could carry on in the next chunk
+                await self._read()
+                continue
+            self._position = end
+            return value
+
+    async def _read(self, minPending: int = 0):
+        """
+        Read at least one more chunk, and then until there are minPending
+        characters left to parse or the body has ended.
+        """
+        if self._finished:
+            raise ValueError("the JSON ended early")
+        # drop what has been parsed, so memory follows the item being read
+        pieces = [self._buffer[self._position:]]
+        pending = len(pieces[0])
+        while True:
+            try:
+                chunk = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._finished = True
+                pieces.append(self._utf8.decode(b"", final=True))
+                break
+
+            self._bytesRead += len(chunk)
+            if self._bytesRead > self._maxBytes:
+                raise ResponseTooLargeError(f"response is larger than {self._maxBytes} bytes")
+            pieces.append(self._utf8.decode(chunk))
+            pending += len(pieces[-1])
+            if pending >= minPending:
+                break
+        # joined once, rather than the buffer being copied for every chunk
+        self._buffer = "".join(pieces)
+        self._position = 0
@@ -0,0 +1,128 @@
+import asyncio
+import math
+import random
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, TypeVar
+
+from aiohttp.client_exceptions import ClientConnectionError, ClientResponseError
+
+from deliveryAPI.settings import settings
+from deliveryAPI.metrics import UPSTREAM_STEP_SECONDS, UPSTREAM_ERRORS
+
+
+T = TypeVar("T")
+
+
+class RetryPolicy:
+    """
+    Per backend retries with capped, fully jittered exponential backoff and
+    optional hedging of idempotent steps. Retries and hedges both spend from a
+    retry budget that only refills as calls are made, so a failing backend
+    can't be hit with a multiple of our normal traffic.
+    """
+
+    _policies: Dict[str, "RetryPolicy"] = {}
+
+    def __init__(self, name: str):
+        self.name = name
+        self._budget = float(settings.retry_budget_max_tokens)
+        self._latencies: Dict[str, Deque[float]] = defaultdict(
+            lambda: deque(maxlen=settings.hedge_latency_samples)
+        )
+
+    @classmethod
+    def forBackend(cls, name: str) -> "RetryPolicy":
+        policy = cls._policies.get(name)
+        if not policy:
+            policy = cls._policies[name] = cls(name)
+        return policy
+
+    @staticmethod
+    def isRetryable(error: Exception) -> bool:
+        if isinstance(error, ClientResponseError):
+            return error.status >= 500 or error.status == 429
+        return isinstance(error, (ClientConnectionError, asyncio.TimeoutError))
+
+    async def call(self, stepName: str, step: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        """
+        Run an HTTP step, retrying transient failures. Only pass hedge for
+        idempotent steps, as the request may be sent twice concurrently.
+        """
+        self._budget = min(
+            settings.retry_budget_max_tokens, self._budget + settings.retry_budget_ratio
+        )
+        maxAttempts = settings.retry_attempts.get(self.name, settings.retry_max_attempts)
+        hedge = hedge and self.name in settings.hedge_services
+
+        attempt = 1
+        while True:
+            try:
+                if hedge:
+                    return await self._hedged(stepName, step)
+                return await self._timed(stepName, step)
+            except Exception as error:
+                if (
+                    attempt >= maxAttempts or
+                    not self.isRetryable(error) or
+                    not self._spendBudget()
+                ):
+                    raise
+
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def hedgeDelay(self, stepName: str) -> float:
+        """
+        The p95 latency of the step, until there are enough samples to
+        estimate it the configured delay is used instead.
+        """
+        latencies = self._latencies[stepName]
+        if len(latencies) < settings.hedge_min_samples:
+            return settings.hedge_delay_seconds
+        return sorted(latencies)[math.ceil(len(latencies) * 0.95) - 1]
+
+    async def _hedged(self, stepName: str, step: Callable[[], Awaitable[T]]) -> T:
+        tasks = [asyncio.create_task(self._timed(stepName, step))]
+        try:
+            done, _pending = await asyncio.wait(tasks, timeout=self.hedgeDelay(stepName))
+            if not done and self._spendBudget():
+                tasks.append(asyncio.create_task(self._timed(stepName, step)))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception():
+                        return task.result()
+            # every request failed, report the first one's error
+            return tasks[0].result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _timed(self, stepName: str, step: Callable[[], Awaitable[T]]) -> T:
+        startTime = time.monotonic()
+        try:
+            result = await step()
+        except Exception as error:
+            status = error.status if isinstance(error, ClientResponseError) else type(error).__name__
+            UPSTREAM_ERRORS.inc(self.name, stepName, str(status))
+            raise
+        finally:
+            UPSTREAM_STEP_SECONDS.observe(time.monotonic() - startTime, self.name, stepName)
+
+        self._latencies[stepName].append(time.monotonic() - startTime)
+        return result
+
+    def _spendBudget(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(
+            settings.retry_max_delay_seconds,
+            settings.retry_base_delay_seconds * 2 ** (attempt - 1)
+        ))
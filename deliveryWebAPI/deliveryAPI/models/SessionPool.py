@@ -0,0 +1,51 @@
+from typing import Dict, Optional
+
+from aiohttp import TCPConnector
+
+from deliveryAPI.settings import settings
+
+
+class SessionPool:
+    """
+    Application lifetime connection pool, one connector per upstream host.
+    Sessions borrow a connector rather than owning one, so TCP/TLS connections
+    and DNS lookups are reused between requests.
+    """
+
+    _connectors: Dict[str, TCPConnector] = {}
+    _open: bool = False
+
+    @classmethod
+    def open(cls):
+        cls._open = True
+
+    @classmethod
+    async def close(cls):
+        cls._open = False
+        connectors, cls._connectors = cls._connectors, {}
+        for connector in connectors.values():
+            await connector.close()
+
+    @classmethod
+    def getConnector(cls, host: str) -> Optional[TCPConnector]:
+        """
+        Return the shared connector for host, or None when the pool is not open
+        (for example outside the FastAPI app), in which case the session should
+        create and own its own connector.
+        """
+        if not cls._open:
+            return None
+
+        connector = cls._connectors.get(host)
+        if connector is None or connector.closed:
+            connector = TCPConnector(
+                limit=0,
+                limit_per_host=settings.connection_limits.get(
+                    host, settings.connection_limit_per_host
+                ),
+                keepalive_timeout=settings.keepalive_timeout_seconds,
+                use_dns_cache=True,
+                ttl_dns_cache=settings.dns_cache_ttl_seconds
+            )
+            cls._connectors[host] = connector
+        return connector
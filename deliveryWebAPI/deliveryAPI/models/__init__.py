@@ -1,2 +1,9 @@
+from deliveryAPI.settings import settings
+
 
 USER_AGENT = "DeliveryAPI/0.0.1"
+
+
+def upstreamUrl(host: str, path: str) -> str:
+    # hosts can be pointed somewhere else, e.g. a local fake upstream for benchmarks
+    return settings.upstream_base_urls.get(host, f"https://{host}") + path
@@ -0,0 +1,35 @@
+import re
+from typing import Optional
+
+
+# the format from the UK government data standards, without the space
+POSTCODE_PATTERN = re.compile(
+    r"^(GIR0AA|[A-PR-UWYZ]([0-9]{1,2}|[A-HK-Y][0-9]{1,2}|[0-9][A-HJKPS-UW]|"
+    r"[A-HK-Y][0-9][ABEHMNPRV-Y])[0-9][ABD-HJLNP-UW-Z]{2})$"
+)
+
+
+class InvalidPostcodeError(ValueError):
+    pass
+
+
+def normalizePostcode(postcode: str) -> str:
+    """
+    The canonical form of a UK postcode, upper case with a single space
+    before the inward code, e.g. " sw1a  1aa" becomes "SW1A 1AA".
+    """
+    compactPostcode = "".join(postcode.split()).upper()
+    if not POSTCODE_PATTERN.match(compactPostcode):
+        raise InvalidPostcodeError(f"{postcode!r} is not a valid UK postcode")
+    return f"{compactPostcode[:-3]} {compactPostcode[-3:]}"
+
+
+def postcodeSector(postcode: str) -> Optional[str]:
+    """
+    The sector of a UK postcode, its outward code and the first digit of the
+    inward code, e.g. "SW1A 1" for "SW1A 1AA". None if it isn't a postcode.
+    """
+    try:
+        return normalizePostcode(postcode)[:-2]
+    except InvalidPostcodeError:
+        return None
@@ -0,0 +1,53 @@
+import os
+from typing import Any, Dict
+
+import uvicorn
+
+from deliveryAPI.settings import settings
+
+
+# imported by each worker, so every worker opens its own pools and caches on startup
+APP = "deliveryAPI.api.api:app"
+
+
+def availableCpus() -> int:
+    """
+    CPUs this process may run on, which in a container can be fewer than
+    the host has.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # not available on macOS or Windows
+        return os.cpu_count() or 1
+
+
+def workerCount() -> int:
+    return settings.serve_workers or availableCpus()
+
+
+def serverConfig() -> Dict[str, Any]:
+    return {
+        "host": settings.serve_host,
+        "port": settings.serve_port,
+        "workers": workerCount(),
+        # auto picks uvloop and httptools when they are installed
+        "loop": settings.serve_loop,
+        "http": settings.serve_http,
+        "backlog": settings.serve_backlog,
+        "timeout_keep_alive": settings.serve_keepalive_timeout_seconds,
+        "limit_concurrency": settings.serve_limit_concurrency,
+        # on SIGTERM stop accepting, then wait this long for in-flight requests
+        "timeout_graceful_shutdown": settings.serve_graceful_timeout_seconds,
+        "forwarded_allow_ips": settings.serve_forwarded_allow_ips,
+        "access_log": settings.serve_access_log,
+        "log_level": settings.serve_log_level,
+    }
+
+
+def main():
+    uvicorn.run(APP, **serverConfig())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+from typing import Dict, List, Literal, Optional
+
+from pydantic import BaseSettings
+
+
+class Settings(BaseSettings):
+    # e.g. {"api.pizzahut.io": "http://localhost:8081"}, defaults to https://<host>
+    upstream_base_urls: Dict[str, str] = {}
+
+    # JSON file of extra backends, see BackendRegistry.loadConfig
+    backends_config: Optional[str] = None
+
+    # outbound connection pool
+    connection_limit_per_host: int = 20
+    connection_limits: Dict[str, int] = {}  # per host overrides
+    keepalive_timeout_seconds: float = 30
+    dns_cache_ttl_seconds: int = 300
+
+    # can_deliver result cache, per service overrides are keyed by service name
+    result_cache_max_size: int = 10000
+    # store shared by the workers, see cache.CacheStore.createStore, e.g. redis://cache:6379/0
+    result_cache_store_url: Optional[str] = None
+    # held by the worker fetching a key while the others wait for its answer
+    result_cache_lock_seconds: float = 10
+    result_cache_ttl_seconds: float = 300
+    result_cache_negative_ttl_seconds: float = 60
+    result_cache_ttls: Dict[str, float] = {}
+    result_cache_negative_ttls: Dict[str, float] = {}
+    # serve expired answers while they are refreshed in the background, and
+    # while the upstream is failing, for up to the maximum staleness
+    stale_while_revalidate: bool = False
+    stale_if_error: bool = False
+    max_stale_seconds: float = 3600
+    max_stale: Dict[str, float] = {}
+
+    # warming, and refreshing ahead of expiry, the caches for the most requested postcodes
+    warm_enabled: bool = True
+    warm_top_postcodes: int = 200
+    warm_postcodes: List[str] = []  # always warmed, e.g. before there is any traffic
+    # shared by the workers, only the one holding its lock warms
+    warm_state_file: Optional[str] = "Hot_Postcodes.json"
+    warm_track_max_postcodes: int = 10000
+    warm_interval_seconds: float = 15
+    warm_refresh_ahead_seconds: float = 30
+    warm_checks_per_second: float = 5
+    warm_half_life_seconds: float = 3600
+
+    # Uber Eats location cache
+    ue_location_cache_store_url: str = "file://UE_Postcodes.sqlite3"
+    ue_location_cache_memory_size: int = 10000
+    ue_location_cache_sweep_interval_seconds: float = 3600
+    # sessions with the location set, kept between requests, 0 closes them after each request
+    ue_session_pool_max_size: int = 100
+    ue_session_pool_idle_seconds: float = 300
+    ue_session_pool_sweep_interval_seconds: float = 60
+    # parse the search as it arrives, stopping at the first matching store
+    ue_search_streaming: bool = True
+    ue_search_max_bytes: int = 2 * 1024 * 1024
+
+    # answers from a sweep compiled by deliveryAPI.coverage, checked before the caches
+    coverage_table_path: Optional[str] = None
+    coverage_table_max_age_seconds: float = 7 * 86400
+
+    # postcodes the upstreams said can't be delivered to, answered without the models
+    negative_postcodes_file: Optional[str] = "Negative_Postcodes.bin"
+    negative_postcodes_ttl_seconds: float = 7 * 86400
+    negative_postcodes_max_entries: int = 1000000
+    negative_postcodes_save_interval_seconds: float = 300
+
+    # local index of upstream answers by postcode sector, keyed by service name
+    catchment_index_services: List[str] = ["Pizza Hut", "Dominos"]
+    catchment_min_observations: int = 3
+    catchment_ttl_seconds: float = 86400
+    catchment_max_sectors: int = 20000
+
+    # upstream timeouts, per service overrides are keyed by service name
+    service_timeout_seconds: float = 5
+    service_timeouts: Dict[str, float] = {}
+    request_deadline_seconds: float = 8
+
+    # circuit breaker, per backend
+    circuit_failure_threshold: int = 5
+    circuit_latency_threshold_seconds: float = 4
+    circuit_open_seconds: float = 30
+    circuit_half_open_probes: int = 1
+
+    # AIMD concurrency limit on upstream calls, per backend
+    concurrency_initial_limit: int = 20
+    concurrency_min_limit: int = 1
+    concurrency_max_limit: int = 200
+    concurrency_latency_threshold_seconds: float = 2
+    concurrency_backoff_ratio: float = 0.5
+
+    # retries and hedging of upstream HTTP steps, per service overrides are keyed by service name
+    retry_max_attempts: int = 3
+    retry_attempts: Dict[str, int] = {}
+    retry_base_delay_seconds: float = 0.1
+    retry_max_delay_seconds: float = 1
+    retry_budget_ratio: float = 0.2  # tokens earned per call, each retry or hedge costs one
+    retry_budget_max_tokens: int = 10
+    hedge_services: List[str] = []
+    hedge_delay_seconds: float = 1
+    hedge_min_samples: int = 20
+    hedge_latency_samples: int = 200
+
+    metrics_enabled: bool = True
+
+    # encode responses and decode upstream bodies with orjson when it is installed
+    fast_json: bool = True
+
+    # batch endpoint, per service limits are keyed by endpoint name
+    batch_max_postcodes: int = 1000
+    batch_concurrency: int = 50
+    batch_service_concurrency: int = 10
+    batch_service_concurrencies: Dict[str, int] = {}
+
+    # bulk jobs, see jobs.BulkJobs, kept in a directory shared by the workers
+    bulk_jobs_directory: str = "Bulk_Jobs"
+    bulk_jobs_max_running: int = 2  # per worker, the rest wait their turn
+    bulk_job_concurrency: int = 20  # postcodes in flight per job
+    bulk_job_checkpoint_every: int = 100  # postcodes
+    bulk_jobs_scan_interval_seconds: float = 30  # for jobs left unfinished by a stopped worker
+    bulk_jobs_retention_seconds: float = 7 * 86400
+    bulk_job_poll_interval_seconds: float = 1  # results downloads of running jobs
+
+    # production server, see serve.py, uvloop and httptools are used when installed
+    serve_host: str = "0.0.0.0"
+    serve_port: int = 8000
+    serve_workers: Optional[int] = None  # defaults to the CPUs available to the process
+    serve_loop: Literal["auto", "asyncio", "uvloop"] = "auto"
+    serve_http: Literal["auto", "h11", "httptools"] = "auto"
+    serve_backlog: int = 2048
+    serve_keepalive_timeout_seconds: int = 5
+    serve_limit_concurrency: Optional[int] = None  # per worker, beyond it requests get a 503
+    serve_graceful_timeout_seconds: int = 30  # for in-flight requests to finish on shutdown
+    serve_forwarded_allow_ips: Optional[str] = None
+    serve_access_log: bool = False
+    serve_log_level: str = "info"
+    # then for background upstream calls, such as revalidations, to finish
+    shutdown_drain_seconds: float = 10
+
+    class Config:
+        env_prefix = "DELIVERY_API_"
+
+
+settings = Settings()
@@ -1,11 +1,24 @@
+import asyncio
+import json
+import tempfile
 from unittest import IsolatedAsyncioTestCase
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock, MagicMock
 
 from fastapi import HTTPException
 
+from deliveryAPI.api import schemas
+from deliveryAPI.models.CircuitBreaker import CircuitOpenError
+from deliveryAPI.models.BackendRegistry import BackendRegistry, BackendSpec, Capability
+from deliveryAPI.models.FoodModels import PizzaHut
+from deliveryAPI.jobs.BulkJobs import BulkJobs, JobStatus
+
 from deliveryAPI.api.api import (
-    foodDeliveryData, getDeliveryServiceFromEndpoint, PizzaHut
+    foodDeliveryData, getDeliveryServiceFromEndpoint, checkCanDeliver, foodDeliveryDataBatch,
+    streamCanDeliver, formatStream, canDeliverResponse, resultCache, deliveryServices, warmPostcode,
+    resultCacheTtls, deliveryResponse, batchDeliveryResponse, bulkCheckPostcode, createBulkJob,
+    bulkJobStatus, bulkJobResults, cacheStats, metrics
 )
+from deliveryAPI.metrics import RESULT_CACHE
 
 MODULE_PATH = "deliveryAPI.api.api."
 
@@ -15,6 +28,9 @@ class BaseExampleFoodItem:
     def __init__(self, postcode):
         self._postcode = postcode
 
+    async def canDeliverUpstream(self):
+        return await self.canDeliver()
+
 
 class ExampleFoodItem1(BaseExampleFoodItem):
 
@@ -36,9 +52,34 @@ class ExampleFoodItem2(BaseExampleFoodItem):
         return False
 
 
-@patch(MODULE_PATH + "foodItems", [ExampleFoodItem1, ExampleFoodItem2])
+class ExampleFoodItemError(BaseExampleFoodItem):
+
+    @property
+    def name(self):
+        return "Example Food Item Error"
+
+    async def canDeliver(self):
+        raise Exception("upstream failed")
+
+
+class ExampleFoodItemSlow(BaseExampleFoodItem):
+
+    @property
+    def name(self):
+        return "Example Food Item Slow"
+
+    async def canDeliver(self):
+        await asyncio.sleep(0.2)
+        return True
+
+
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1, ExampleFoodItem2])
+@patch(MODULE_PATH + "settings.fast_json", False)
 class Test_foodDeliveryData(IsolatedAsyncioTestCase):
 
+    def setUp(self):
+        resultCache.clear()
+
     async def test_ok(self):
         response = await foodDeliveryData("ABCD 1EF")
 
@@ -46,15 +87,466 @@ class Test_foodDeliveryData(IsolatedAsyncioTestCase):
             {
                 "Example Food Item 1": {
                     "can_deliver": True,
+                    "status": "ok"
                 },
                 "Example Food Item 2": {
-                    "can_deliver": False
+                    "can_deliver": False,
+                    "status": "ok"
                 }
             },
             response
         )
 
 
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1, ExampleFoodItemError])
+@patch(MODULE_PATH + "settings.fast_json", False)
+class Test_foodDeliveryData_error(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_error_isolated(self):
+        response = await foodDeliveryData("ABCD 1EF")
+
+        self.assertEqual(
+            {
+                "Example Food Item 1": {"can_deliver": True, "status": "ok"},
+                "Example Food Item Error": {
+                    "can_deliver": None, "status": "error", "error": "upstream failed"
+                }
+            },
+            response
+        )
+
+
+class Test_checkCanDeliver(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_cached(self):
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(return_value=True)
+
+        self.assertTrue(await checkCanDeliver(foodItem, "ABCD 1EF"))
+        self.assertTrue(await checkCanDeliver(foodItem, "ABCD 1EF"))
+
+        foodItem.canDeliver.assert_called_once_with()
+        self.assertEqual(1, resultCache.stats["Example Food Item 1"]["hits"])
+
+    @patch(MODULE_PATH + "settings")
+    async def test_per_service_ttl(self, settings):
+        settings.result_cache_ttls = {"Example Food Item 1": 0}
+        settings.result_cache_negative_ttls = {}
+        settings.result_cache_negative_ttl_seconds = 60
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(return_value=True)
+
+        await checkCanDeliver(foodItem, "ABCD 1EF")
+        await checkCanDeliver(foodItem, "ABCD 1EF")
+
+        self.assertEqual(2, foodItem.canDeliver.call_count)
+
+    @patch(MODULE_PATH + "coverageTable")
+    async def test_coverage_table(self, coverageTable):
+        coverageTable.lookup.return_value = False
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(return_value=True)
+
+        self.assertFalse(await checkCanDeliver(foodItem, "ABCD 1EF"))
+
+        coverageTable.lookup.assert_called_once_with("Example Food Item 1", "ABCD 1EF")
+        foodItem.canDeliver.assert_not_called()
+        self.assertEqual(0, len(resultCache))
+
+    @patch(MODULE_PATH + "coverageTable")
+    async def test_coverage_table_miss(self, coverageTable):
+        coverageTable.lookup.return_value = None
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(return_value=True)
+
+        self.assertTrue(await checkCanDeliver(foodItem, "ABCD 1EF"))
+
+        foodItem.canDeliver.assert_called_once_with()
+
+
+exampleRegistry = BackendRegistry([
+    BackendSpec("example1", "Example Food Item 1", f"{__name__}:ExampleFoodItem1"),
+    BackendSpec("example2", "Example Food Item 2", f"{__name__}:ExampleFoodItem2"),
+    BackendSpec("error", "Example Food Item Error", f"{__name__}:ExampleFoodItemError"),
+    BackendSpec(
+        "aggregateonly", "Example Food Item Slow", f"{__name__}:ExampleFoodItemSlow",
+        capabilities=[Capability.AGGREGATE]
+    ),
+])
+
+
+@patch(MODULE_PATH + "backendRegistry", exampleRegistry)
+@patch(MODULE_PATH + "settings.fast_json", False)
+class Test_foodDeliveryDataBatch(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_ok(self):
+        response = await foodDeliveryDataBatch(schemas.BatchRequest(
+            postcodes=["SW1A 1AA", "NW9 9ED", "sw1a1aa"]
+        ))
+
+        expectedPostcodeResponse = {
+            "example1": {"can_deliver": True, "status": "ok"},
+            "example2": {"can_deliver": False, "status": "ok"},
+            "error": {"can_deliver": None, "status": "error", "error": "upstream failed"}
+        }
+        self.assertEqual(
+            {
+                "SW1A 1AA": expectedPostcodeResponse,
+                "NW9 9ED": expectedPostcodeResponse
+            },
+            response
+        )
+
+    async def test_services_subset(self):
+        response = await foodDeliveryDataBatch(schemas.BatchRequest(
+            postcodes=["SW1A 1AA"], services=["example2"]
+        ))
+
+        self.assertEqual(
+            {"SW1A 1AA": {"example2": {"can_deliver": False, "status": "ok"}}}, response
+        )
+
+    async def test_unknown_service(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await foodDeliveryDataBatch(schemas.BatchRequest(
+                postcodes=["SW1A 1AA"], services=["notfound"]
+            ))
+
+        self.assertEqual(404, httpError.exception.status_code)
+
+    @patch(MODULE_PATH + "settings")
+    async def test_too_many_postcodes(self, settings):
+        settings.batch_max_postcodes = 1
+
+        with self.assertRaises(HTTPException) as httpError:
+            await foodDeliveryDataBatch(schemas.BatchRequest(
+                postcodes=["SW1A 1AA", "NW9 9ED"]
+            ))
+
+        self.assertEqual(422, httpError.exception.status_code)
+
+    async def test_malformed_postcode(self):
+        response = await foodDeliveryDataBatch(schemas.BatchRequest(
+            postcodes=["SW1A 1AA", "not a postcode"], services=["example2"]
+        ))
+
+        self.assertEqual(
+            {
+                "SW1A 1AA": {"example2": {"can_deliver": False, "status": "ok"}},
+                "not a postcode": {"example2": {
+                    "can_deliver": None, "status": "error",
+                    "error": "'not a postcode' is not a valid UK postcode"
+                }}
+            },
+            response
+        )
+
+
+class ExampleFoodItemBlocked(BaseExampleFoodItem):
+
+    cancelled = 0
+
+    @property
+    def name(self):
+        return "Example Food Item Blocked"
+
+    async def canDeliver(self):
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            ExampleFoodItemBlocked.cancelled += 1
+            raise
+
+
+@patch(MODULE_PATH + "settings.fast_json", False)
+class Test_foodDeliveryData_any(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+        ExampleFoodItemBlocked.cancelled = 0
+
+    @patch(
+        MODULE_PATH + "aggregateFoodItems",
+        lambda: [ExampleFoodItem2, ExampleFoodItemBlocked, ExampleFoodItemSlow]
+    )
+    async def test_first_deliverer(self):
+        response = await foodDeliveryData("ABCD 1EF", mode="any")
+        # the cancellation unwinds through the result cache's fetch task
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(
+            {"Example Food Item Slow": {"can_deliver": True, "status": "ok"}}, response
+        )
+        self.assertEqual(1, ExampleFoodItemBlocked.cancelled)
+
+    @patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem2, ExampleFoodItemError])
+    async def test_none_deliver(self):
+        response = await foodDeliveryData("ABCD 1EF", mode="any")
+
+        self.assertEqual(
+            {
+                "Example Food Item 2": {"can_deliver": False, "status": "ok"},
+                "Example Food Item Error": {
+                    "can_deliver": None, "status": "error", "error": "upstream failed"
+                }
+            },
+            response
+        )
+
+    @patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem2, ExampleFoodItemBlocked])
+    @patch(MODULE_PATH + "settings.request_deadline_seconds", 0.05)
+    async def test_deadline(self):
+        response = await foodDeliveryData("ABCD 1EF", mode="any")
+        # the cancellation unwinds through the result cache's fetch task
+        await asyncio.sleep(0.01)
+
+        self.assertEqual(
+            {
+                "Example Food Item 2": {"can_deliver": False, "status": "ok"},
+                "Example Food Item Blocked": {"can_deliver": None, "status": "timed_out"}
+            },
+            response
+        )
+        self.assertEqual(1, ExampleFoodItemBlocked.cancelled)
+
+
+@patch(MODULE_PATH + "settings.fast_json", False)
+@patch(MODULE_PATH + "backendRegistry", exampleRegistry)
+class Test_foodDeliveryData_services(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_subset(self):
+        response = await foodDeliveryData("ABCD 1EF", services=["example2", "example1", "example2"])
+
+        self.assertEqual(
+            {
+                "Example Food Item 2": {"can_deliver": False, "status": "ok"},
+                "Example Food Item 1": {"can_deliver": True, "status": "ok"}
+            },
+            response
+        )
+
+    async def test_any(self):
+        response = await foodDeliveryData("ABCD 1EF", mode="any", services=["error", "example1"])
+
+        self.assertEqual({"Example Food Item 1": {"can_deliver": True, "status": "ok"}}, response)
+
+    async def test_unknown_service(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await foodDeliveryData("ABCD 1EF", services=["notfound"])
+
+        self.assertEqual(404, httpError.exception.status_code)
+
+
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1, ExampleFoodItemSlow])
+@patch(MODULE_PATH + "settings.request_deadline_seconds", 0.05)
+@patch(MODULE_PATH + "settings.fast_json", False)
+class Test_foodDeliveryData_deadline(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_partial_response(self):
+        response = await foodDeliveryData("ABCD 1EF")
+
+        self.assertEqual(
+            {
+                "Example Food Item 1": {"can_deliver": True, "status": "ok"},
+                "Example Food Item Slow": {"can_deliver": None, "status": "timed_out"}
+            },
+            response
+        )
+
+    async def test_stream_partial_response(self):
+        results = [result async for result in streamCanDeliver("ABCD 1EF")]
+
+        self.assertEqual(
+            [
+                ("Example Food Item 1", {"can_deliver": True, "status": "ok"}),
+                ("Example Food Item Slow", {"can_deliver": None, "status": "timed_out"}),
+            ],
+            results
+        )
+
+
+class Test_canDeliverResponse(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_ok(self):
+        response = await canDeliverResponse(ExampleFoodItem2("ABCD 1EF"), "ABCD 1EF")
+
+        self.assertEqual({"can_deliver": False, "status": "ok"}, response)
+
+    async def test_circuit_open(self):
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(side_effect=CircuitOpenError("circuit open"))
+
+        response = await canDeliverResponse(foodItem, "ABCD 1EF")
+
+        self.assertEqual(
+            {"can_deliver": None, "status": "unavailable", "error": "circuit open"}, response
+        )
+
+    @patch(MODULE_PATH + "settings.service_timeouts", {"Example Food Item Slow": 0.001})
+    async def test_service_timeout(self):
+        response = await canDeliverResponse(ExampleFoodItemSlow("ABCD 1EF"), "ABCD 1EF")
+
+        self.assertEqual({"can_deliver": None, "status": "timed_out"}, response)
+        self.assertEqual(0, len(resultCache))
+
+    @patch(MODULE_PATH + "NegativePostcodes")
+    async def test_negative_postcode(self, NegativePostcodes_):
+        NegativePostcodes_.isNegative.return_value = True
+        foodItem = ExampleFoodItem1("ABCD 1EF")
+        foodItem.canDeliver = AsyncMock(return_value=True)
+
+        response = await canDeliverResponse(foodItem, "ABCD 1EF")
+
+        self.assertEqual({"can_deliver": False, "status": "ok"}, response)
+        NegativePostcodes_.isNegative.assert_called_once_with("Example Food Item 1", "ABCD 1EF")
+        foodItem.canDeliver.assert_not_called()
+
+
+@patch(
+    MODULE_PATH + "aggregateFoodItems",
+    lambda: [ExampleFoodItemSlow, ExampleFoodItemError, ExampleFoodItem1]
+)
+class Test_streamCanDeliver(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_completion_order(self):
+        results = [result async for result in streamCanDeliver("ABCD 1EF")]
+
+        self.assertEqual(
+            [
+                (
+                    "Example Food Item Error",
+                    {"can_deliver": None, "status": "error", "error": "upstream failed"}
+                ),
+                ("Example Food Item 1", {"can_deliver": True, "status": "ok"}),
+                ("Example Food Item Slow", {"can_deliver": True, "status": "ok"}),
+            ],
+            results
+        )
+
+    async def test_cancelled_on_close(self):
+        results = streamCanDeliver("ABCD 1EF")
+        await results.__anext__()
+
+        await results.aclose()
+        await asyncio.sleep(0.02)
+
+        # only the fast result completed, the slow upstream call was cancelled
+        self.assertEqual(1, len(resultCache))
+
+
+MIXED_RESPONSES = {
+    "Example Food Item 1": {"can_deliver": True, "status": schemas.DeliveryStatus.OK},
+    "Example Food Item 2": {"can_deliver": None, "status": schemas.DeliveryStatus.TIMED_OUT},
+    "Example Food Item Error": {
+        "can_deliver": None, "status": schemas.DeliveryStatus.ERROR, "error": "upstream failed"
+    },
+    "Example Food Item Slow": {
+        "can_deliver": False, "status": schemas.DeliveryStatus.STALE, "age_seconds": 12.3
+    }
+}
+
+
+class Test_deliveryResponse(IsolatedAsyncioTestCase):
+
+    async def test_matches_model(self):
+        response = deliveryResponse(MIXED_RESPONSES)
+
+        self.assertEqual(
+            json.loads(schemas.DeliveryServiceResponse.parse_obj(MIXED_RESPONSES).json()),
+            json.loads(response.body)
+        )
+        self.assertEqual("application/json", response.media_type)
+
+    @patch(MODULE_PATH + "settings.fast_json", False)
+    async def test_disabled(self):
+        self.assertIs(MIXED_RESPONSES, deliveryResponse(MIXED_RESPONSES))
+
+
+class Test_batchDeliveryResponse(IsolatedAsyncioTestCase):
+
+    async def test_matches_model(self):
+        responses = {schemas.Postcode("SW1A 1AA"): MIXED_RESPONSES}
+
+        response = batchDeliveryResponse(responses)
+
+        self.assertEqual(
+            json.loads(schemas.BatchDeliveryServiceResponse.parse_obj(responses).json()),
+            json.loads(response.body)
+        )
+
+    @patch(MODULE_PATH + "settings.fast_json", False)
+    async def test_disabled(self):
+        responses = {"SW1A 1AA": MIXED_RESPONSES}
+
+        self.assertIs(responses, batchDeliveryResponse(responses))
+
+
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1])
+class Test_foodDeliveryData_fastJson(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_ok(self):
+        response = await foodDeliveryData("ABCD 1EF")
+
+        self.assertEqual(
+            b'{"Example Food Item 1":{"can_deliver":true,"status":"ok","error":null,'
+            b'"age_seconds":null}}',
+            response.body
+        )
+
+
+class Test_formatStream(IsolatedAsyncioTestCase):
+
+    async def _results(self):
+        yield "Example Food Item 1", {"can_deliver": True}
+        yield "Example Food Item 2", {"can_deliver": False}
+
+    async def test_ndjson(self):
+        lines = [line async for line in formatStream(self._results(), "ndjson")]
+
+        self.assertEqual(
+            [
+                '{"Example Food Item 1":{"can_deliver":true}}\n',
+                '{"Example Food Item 2":{"can_deliver":false}}\n'
+            ],
+            lines
+        )
+
+    async def test_sse(self):
+        lines = [line async for line in formatStream(self._results(), "sse")]
+
+        self.assertEqual(
+            [
+                'data: {"Example Food Item 1":{"can_deliver":true}}\n\n',
+                'data: {"Example Food Item 2":{"can_deliver":false}}\n\n'
+            ],
+            lines
+        )
+
+
 class Test_getDeliveryServiceFromEndpoint(IsolatedAsyncioTestCase):
 
     async def test_backend_found(self):
@@ -71,3 +563,315 @@ class Test_getDeliveryServiceFromEndpoint(IsolatedAsyncioTestCase):
             "Could not find delivery service backend for notfound",
             httpError.exception.detail
         )
+
+    @patch(MODULE_PATH + "backendRegistry", exampleRegistry)
+    async def test_not_direct(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await getDeliveryServiceFromEndpoint("aggregateonly")
+
+        self.assertEqual(404, httpError.exception.status_code)
+
+
+class Test_deliveryServices(IsolatedAsyncioTestCase):
+
+    @patch(MODULE_PATH + "backendRegistry", exampleRegistry)
+    async def test_ok(self):
+        response = await deliveryServices()
+
+        self.assertEqual(
+            {
+                "slug": "example1", "name": "Example Food Item 1",
+                "capabilities": ["aggregate", "direct"]
+            },
+            response[0]
+        )
+        self.assertEqual(
+            {
+                "slug": "aggregateonly", "name": "Example Food Item Slow",
+                "capabilities": ["aggregate"]
+            },
+            response[3]
+        )
+
+
+@patch(MODULE_PATH + "workerId", MagicMock(return_value="1234"))
+class Test_perWorkerStats(IsolatedAsyncioTestCase):
+
+    @patch("deliveryAPI.metrics.settings.metrics_enabled", True)
+    async def test_metrics(self):
+        RESULT_CACHE.inc("Example Food Item 1", "hit")
+
+        response = await metrics()
+
+        self.assertIn(
+            'delivery_result_cache_total{worker="1234",service="Example Food Item 1",result="hit"}',
+            response
+        )
+
+    async def test_cache_stats(self):
+        response = await cacheStats()
+
+        self.assertEqual("1234", response["worker"])
+
+
+class Test_Postcode_validate(IsolatedAsyncioTestCase):
+
+    async def test_normalized(self):
+        self.assertEqual("SW1A 1AA", schemas.Postcode.validate(" sw1a1aa "))
+
+    async def test_malformed(self):
+        with self.assertRaises(ValueError):
+            schemas.Postcode.validate("ABCD 1EF")
+
+
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1, ExampleFoodItem2])
+@patch(MODULE_PATH + "settings.warm_refresh_ahead_seconds", 30)
+class Test_warmPostcode(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_fills_cache(self):
+        self.assertEqual(2, await warmPostcode("SW1A 1AA"))
+
+        self.assertEqual(2, len(resultCache))
+
+    async def test_fresh_skipped(self):
+        resultCache.set("Example Food Item 1", "SW1A 1AA", True, 300)
+        resultCache.set("Example Food Item 2", "SW1A 1AA", False, 300)
+
+        self.assertEqual(0, await warmPostcode("SW1A 1AA"))
+
+    async def test_refresh_ahead(self):
+        resultCache.set("Example Food Item 1", "SW1A 1AA", True, 300)
+        resultCache.set("Example Food Item 2", "SW1A 1AA", False, 10)
+
+        self.assertEqual(1, await warmPostcode("SW1A 1AA"))
+
+        self.assertEqual(1, resultCache.stats["Example Food Item 2"]["refreshes"])
+        self.assertLess(10, resultCache.expiresIn("Example Food Item 2", "SW1A 1AA"))
+
+    @patch(MODULE_PATH + "settings.result_cache_ttls", {"Example Food Item 1": 0})
+    @patch(MODULE_PATH + "settings.result_cache_negative_ttls", {"Example Food Item 1": 0})
+    async def test_uncached_service_skipped(self):
+        self.assertEqual(1, await warmPostcode("SW1A 1AA"))
+
+    @patch(MODULE_PATH + "coverageTable")
+    async def test_covered_skipped(self, coverageTable):
+        coverageTable.lookup.side_effect = lambda name, postcode: (
+            True if name == "Example Food Item 1" else None
+        )
+
+        self.assertEqual(1, await warmPostcode("SW1A 1AA"))
+
+    @patch(MODULE_PATH + "NegativePostcodes")
+    async def test_negative_skipped(self, NegativePostcodes_):
+        NegativePostcodes_.isNegative.side_effect = lambda name, postcode: (
+            name == "Example Food Item 1"
+        )
+
+        self.assertEqual(1, await warmPostcode("SW1A 1AA"))
+
+
+@patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1, ExampleFoodItemError])
+class Test_warmPostcode_error(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    async def test_error_ignored(self):
+        self.assertEqual(2, await warmPostcode("SW1A 1AA"))
+
+        self.assertEqual(1, len(resultCache))
+
+
+class Test_foodDeliveryData_hotPostcodes(IsolatedAsyncioTestCase):
+
+    @patch(MODULE_PATH + "aggregateFoodItems", lambda: [ExampleFoodItem1])
+    @patch(MODULE_PATH + "hotPostcodes")
+    async def test_recorded(self, hotPostcodes):
+        await foodDeliveryData("SW1A 1AA")
+
+        hotPostcodes.record.assert_called_once_with("SW1A 1AA")
+
+
+@patch(MODULE_PATH + "settings.stale_while_revalidate", True)
+class Test_canDeliverResponse_staleWhileRevalidate(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    @patch("deliveryAPI.cache.ResultCache.time")
+    async def test_stale_served(self, time_):
+        time_.time.return_value = 0
+        resultCache.set("Example Food Item 2", "SW1A 1AA", True, 10, maxStale=60)
+        time_.time.return_value = 12.34
+
+        response = await canDeliverResponse(ExampleFoodItem2("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual(
+            {"can_deliver": True, "status": "stale", "age_seconds": 12.3}, response
+        )
+        await asyncio.gather(*resultCache._revalidations)
+        self.assertFalse(await checkCanDeliver(ExampleFoodItem2("SW1A 1AA"), "SW1A 1AA"))
+
+    @patch(MODULE_PATH + "settings.service_timeouts", {"Example Food Item Blocked": 0.05})
+    @patch("deliveryAPI.cache.ResultCache.time")
+    async def test_hung_revalidation_abandoned(self, time_):
+        time_.time.return_value = 0
+        resultCache.set("Example Food Item Blocked", "SW1A 1AA", True, 10, maxStale=60)
+        time_.time.return_value = 12
+
+        response = await canDeliverResponse(ExampleFoodItemBlocked("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual("stale", response["status"])
+        await asyncio.wait_for(asyncio.wait(resultCache._revalidations), 1)
+        self.assertEqual({}, resultCache._inFlight)
+
+    async def test_nothing_cached(self):
+        response = await canDeliverResponse(ExampleFoodItem2("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual({"can_deliver": False, "status": "ok"}, response)
+
+
+@patch(MODULE_PATH + "settings.stale_if_error", True)
+class Test_canDeliverResponse_staleIfError(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        resultCache.clear()
+
+    @patch("deliveryAPI.cache.ResultCache.time")
+    async def test_stale_served(self, time_):
+        time_.time.return_value = 0
+        resultCache.set("Example Food Item Error", "SW1A 1AA", True, 10, maxStale=60)
+        time_.time.return_value = 30
+
+        response = await canDeliverResponse(ExampleFoodItemError("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual(
+            {"can_deliver": True, "status": "stale", "age_seconds": 30}, response
+        )
+
+    async def test_nothing_cached(self):
+        response = await canDeliverResponse(ExampleFoodItemError("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual(
+            {"can_deliver": None, "status": "error", "error": "upstream failed"}, response
+        )
+
+    @patch(MODULE_PATH + "settings.service_timeouts", {"Example Food Item Slow": 0.001})
+    @patch("deliveryAPI.cache.ResultCache.time")
+    async def test_timed_out(self, time_):
+        time_.time.return_value = 0
+        resultCache.set("Example Food Item Slow", "SW1A 1AA", False, 10, maxStale=60)
+        time_.time.return_value = 20
+
+        response = await canDeliverResponse(ExampleFoodItemSlow("SW1A 1AA"), "SW1A 1AA")
+
+        self.assertEqual(
+            {"can_deliver": False, "status": "stale", "age_seconds": 20}, response
+        )
+
+
+class Test_resultCacheTtls(IsolatedAsyncioTestCase):
+
+    @patch(MODULE_PATH + "settings.stale_if_error", False)
+    @patch(MODULE_PATH + "settings.stale_while_revalidate", False)
+    async def test_not_kept_stale(self):
+        self.assertEqual(0, resultCacheTtls("Pizza Hut")[2])
+
+    @patch(MODULE_PATH + "settings.stale_if_error", True)
+    @patch(MODULE_PATH + "settings.max_stale", {"Pizza Hut": 120})
+    async def test_per_service_max_stale(self):
+        self.assertEqual(120, resultCacheTtls("Pizza Hut")[2])
+
+
+@patch(MODULE_PATH + "backendRegistry", exampleRegistry)
+class Test_bulkJobs(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        resultCache.clear()
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+        self.bulkJobs = BulkJobs(tempDir.name, bulkCheckPostcode, maxRunning=1)
+        bulkJobsPatch = patch(MODULE_PATH + "bulkJobs", self.bulkJobs)
+        bulkJobsPatch.start()
+        self.addCleanup(bulkJobsPatch.stop)
+
+    async def asyncTearDown(self):
+        await self.bulkJobs.close()
+
+    @staticmethod
+    def uploadRequest(body):
+        async def stream():
+            yield body
+        request = MagicMock()
+        request.stream = stream
+        return request
+
+    async def test_ok(self):
+        state = await createBulkJob(
+            self.uploadRequest(b"postcode\nSW1A 1AA\nnope\n"), "csv", ["example1", "example2"]
+        )
+        await asyncio.gather(*self.bulkJobs._running.values())
+
+        status = await bulkJobStatus(state.id)
+        self.assertEqual(JobStatus.COMPLETED, status.status)
+        self.assertEqual(1, status.total)
+        self.assertEqual(1, status.rejected)
+        response = await bulkJobResults(state.id, "csv")
+        self.assertEqual("text/csv", response.media_type)
+        self.assertEqual(
+            "postcode,example1,example2\nSW1A 1AA,true,false\n",
+            "".join([chunk async for chunk in response.body_iterator])
+        )
+
+    async def test_direct_services_by_default(self):
+        state = await createBulkJob(self.uploadRequest(b"SW1A 1AA\n"), "csv", None)
+
+        self.assertEqual(["example1", "example2", "error"], state.services)
+
+    async def test_unknown_service(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await createBulkJob(self.uploadRequest(b"SW1A 1AA\n"), "csv", ["notfound"])
+
+        self.assertEqual(404, httpError.exception.status_code)
+
+    async def test_invalid_input(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await createBulkJob(self.uploadRequest(b"x" * 5000), "csv", ["example1"])
+
+        self.assertEqual(422, httpError.exception.status_code)
+
+    async def test_unknown_job(self):
+        with self.assertRaises(HTTPException) as httpError:
+            await bulkJobStatus("0" * 32)
+
+        self.assertEqual(404, httpError.exception.status_code)
+
+    async def test_removed_service(self):
+        response = await bulkCheckPostcode("notfound", "SW1A 1AA")
+
+        self.assertEqual(schemas.DeliveryStatus.ERROR, response["status"])
+        self.assertIsNone(response["can_deliver"])
+
+    async def test_result_cache_left_alone(self):
+        resultCache.set("Example Food Item 2", "SW1A 1AA", True, 300)
+
+        response = await bulkCheckPostcode("example1", "SW1A 1AA")
+
+        self.assertEqual({"can_deliver": True, "status": "ok"}, response)
+        self.assertEqual(1, len(resultCache))
+        self.assertNotIn("Example Food Item 1", resultCache.stats)
+
+    @patch(MODULE_PATH + "NegativePostcodes")
+    @patch(MODULE_PATH + "coverageTable")
+    async def test_only_upstream_answers(self, coverageTable, NegativePostcodes_):
+        coverageTable.lookup.return_value = False
+        NegativePostcodes_.isNegative.return_value = True
+
+        response = await bulkCheckPostcode("example1", "SW1A 1AA")
+
+        self.assertEqual({"can_deliver": True, "status": "ok"}, response)
+        coverageTable.lookup.assert_not_called()
+        NegativePostcodes_.isNegative.assert_not_called()
@@ -0,0 +1,74 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from aiohttp.test_utils import TestServer
+from aiohttp.client_exceptions import ClientResponseError
+
+from deliveryAPI.settings import settings
+from deliveryAPI.benchmark.FakeUpstream import FakeUpstream, RouteBehaviour
+from deliveryAPI.models.FoodModels import PizzaHut, Dominos, McDonalds
+from deliveryAPI.models.CircuitBreaker import CircuitBreaker
+from deliveryAPI.models.ConcurrencyLimiter import AdaptiveConcurrencyLimiter
+from deliveryAPI.models.RetryPolicy import RetryPolicy
+from deliveryAPI.cache.CatchmentIndex import CatchmentIndex
+
+
+class FakeUpstreamTestCase(IsolatedAsyncioTestCase):
+
+    behaviour = RouteBehaviour(latencyMs=0, payloadItems=3)
+
+    async def asyncSetUp(self):
+        self.fakeUpstream = FakeUpstream(self.behaviour, seed=0)
+        self.server = TestServer(self.fakeUpstream.createApp())
+        await self.server.start_server()
+        baseUrl = str(self.server.make_url("")).rstrip("/")
+        self.upstreamUrls = patch.dict(settings.upstream_base_urls, {
+            host: baseUrl for host in ("api.pizzahut.io", "www.dominos.co.uk", "www.ubereats.com")
+        })
+        self.upstreamUrls.start()
+
+    async def asyncTearDown(self):
+        self.upstreamUrls.stop()
+        await self.server.close()
+        CircuitBreaker._breakers.clear()
+        AdaptiveConcurrencyLimiter._limiters.clear()
+        RetryPolicy._policies.clear()
+        CatchmentIndex._indexes.clear()
+
+
+class Test_FakeUpstream(FakeUpstreamTestCase):
+
+    async def test_independent_models(self):
+        self.assertTrue(await PizzaHut("AB1 2CD").canDeliver())
+        self.assertTrue(await Dominos("AB1 2CD").canDeliver())
+
+        self.assertEqual({"huts": 1, "stores": 1}, self.fakeUpstream.requestCounts)
+
+    @patch("deliveryAPI.models.FoodModels.UELocationCache")
+    async def test_uber_eats(self, UELocationCache):
+        UELocationCache.getCacheLocation = AsyncMock(return_value=None)
+
+        self.assertTrue(await McDonalds("AB1 2CD").canDeliver())
+
+        self.assertEqual({
+            "locationAutocomplete": 1, "deliveryLocation": 1, "setTargetLocation": 1,
+            "searchSuggestions": 1
+        }, self.fakeUpstream.requestCounts)
+
+
+class Test_FakeUpstream_errors(FakeUpstreamTestCase):
+
+    behaviour = RouteBehaviour(latencyMs=0, errorRate=1)
+
+    @patch("deliveryAPI.models.RetryPolicy.settings")
+    async def test_error_rate(self, settings_):
+        settings_.retry_attempts = {}
+        settings_.retry_max_attempts = 1
+        settings_.retry_budget_max_tokens = 10
+        settings_.retry_budget_ratio = 0
+        settings_.hedge_services = []
+
+        with self.assertRaises(ClientResponseError) as context:
+            await PizzaHut("AB1 2CD").canDeliver()
+
+        self.assertEqual(503, context.exception.status)
@@ -0,0 +1,82 @@
+import re
+from unittest import TestCase
+
+from deliveryAPI.benchmark.LoadTest import percentile, generatePostcodes, compareToBaseline
+
+
+class Test_percentile(TestCase):
+
+    def test_ok(self):
+        values = [float(value) for value in range(100, 0, -1)]
+
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(100, percentile(values, 100))
+
+    def test_single_value(self):
+        self.assertEqual(3, percentile([3], 99))
+
+    def test_no_values(self):
+        self.assertIsNone(percentile([], 50))
+
+
+class Test_generatePostcodes(TestCase):
+
+    def test_ok(self):
+        postcodes = generatePostcodes(50)
+
+        self.assertEqual(50, len(set(postcodes)))
+        for postcode in postcodes:
+            self.assertRegex(postcode, re.compile(r"^[A-Z]{2}\d{1,2} \d[A-Z]{2}$"))
+
+    def test_deterministic(self):
+        self.assertEqual(generatePostcodes(10, seed=1), generatePostcodes(10, seed=1))
+
+
+class Test_compareToBaseline(TestCase):
+
+    def setUp(self):
+        self.baseline = {"scenarios": [{
+            "name": "all", "p50_ms": 10, "p95_ms": 20, "p99_ms": 40,
+            "throughput_rps": 100, "upstream_calls_per_request": 1
+        }]}
+
+    def scenario(self, **overrides):
+        return {"scenarios": [dict(self.baseline["scenarios"][0], **overrides)]}
+
+    def test_within_tolerance(self):
+        report = self.scenario(p95_ms=21, throughput_rps=95)
+
+        self.assertEqual([], compareToBaseline(report, self.baseline, 0.1))
+
+    def test_slower(self):
+        report = self.scenario(p99_ms=50)
+
+        self.assertEqual(["all: p99_ms 40 -> 50"], compareToBaseline(report, self.baseline, 0.1))
+
+    def test_lower_throughput(self):
+        report = self.scenario(throughput_rps=80)
+
+        self.assertEqual(
+            ["all: throughput_rps 100.0 -> 80.0"], compareToBaseline(report, self.baseline, 0.1)
+        )
+
+    def test_more_upstream_calls(self):
+        report = self.scenario(upstream_calls_per_request=2)
+
+        self.assertEqual(
+            ["all: upstream_calls_per_request 1 -> 2"], compareToBaseline(report, self.baseline, 0.1)
+        )
+
+    def test_more_cpu(self):
+        baseline = self.scenario(api_cpu_ms_per_request=1.0)
+        report = self.scenario(api_cpu_ms_per_request=1.5)
+
+        self.assertEqual(
+            ["all: api_cpu_ms_per_request 1.0 -> 1.5"], compareToBaseline(report, baseline, 0.1)
+        )
+
+    def test_new_scenario_ignored(self):
+        report = self.scenario(name="pizzahut", p99_ms=1000)
+
+        self.assertEqual([], compareToBaseline(report, self.baseline, 0.1))
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch
+
+from fakeredis import FakeServer, aioredis
+
+from deliveryAPI.cache.CacheStore import (
+    MemoryStore, FileStore, RedisStore, createStore
+)
+
+
+MODULE_PATH = "deliveryAPI.cache.CacheStore."
+
+
+class CacheStoreTests:
+    """
+    The behaviour every store has to share, run against each of them.
+    """
+
+    def createStore(self):
+        raise NotImplementedError
+
+    async def asyncSetUp(self):
+        self.store = self.createStore()
+
+    async def asyncTearDown(self):
+        await self.store.close()
+
+    async def test_set_get(self):
+        await self.store.set("key", b"value")
+
+        self.assertEqual(b"value", await self.store.get("key"))
+
+    async def test_missing(self):
+        self.assertIsNone(await self.store.get("key"))
+
+    async def test_overwrite(self):
+        await self.store.set("key", b"value")
+        await self.store.set("key", b"other")
+
+        self.assertEqual(b"other", await self.store.get("key"))
+
+    async def test_delete(self):
+        await self.store.set("key", b"value")
+
+        await self.store.delete("key")
+
+        self.assertIsNone(await self.store.get("key"))
+
+    async def test_expiry(self):
+        await self.store.set("key", b"value", ttl=0.05)
+        self.assertEqual(b"value", await self.store.get("key"))
+
+        await asyncio.sleep(0.1)
+
+        self.assertIsNone(await self.store.get("key"))
+
+    async def test_lock(self):
+        token = await self.store.acquireLock("lock", 10)
+        self.assertIsNotNone(token)
+        self.assertIsNone(await self.store.acquireLock("lock", 10))
+
+        await self.store.releaseLock("lock", token)
+
+        self.assertIsNotNone(await self.store.acquireLock("lock", 10))
+
+    async def test_lock_expiry(self):
+        await self.store.acquireLock("lock", 0.05)
+
+        await asyncio.sleep(0.1)
+
+        self.assertIsNotNone(await self.store.acquireLock("lock", 10))
+
+    async def test_release_by_other_holder(self):
+        expiredToken = await self.store.acquireLock("lock", 0.05)
+        await asyncio.sleep(0.1)
+        token = await self.store.acquireLock("lock", 10)
+
+        await self.store.releaseLock("lock", expiredToken)
+
+        self.assertNotEqual(expiredToken, token)
+        self.assertIsNone(await self.store.acquireLock("lock", 10))
+
+
+class Test_MemoryStore(CacheStoreTests, IsolatedAsyncioTestCase):
+
+    def createStore(self):
+        return MemoryStore()
+
+    async def test_sweep(self):
+        await self.store.set("expired", b"value", ttl=0.05)
+        await self.store.set("kept", b"value")
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(1, await self.store.sweep())
+        self.assertEqual(b"value", await self.store.get("kept"))
+        self.assertEqual(["kept"], list(self.store._entries))
+
+
+class Test_FileStore(CacheStoreTests, IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tempDir.cleanup)
+        self._path = os.path.join(self._tempDir.name, "cache.sqlite3")
+
+    def createStore(self):
+        return FileStore(self._path)
+
+    async def test_sweep(self):
+        await self.store.set("expired", b"value", ttl=0.05)
+        await self.store.set("kept", b"value")
+        await asyncio.sleep(0.1)
+
+        self.assertEqual(1, await self.store.sweep())
+        self.assertEqual(b"value", await self.store.get("kept"))
+
+    async def test_shared_between_stores(self):
+        other = FileStore(self._path)
+        try:
+            await self.store.set("key", b"value")
+            self.assertIsNotNone(await self.store.acquireLock("lock", 10))
+
+            self.assertEqual(b"value", await other.get("key"))
+            self.assertIsNone(await other.acquireLock("lock", 10))
+        finally:
+            await other.close()
+
+    async def test_survives_close(self):
+        await self.store.set("key", b"value")
+        await self.store.close()
+
+        reopened = FileStore(self._path)
+        try:
+            self.assertEqual(b"value", await reopened.get("key"))
+        finally:
+            await reopened.close()
+
+
+class Test_RedisStore(CacheStoreTests, IsolatedAsyncioTestCase):
+
+    def createStore(self):
+        return RedisStore(aioredis.FakeRedis(server=FakeServer()))
+
+    async def test_shared_between_stores(self):
+        server = FakeServer()
+        store = RedisStore(aioredis.FakeRedis(server=server))
+        other = RedisStore(aioredis.FakeRedis(server=server))
+
+        await store.set("key", b"value")
+        self.assertIsNotNone(await store.acquireLock("lock", 10))
+
+        self.assertEqual(b"value", await other.get("key"))
+        self.assertIsNone(await other.acquireLock("lock", 10))
+
+
+class Test_createStore(TestCase):
+
+    def test_memory(self):
+        self.assertIsInstance(createStore("memory://"), MemoryStore)
+
+    def test_file(self):
+        store = createStore("file://UE_Postcodes.sqlite3")
+
+        self.assertIsInstance(store, FileStore)
+        self.assertEqual("UE_Postcodes.sqlite3", store._path)
+
+    def test_absolute_file(self):
+        self.assertEqual("/var/cache/api.sqlite3", createStore("file:///var/cache/api.sqlite3")._path)
+
+    @patch(MODULE_PATH + "RedisStore.fromUrl")
+    def test_redis(self, fromUrl):
+        store = createStore("redis://cache:6379/0")
+
+        fromUrl.assert_called_once_with("redis://cache:6379/0")
+        self.assertEqual(fromUrl.return_value, store)
+
+    def test_unknown(self):
+        with self.assertRaisesRegex(ValueError, "unknown cache store"):
+            createStore("memcached://cache:11211")
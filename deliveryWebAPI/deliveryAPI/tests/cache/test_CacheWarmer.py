@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock, call
+
+from deliveryAPI.cache.CacheWarmer import CacheWarmer, HotPostcodes
+
+MODULE_PATH = "deliveryAPI.cache.CacheWarmer."
+
+
+class Test_HotPostcodes_top(TestCase):
+
+    def test_ok(self):
+        hotPostcodes = HotPostcodes(maxSize=10)
+        for postcode in ["SW1A 1AA", "NW9 9ED", "NW9 9ED", "M1 1AE", "NW9 9ED", "M1 1AE"]:
+            hotPostcodes.record(postcode)
+
+        self.assertEqual(["NW9 9ED", "M1 1AE"], hotPostcodes.top(2))
+
+    def test_pruned(self):
+        hotPostcodes = HotPostcodes(maxSize=1)
+        hotPostcodes.record("NW9 9ED")
+        hotPostcodes.record("NW9 9ED")
+        hotPostcodes.record("SW1A 1AA")
+
+        hotPostcodes.record("M1 1AE")
+
+        self.assertEqual(["NW9 9ED"], hotPostcodes.top(10))
+
+    def test_decay(self):
+        hotPostcodes = HotPostcodes(maxSize=10)
+        for _ in range(4):
+            hotPostcodes.record("NW9 9ED")
+        hotPostcodes.record("SW1A 1AA")
+
+        hotPostcodes.decay(0.05)
+
+        self.assertEqual(["NW9 9ED"], hotPostcodes.top(10))
+
+
+class Test_HotPostcodes_load(TestCase):
+
+    def test_ok(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Hot_Postcodes.json")
+            with open(path, "w") as stateFile:
+                json.dump({"NW9 9ED": 3, "SW1A 1AA": 1}, stateFile)
+            hotPostcodes = HotPostcodes(maxSize=10)
+
+            hotPostcodes.load(path)
+
+        self.assertEqual(["NW9 9ED", "SW1A 1AA"], hotPostcodes.top(10))
+
+    def test_missing(self):
+        hotPostcodes = HotPostcodes(maxSize=10)
+
+        hotPostcodes.load("/does/not/exist.json")
+
+        self.assertEqual(0, len(hotPostcodes))
+
+
+@patch(MODULE_PATH + "settings.warm_checks_per_second", 1000)
+@patch(MODULE_PATH + "settings.warm_top_postcodes", 2)
+class Test_CacheWarmer_warm(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hotPostcodes = HotPostcodes(maxSize=10)
+        for postcode in ["NW9 9ED", "NW9 9ED", "SW1A 1AA", "SW1A 1AA", "M1 1AE"]:
+            self.hotPostcodes.record(postcode)
+        self.warmPostcode = AsyncMock(return_value=2)
+        self.cacheWarmer = CacheWarmer(self.hotPostcodes, self.warmPostcode)
+
+    @patch(MODULE_PATH + "settings.warm_postcodes", [])
+    async def test_hot_postcodes(self):
+        self.assertEqual(4, await self.cacheWarmer.warm())
+
+        self.assertEqual(
+            [call("NW9 9ED"), call("SW1A 1AA")], self.warmPostcode.call_args_list
+        )
+
+    @patch(MODULE_PATH + "settings.warm_postcodes", ["b338th", "not a postcode", "nw99ed"])
+    async def test_configured_postcodes(self):
+        await self.cacheWarmer.warm()
+
+        self.assertEqual(
+            [call("B33 8TH"), call("NW9 9ED"), call("SW1A 1AA")],
+            self.warmPostcode.call_args_list
+        )
+
+    @patch(MODULE_PATH + "settings.warm_postcodes", [])
+    @patch(MODULE_PATH + "asyncio.sleep")
+    async def test_rate_limited(self, sleep):
+        self.warmPostcode.side_effect = [3, 0]
+
+        await self.cacheWarmer.warm()
+
+        # nothing was checked for the second postcode, so there is nothing to wait for
+        sleep.assert_called_once_with(3 / 1000)
+
+
+class Test_CacheWarmer_open(IsolatedAsyncioTestCase):
+
+    async def test_state_persisted(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "Hot_Postcodes.json")
+            with patch(MODULE_PATH + "settings.warm_state_file", path):
+                warmPostcode = AsyncMock(return_value=0)
+                cacheWarmer = CacheWarmer(HotPostcodes(maxSize=10), warmPostcode)
+                await cacheWarmer.open()
+                cacheWarmer.hotPostcodes.record("NW9 9ED")
+                await asyncio.sleep(0)
+                await cacheWarmer.close()
+
+                reopenedWarmer = CacheWarmer(HotPostcodes(maxSize=10), warmPostcode)
+                await reopenedWarmer.open()
+                await reopenedWarmer.close()
+
+        self.assertEqual(["NW9 9ED"], reopenedWarmer.hotPostcodes.top(10))
+        warmPostcode.assert_called_with("NW9 9ED")
+
+
+class Test_CacheWarmer_workers(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = patch(
+            MODULE_PATH + "settings.warm_state_file",
+            os.path.join(directory.name, "Hot_Postcodes.json")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_one_worker_warms(self):
+        firstWarmer = CacheWarmer(HotPostcodes(maxSize=10), AsyncMock(return_value=0))
+        secondWarmer = CacheWarmer(HotPostcodes(maxSize=10), AsyncMock(return_value=0))
+
+        self.assertTrue(firstWarmer.isWarming())
+        self.assertFalse(secondWarmer.isWarming())
+        await firstWarmer.close()
+        self.assertTrue(secondWarmer.isWarming())
+        await secondWarmer.close()
+
+    async def test_counts_merged(self):
+        firstWarmer = CacheWarmer(HotPostcodes(maxSize=10), AsyncMock(return_value=0))
+        secondWarmer = CacheWarmer(HotPostcodes(maxSize=10), AsyncMock(return_value=0))
+        firstWarmer.hotPostcodes.record("NW9 9ED")
+        firstWarmer.hotPostcodes.record("NW9 9ED")
+        secondWarmer.hotPostcodes.record("SW1A 1AA")
+        secondWarmer.hotPostcodes.record("NW9 9ED")
+
+        await firstWarmer._saveState()
+        await secondWarmer._saveState()
+        await firstWarmer._saveState()
+
+        self.assertEqual(
+            {"NW9 9ED": 3, "SW1A 1AA": 1}, json.loads(firstWarmer.hotPostcodes.dumps())
+        )
+        self.assertEqual(
+            firstWarmer.hotPostcodes.dumps(), secondWarmer.hotPostcodes.dumps()
+        )
+
+    async def test_decayed_by_warming_worker(self):
+        cacheWarmer = CacheWarmer(HotPostcodes(maxSize=10), AsyncMock(return_value=0))
+        for _ in range(4):
+            cacheWarmer.hotPostcodes.record("NW9 9ED")
+
+        await cacheWarmer._saveState(0.5)
+
+        self.assertEqual(["NW9 9ED"], cacheWarmer.hotPostcodes.top(10))
+        self.assertEqual({"NW9 9ED": 2}, json.loads(cacheWarmer.hotPostcodes.dumps()))
@@ -0,0 +1,90 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.cache.CatchmentIndex import CatchmentIndex
+
+MODULE_PATH = "deliveryAPI.cache.CatchmentIndex."
+
+
+@patch(MODULE_PATH + "settings.catchment_min_observations", 2)
+@patch(MODULE_PATH + "settings.catchment_ttl_seconds", 60)
+class Test_CatchmentIndex_lookup(TestCase):
+
+    def setUp(self):
+        self.catchmentIndex = CatchmentIndex("Test")
+
+    def test_unknown(self):
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9ED"))
+
+    def test_too_few_observations(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_inside(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("NW9 9EF", True, "501")
+
+        self.assertTrue(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_outside(self):
+        self.catchmentIndex.record("NW9 9ED", False, "501")
+        self.catchmentIndex.record("NW9 9EF", False, "502")
+
+        self.assertFalse(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_mixed_answers_ambiguous(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("NW9 9EF", False)
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_different_stores_ambiguous(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("NW9 9EF", True, "502")
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_same_postcode_counted_once(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("nw99ed", True, "501")
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9EE"))
+
+    def test_other_sector(self):
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("NW9 9EF", True, "501")
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 8EE"))
+
+    @patch(MODULE_PATH + "time")
+    def test_expired(self, time_):
+        time_.monotonic.return_value = 0
+        self.catchmentIndex.record("NW9 9ED", True, "501")
+        self.catchmentIndex.record("NW9 9EF", True, "501")
+
+        time_.monotonic.return_value = 61
+
+        self.assertIsNone(self.catchmentIndex.lookup("NW9 9EE"))
+        self.assertEqual(0, len(self.catchmentIndex))
+
+
+class Test_CatchmentIndex_record(TestCase):
+
+    @patch(MODULE_PATH + "settings.catchment_max_sectors", 2)
+    def test_max_sectors(self):
+        catchmentIndex = CatchmentIndex("Test")
+
+        catchmentIndex.record("NW9 9ED", True)
+        catchmentIndex.record("NW9 8ED", True)
+        catchmentIndex.record("NW9 7ED", True)
+
+        self.assertEqual(2, len(catchmentIndex))
+        self.assertNotIn("NW9 9", catchmentIndex._sectors)
+
+    def test_not_a_postcode(self):
+        catchmentIndex = CatchmentIndex("Test")
+
+        catchmentIndex.record("ABCD 1EF", True)
+
+        self.assertEqual(0, len(catchmentIndex))
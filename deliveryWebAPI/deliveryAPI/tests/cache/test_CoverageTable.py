@@ -0,0 +1,160 @@
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.cache.CoverageTable import CoverageTable, CoverageTableBuilder
+
+MODULE_PATH = "deliveryAPI.cache.CoverageTable."
+
+
+class CoverageTableTestCase(TestCase):
+
+    def setUp(self):
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+        self.path = os.path.join(tempDir.name, "Coverage_Table.bin")
+        self.builder = CoverageTableBuilder()
+        self.coverageTable = CoverageTable()
+        self.addCleanup(self.coverageTable.close)
+
+    def openTable(self):
+        self.builder.write(self.path)
+        self.coverageTable.open(self.path)
+        return self.coverageTable
+
+
+@patch(MODULE_PATH + "settings.coverage_table_max_age_seconds", 3600)
+class Test_CoverageTable_lookup(CoverageTableTestCase):
+
+    def test_postcodes(self):
+        now = time.time()
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, now)
+        self.builder.add("Pizza Hut", "nw99ed", False, now)
+        self.builder.add("Dominos", "NW9 9ED", True, now)
+
+        coverageTable = self.openTable()
+
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "SW1A 1AA"))
+        self.assertIs(False, coverageTable.lookup("Pizza Hut", "NW9 9ED"))
+        self.assertTrue(coverageTable.lookup("Dominos", "NW9 9ED"))
+
+    def test_unknown(self):
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, time.time())
+        self.builder.add("Dominos", "NW9 9ED", True, time.time())
+
+        coverageTable = self.openTable()
+
+        self.assertIsNone(coverageTable.lookup("Pizza Hut", "M1 1AE"))
+        self.assertIsNone(coverageTable.lookup("Dominos", "SW1A 1AA"))
+        self.assertIsNone(coverageTable.lookup("Uber Eats KFC", "SW1A 1AA"))
+
+    def test_stale(self):
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, time.time() - 7200)
+        self.builder.add("Dominos", "SW1A 1AA", True, time.time())
+
+        coverageTable = self.openTable()
+
+        self.assertIsNone(coverageTable.lookup("Pizza Hut", "SW1A 1AA"))
+        self.assertTrue(coverageTable.lookup("Dominos", "SW1A 1AA"))
+
+    def test_later_answer(self):
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, time.time())
+        self.builder.add("Pizza Hut", "SW1A 1AA", False, time.time())
+
+        self.assertIs(False, self.openTable().lookup("Pizza Hut", "SW1A 1AA"))
+
+    def test_many(self):
+        now = time.time()
+        postcodes = [f"M{district} {sector}A{unit}" for district in range(1, 20)
+                     for sector in range(10) for unit in "ABDEF"]
+        for number, postcode in enumerate(postcodes):
+            self.builder.add("Pizza Hut", postcode, number % 3 == 0, now)
+
+        coverageTable = self.openTable()
+
+        self.assertEqual(
+            [number % 3 == 0 for number in range(len(postcodes))],
+            [coverageTable.lookup("Pizza Hut", postcode) for postcode in postcodes]
+        )
+
+    def test_not_open(self):
+        self.assertIsNone(CoverageTable().lookup("Pizza Hut", "SW1A 1AA"))
+
+
+@patch(MODULE_PATH + "settings.coverage_table_max_age_seconds", 3600)
+class Test_CoverageTableBuilder_addSectors(CoverageTableTestCase):
+
+    def test_agreeing(self):
+        for postcode in ["NW9 9ED", "NW9 9EF"]:
+            self.builder.add("Pizza Hut", postcode, True, time.time())
+        self.builder.add("Dominos", "NW9 9ED", False, time.time())
+
+        self.builder.addSectors(minPostcodes=2)
+        coverageTable = self.openTable()
+
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "NW9 9EE"))
+        self.assertIsNone(coverageTable.lookup("Dominos", "NW9 9EE"))
+
+    def test_disagreeing(self):
+        self.builder.add("Pizza Hut", "NW9 9ED", True, time.time())
+        self.builder.add("Pizza Hut", "NW9 9EF", False, time.time())
+
+        self.builder.addSectors(minPostcodes=2)
+        coverageTable = self.openTable()
+
+        self.assertIsNone(coverageTable.lookup("Pizza Hut", "NW9 9EE"))
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "NW9 9ED"))
+
+    def test_postcode_first(self):
+        for postcode in ["NW9 9ED", "NW9 9EF", "NW9 9EG"]:
+            self.builder.add("Pizza Hut", postcode, False, time.time())
+
+        self.builder.addSectors(minPostcodes=2)
+        self.builder.add("Pizza Hut", "NW9 9EH", True, time.time())
+        coverageTable = self.openTable()
+
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "NW9 9EH"))
+        self.assertIs(False, coverageTable.lookup("Pizza Hut", "NW9 9EZ"))
+
+
+class Test_CoverageTable_open(CoverageTableTestCase):
+
+    def test_not_a_table(self):
+        with open(self.path, "wb") as tableFile:
+            tableFile.write(b"\0" * 64)
+
+        with self.assertRaisesRegex(ValueError, "not a coverage table"):
+            self.coverageTable.open(self.path)
+
+    def test_replaced(self):
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, time.time())
+        coverageTable = self.openTable()
+        builtAt = coverageTable.builtAt
+
+        other = CoverageTableBuilder()
+        other.add("Pizza Hut", "SW1A 1AA", False, time.time())
+        other.write(self.path)
+
+        # the open table keeps the old file
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "SW1A 1AA"))
+        coverageTable.open(self.path)
+        self.assertIs(False, coverageTable.lookup("Pizza Hut", "SW1A 1AA"))
+        self.assertLessEqual(builtAt, coverageTable.builtAt)
+
+    def test_close(self):
+        self.builder.add("Pizza Hut", "SW1A 1AA", True, time.time())
+        coverageTable = self.openTable()
+
+        coverageTable.close()
+
+        self.assertIsNone(coverageTable.lookup("Pizza Hut", "SW1A 1AA"))
+        self.assertEqual(0, len(coverageTable))
+
+
+class Test_CoverageTableBuilder_add(TestCase):
+
+    def test_long_name(self):
+        with self.assertRaisesRegex(ValueError, "too long"):
+            CoverageTableBuilder().add("x" * 65, "SW1A 1AA", True, time.time())
@@ -1,23 +1,45 @@
-from unittest import TestCase
-from unittest.mock import patch, MagicMock
+import asyncio
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
 
 from deliveryAPI.cache.LocationCache import UELocationCache
+from deliveryAPI.cache.CacheStore import MemoryStore
+from deliveryAPI.metrics import LOCATION_CACHE
 
 
 MODULE_PATH = "deliveryAPI.cache.LocationCache."
 
 
-@patch(MODULE_PATH + "dbm")
+class UELocationCacheTestCase(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._store = MemoryStore()
+        storePatch = patch.object(UELocationCache, "_store", self._store)
+        storePatch.start()
+        self.addCleanup(storePatch.stop)
+
+    async def asyncTearDown(self):
+        await UELocationCache.close()
+
+    def _writeDb(self, postcode, locationData):
+        self._store._entries["ue_location:" + postcode] = (json.dumps(locationData).encode(), None)
+
+    def _readDb(self):
+        return {
+            key[len("ue_location:"):]: json.loads(value)
+            for key, (value, _expiry) in self._store._entries.items()
+        }
+
+
 @patch(MODULE_PATH + "time")
-class Test_UELocationCache_getCacheLocation(TestCase):
+class Test_UELocationCache_getCacheLocation(UELocationCacheTestCase):
 
-    def test_valid_cache(self, time_, dbm):
+    async def test_valid_cache(self, time_):
         time_.time.return_value = 604800
-        dbCache = MagicMock()
-        dbCache.get.return_value = '{"example": "data", "create_date": 0}'
-        dbm.open.return_value.__enter__.return_value = dbCache
+        self._writeDb("AB12ABC", {"example": "data", "create_date": 0})
 
-        location = UELocationCache.getCacheLocation("AB12ABC")
+        location = await UELocationCache.getCacheLocation("AB12ABC")
 
         self.assertEqual(
             {
@@ -26,40 +48,97 @@ class Test_UELocationCache_getCacheLocation(TestCase):
             location
         )
 
-    def test_no_postcode_cache(self, _time, dbm):
-        dbCache = MagicMock()
-        dbCache.get.return_value = None
-        dbm.open.return_value.__enter__.return_value = dbCache
+    async def test_no_postcode_cache(self, _time):
+        location = await UELocationCache.getCacheLocation("AB12ABC")
+
+        self.assertIsNone(location)
 
-        location = UELocationCache.getCacheLocation("AB12ABC")
+    async def test_store_error(self, _time):
+        with patch.object(self._store, "get", AsyncMock(side_effect=ConnectionError)):
+            location = await UELocationCache.getCacheLocation("AB12ABC")
 
         self.assertIsNone(location)
 
-    def test_expired(self, time_, dbm):
+    async def test_expired(self, time_):
         time_.time.return_value = 604801
-        dbCache = MagicMock()
-        dbCache.get.return_value = '{"example": "data", "create_date": 0}'
-        dbm.open.return_value.__enter__.return_value = dbCache
+        self._writeDb("AB12ABC", {"example": "data", "create_date": 0})
 
-        location = UELocationCache.getCacheLocation("AB12ABC")
+        location = await UELocationCache.getCacheLocation("AB12ABC")
 
         self.assertIsNone(location)
-        dbCache.__delitem__.assert_called_once_with("AB12ABC")
+        self.assertNotIn("AB12ABC", UELocationCache._memory)
+
+    @patch("deliveryAPI.metrics.settings.metrics_enabled", True)
+    async def test_memory_tier(self, time_):
+        LOCATION_CACHE.clear()
+        time_.time.return_value = 1234
+        UELocationCache.setCacheLocation("AB12ABC", {"example": "data"})
+
+        with patch.object(UELocationCache, "_readLocation") as readLocation:
+            location = await UELocationCache.getCacheLocation("AB12ABC")
+
+        self.assertEqual({"example": "data"}, location)
+        readLocation.assert_not_called()
+        self.assertEqual(1, LOCATION_CACHE.value("memory_hit"))
+
+    async def test_returned_copy(self, time_):
+        time_.time.return_value = 1234
+        UELocationCache.setCacheLocation("AB12ABC", {"example": "data"})
+
+        location = await UELocationCache.getCacheLocation("AB12ABC")
+        location["example"] = "changed"
+
+        self.assertEqual({"example": "data"}, await UELocationCache.getCacheLocation("AB12ABC"))
+
+    @patch(MODULE_PATH + "settings")
+    async def test_memory_lru_bound(self, settings, time_):
+        settings.ue_location_cache_memory_size = 1
+        time_.time.return_value = 1234
+
+        UELocationCache.setCacheLocation("AB12ABC", {"example": "data"})
+        UELocationCache.setCacheLocation("CD34DEF", {"example": "data"})
+        await asyncio.wait(UELocationCache._writes)
+
+        self.assertEqual(["CD34DEF"], list(UELocationCache._memory))
+        self.assertEqual({"example": "data"}, await UELocationCache.getCacheLocation("AB12ABC"))
 
 
-@patch(MODULE_PATH + "dbm")
 @patch(MODULE_PATH + "time")
-class Test_UELocationCache_setCacheLocation(TestCase):
+class Test_UELocationCache_setCacheLocation(UELocationCacheTestCase):
 
-    def test_ok(self, time_, dbm):
+    async def test_ok(self, time_):
         time_.time.return_value = 1234
-        dbm.open.return_value.__enter__.return_value = {}
+        location = {"example": "data"}
 
-        UELocationCache.setCacheLocation(
-            "AB12ABC", {"example": "data"}
-        )
+        UELocationCache.setCacheLocation("AB12ABC", location)
+        await UELocationCache.close()
 
         self.assertEqual(
-            '{"example": "data", "create_date": 1234}',
-            dbm.open.return_value.__enter__.return_value["AB12ABC"]
+            {"AB12ABC": {"example": "data", "create_date": 1234}},
+            self._readDb()
         )
+        self.assertEqual({"example": "data"}, location)
+
+    async def test_store_error(self, time_):
+        time_.time.return_value = 1234
+
+        with patch.object(self._store, "set", AsyncMock(side_effect=ConnectionError)):
+            UELocationCache.setCacheLocation("AB12ABC", {"example": "data"})
+            await UELocationCache.close()
+
+        self.assertEqual({}, self._readDb())
+
+
+@patch(MODULE_PATH + "time")
+class Test_UELocationCache_sweep(UELocationCacheTestCase):
+
+    async def test_ok(self, time_):
+        time_.time.return_value = 604801
+        UELocationCache._memory["AB12ABC"] = {"example": "data", "create_date": 0}
+        UELocationCache._memory["CD34DEF"] = {"example": "data", "create_date": 2}
+
+        with patch.object(self._store, "sweep", AsyncMock(return_value=3)):
+            removed = await UELocationCache.sweep()
+
+        self.assertEqual(3, removed)
+        self.assertEqual(["CD34DEF"], list(UELocationCache._memory))
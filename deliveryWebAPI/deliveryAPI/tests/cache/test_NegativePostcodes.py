@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from deliveryAPI.cache.NegativePostcodes import ALL_SERVICES, NegativePostcodes
+
+MODULE_PATH = "deliveryAPI.cache.NegativePostcodes."
+
+
+class NegativePostcodesTestCase(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+        self.path = os.path.join(tempDir.name, "Negative_Postcodes.bin")
+        patcher = patch(MODULE_PATH + "settings.negative_postcodes_file", self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        await NegativePostcodes.open()
+
+    async def asyncTearDown(self):
+        await NegativePostcodes.close()
+
+
+@patch(MODULE_PATH + "settings.negative_postcodes_ttl_seconds", 3600)
+class Test_NegativePostcodes_isNegative(NegativePostcodesTestCase):
+
+    async def test_all_services(self):
+        NegativePostcodes.add(ALL_SERVICES, "ABCD 1EF")
+
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+        self.assertTrue(NegativePostcodes.isNegative("Pizza Hut", "ABCD 1EF"))
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "SW1A 1AA"))
+
+    async def test_one_service(self):
+        NegativePostcodes.add("Dominos", "ABCD 1EF")
+
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+        self.assertFalse(NegativePostcodes.isNegative("Pizza Hut", "ABCD 1EF"))
+
+    async def test_sorted(self):
+        for postcode in ("SW1A 1AA", "M1 1AE", "NW9 9ED", "B1 1AA"):
+            NegativePostcodes.add("Dominos", postcode)
+
+        for postcode in ("SW1A 1AA", "M1 1AE", "NW9 9ED", "B1 1AA"):
+            self.assertTrue(NegativePostcodes.isNegative("Dominos", postcode))
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "M1 1AA"))
+        self.assertEqual({"Dominos": 4}, NegativePostcodes.stats())
+
+    async def test_expired(self):
+        with patch(MODULE_PATH + "settings.negative_postcodes_ttl_seconds", -1):
+            NegativePostcodes.add("Dominos", "ABCD 1EF")
+
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+
+    @patch(MODULE_PATH + "settings.negative_postcodes_max_entries", 1)
+    async def test_max_entries(self):
+        NegativePostcodes.add("Dominos", "ABCD 1EF")
+        NegativePostcodes.add("Dominos", "SW1A 1AA")
+
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "SW1A 1AA"))
+
+    async def test_not_open(self):
+        await NegativePostcodes.close()
+
+        NegativePostcodes.add("Dominos", "ABCD 1EF")
+
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+
+
+@patch(MODULE_PATH + "settings.negative_postcodes_ttl_seconds", 3600)
+class Test_NegativePostcodes_save(NegativePostcodesTestCase):
+
+    async def test_reopened(self):
+        NegativePostcodes.add(ALL_SERVICES, "ABCD 1EF")
+        NegativePostcodes.add("Dominos", "SW1A 1AA")
+
+        await NegativePostcodes.close()
+        self.assertFalse(NegativePostcodes.isNegative("Dominos", "SW1A 1AA"))
+        await NegativePostcodes.open()
+
+        self.assertTrue(NegativePostcodes.isNegative("Pizza Hut", "ABCD 1EF"))
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "SW1A 1AA"))
+        self.assertFalse(NegativePostcodes.isNegative("Pizza Hut", "SW1A 1AA"))
+
+    async def test_merged_with_other_workers(self):
+        NegativePostcodes.add("Dominos", "ABCD 1EF")
+        await NegativePostcodes.save()
+        # another worker that opened before this one saved
+        await NegativePostcodes.close()
+        await NegativePostcodes.open()
+        NegativePostcodes._scopes = {}
+        NegativePostcodes.add("Dominos", "SW1A 1AA")
+
+        await NegativePostcodes.save()
+
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "ABCD 1EF"))
+        self.assertTrue(NegativePostcodes.isNegative("Dominos", "SW1A 1AA"))
+
+    async def test_expired_dropped(self):
+        with patch(MODULE_PATH + "settings.negative_postcodes_ttl_seconds", 1):
+            NegativePostcodes.add("Dominos", "ABCD 1EF")
+        NegativePostcodes.add("Dominos", "SW1A 1AA")
+
+        with patch(MODULE_PATH + "time.time", return_value=time.time() + 60):
+            await NegativePostcodes.save()
+
+        self.assertEqual({"Dominos": 1}, NegativePostcodes.stats())
+
+    async def test_not_ours(self):
+        await NegativePostcodes.close()
+        with open(self.path, "wb") as filterFile:
+            filterFile.write(b"not a filter")
+
+        await NegativePostcodes.open()
+
+        self.assertEqual({}, NegativePostcodes.stats())
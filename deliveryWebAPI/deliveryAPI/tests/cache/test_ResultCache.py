@@ -0,0 +1,436 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch, AsyncMock
+
+from fakeredis import FakeServer, aioredis
+
+from deliveryAPI.cache.ResultCache import DeliveryResultCache, CacheEntry
+from deliveryAPI.cache.CacheStore import MemoryStore, RedisStore
+
+
+MODULE_PATH = "deliveryAPI.cache.ResultCache."
+
+
+@patch(MODULE_PATH + "time")
+class Test_DeliveryResultCache_get(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = DeliveryResultCache(maxSize=2)
+
+    async def test_miss_then_hit(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(return_value=True)
+
+        self.assertTrue(await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        self.assertTrue(await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        fetch.assert_called_once_with()
+        self.assertEqual(
+            {
+                "Pizza Hut": {
+                    "hits": 1, "misses": 1, "coalesced": 0, "refreshes": 0, "stale": 0,
+                    "evictions": 0, "shared_hits": 0, "shared_waits": 0
+                }
+            },
+            self.cache.stats
+        )
+
+    async def test_expired(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=[True, False])
+        await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+        time_.time.return_value = 10
+
+        self.assertFalse(await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertEqual(2, fetch.call_count)
+
+    async def test_negative_ttl(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(return_value=False)
+        await self.cache.get("Dominos", "AB1 2CD", fetch, 10, 5)
+        time_.time.return_value = 4
+
+        self.assertFalse(await self.cache.get("Dominos", "AB1 2CD", fetch, 10, 5))
+        time_.time.return_value = 5
+        self.assertFalse(await self.cache.get("Dominos", "AB1 2CD", fetch, 10, 5))
+
+        self.assertEqual(2, fetch.call_count)
+
+    async def test_zero_ttl_not_cached(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(return_value=True)
+
+        await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 0, 0)
+
+        self.assertEqual(0, len(self.cache))
+
+    async def test_lru_eviction(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(return_value=True)
+        await self.cache.get("Pizza Hut", "AB1", fetch, 10, 5)
+        await self.cache.get("Pizza Hut", "AB2", fetch, 10, 5)
+        await self.cache.get("Pizza Hut", "AB1", fetch, 10, 5)
+
+        await self.cache.get("Pizza Hut", "AB3", fetch, 10, 5)
+
+        self.assertEqual(2, len(self.cache))
+        await self.cache.get("Pizza Hut", "AB1", fetch, 10, 5)
+        self.assertEqual(3, fetch.call_count)
+        self.assertEqual(1, self.cache.stats["Pizza Hut"]["evictions"])
+
+    async def test_coalesced(self, time_):
+        time_.time.return_value = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return True
+        fetchMock = AsyncMock(side_effect=fetch)
+
+        waiters = [
+            asyncio.create_task(self.cache.get("Pizza Hut", "AB1 2CD", fetchMock, 10, 5))
+            for _ in range(100)
+        ]
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual([True] * 100, await asyncio.gather(*waiters))
+        fetchMock.assert_called_once_with()
+        self.assertEqual(99, self.cache.stats["Pizza Hut"]["coalesced"])
+
+    async def test_cancelled_waiter(self, time_):
+        time_.time.return_value = 0
+        release = asyncio.Event()
+        fetch = AsyncMock(side_effect=release.wait)
+
+        waiter1 = asyncio.create_task(self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        waiter2 = asyncio.create_task(self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        await asyncio.sleep(0)
+        waiter1.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertTrue(await waiter2)
+        self.assertTrue(waiter1.cancelled())
+
+    async def test_last_waiter_cancelled(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=asyncio.Event().wait)
+
+        waiter = asyncio.create_task(self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        await asyncio.sleep(0)
+        fetchTask = self.cache._inFlight[("Pizza Hut", "AB1 2CD")]
+        waiter.cancel()
+        await asyncio.wait([fetchTask])
+
+        self.assertTrue(fetchTask.cancelled())
+        self.assertEqual({}, self.cache._inFlight)
+        self.assertEqual(0, len(self.cache))
+
+    async def test_exception_not_cached(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=[Exception("upstream"), True])
+
+        with self.assertRaisesRegex(Exception, "upstream"):
+            await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+
+        self.assertTrue(await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        self.assertEqual(2, fetch.call_count)
+
+
+@patch(MODULE_PATH + "time")
+class Test_DeliveryResultCache_refresh(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = DeliveryResultCache(maxSize=2)
+
+    async def test_replaces_cached(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=[True, False])
+        await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+        time_.time.return_value = 8
+
+        self.assertFalse(await self.cache.refresh("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertEqual(5, self.cache.expiresIn("Pizza Hut", "AB1 2CD"))
+        self.assertEqual(1, self.cache.stats["Pizza Hut"]["refreshes"])
+
+    async def test_failure_keeps_cached(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=[True, Exception("upstream")])
+        await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+
+        with self.assertRaisesRegex(Exception, "upstream"):
+            await self.cache.refresh("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+
+        self.assertTrue(await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        self.assertEqual(2, fetch.call_count)
+
+    async def test_joins_in_flight(self, time_):
+        time_.time.return_value = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return True
+        fetchMock = AsyncMock(side_effect=fetch)
+
+        waiter = asyncio.create_task(self.cache.get("Pizza Hut", "AB1 2CD", fetchMock, 10, 5))
+        refresher = asyncio.create_task(
+            self.cache.refresh("Pizza Hut", "AB1 2CD", fetchMock, 10, 5)
+        )
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual([True, True], await asyncio.gather(waiter, refresher))
+        fetchMock.assert_called_once_with()
+
+
+@patch(MODULE_PATH + "time")
+class Test_DeliveryResultCache_expiresIn(IsolatedAsyncioTestCase):
+
+    async def test_ok(self, time_):
+        cache = DeliveryResultCache(maxSize=2)
+        time_.time.return_value = 0
+        await cache.get("Pizza Hut", "AB1 2CD", AsyncMock(return_value=True), 10, 5)
+
+        time_.time.return_value = 4
+        self.assertEqual(6, cache.expiresIn("Pizza Hut", "AB1 2CD"))
+        time_.time.return_value = 10
+        self.assertIsNone(cache.expiresIn("Pizza Hut", "AB1 2CD"))
+
+    async def test_not_cached(self, time_):
+        self.assertIsNone(DeliveryResultCache(maxSize=2).expiresIn("Pizza Hut", "AB1 2CD"))
+
+
+@patch(MODULE_PATH + "time")
+class Test_DeliveryResultCache_stale(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = DeliveryResultCache(maxSize=2)
+
+    async def test_ok(self, time_):
+        time_.time.return_value = 0
+        self.cache.set("Pizza Hut", "AB1 2CD", True, 10, maxStale=20)
+
+        self.assertIsNone(self.cache.stale("Pizza Hut", "AB1 2CD"))
+        time_.time.return_value = 15
+        self.assertEqual((True, 15), self.cache.stale("Pizza Hut", "AB1 2CD"))
+        time_.time.return_value = 30
+        self.assertIsNone(self.cache.stale("Pizza Hut", "AB1 2CD"))
+        self.assertEqual(1, self.cache.stats["Pizza Hut"]["stale"])
+
+    async def test_kept_when_refetch_fails(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=[True, Exception("upstream")])
+        await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5, maxStale=20)
+        time_.time.return_value = 15
+
+        with self.assertRaisesRegex(Exception, "upstream"):
+            await self.cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5, maxStale=20)
+
+        self.assertEqual((True, 15), self.cache.stale("Pizza Hut", "AB1 2CD"))
+
+    async def test_dropped_after_max_stale(self, time_):
+        time_.time.return_value = 0
+        self.cache.set("Pizza Hut", "AB1 2CD", True, 10, maxStale=20)
+        time_.time.return_value = 30
+
+        with self.assertRaises(Exception):
+            await self.cache.get("Pizza Hut", "AB1 2CD", AsyncMock(side_effect=Exception), 0, 0)
+
+        self.assertEqual(0, len(self.cache))
+
+
+@patch(MODULE_PATH + "time")
+class Test_DeliveryResultCache_revalidate(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = DeliveryResultCache(maxSize=2)
+
+    async def test_ok(self, time_):
+        time_.time.return_value = 0
+        self.cache.set("Pizza Hut", "AB1 2CD", True, 10, maxStale=20)
+        time_.time.return_value = 15
+        fetch = AsyncMock(return_value=False)
+
+        self.cache.revalidate("Pizza Hut", "AB1 2CD", fetch, 10, 5, maxStale=20)
+        self.cache.revalidate("Pizza Hut", "AB1 2CD", fetch, 10, 5, maxStale=20)
+        await asyncio.gather(*self.cache._revalidations)
+
+        fetch.assert_called_once_with()
+        self.assertEqual(5, self.cache.expiresIn("Pizza Hut", "AB1 2CD"))
+
+    async def test_failure_not_raised(self, time_):
+        time_.time.return_value = 0
+        fetch = AsyncMock(side_effect=Exception("upstream"))
+
+        self.cache.revalidate("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+        await asyncio.wait(self.cache._revalidations)
+
+        self.assertEqual(set(), self.cache._revalidations)
+
+    async def test_hung_fetch_abandoned(self, time_):
+        time_.time.return_value = 0
+        hung = AsyncMock(side_effect=asyncio.Event().wait)
+
+        self.cache.revalidate("Pizza Hut", "AB1 2CD", hung, 10, 5, timeout=0.05)
+        await asyncio.wait_for(asyncio.wait(self.cache._revalidations), 1)
+
+        self.assertEqual({}, self.cache._inFlight)
+        # the next caller starts its own fetch rather than joining the hung one
+        self.assertTrue(
+            await self.cache.get("Pizza Hut", "AB1 2CD", AsyncMock(return_value=True), 10, 5)
+        )
+
+
+class Test_DeliveryResultCache_close(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache = DeliveryResultCache(maxSize=2)
+
+    async def test_drains_revalidations(self):
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return True
+
+        self.cache.revalidate("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+        asyncio.get_running_loop().call_later(0.01, release.set)
+        await self.cache.close(drainSeconds=1)
+
+        self.assertEqual(set(), self.cache._revalidations)
+        self.assertEqual(1, len(self.cache))
+
+    async def test_cancels_after_drain(self):
+        self.cache.revalidate(
+            "Pizza Hut", "AB1 2CD", AsyncMock(side_effect=asyncio.Event().wait), 10, 5
+        )
+        await asyncio.sleep(0)
+
+        await self.cache.close(drainSeconds=0.01)
+
+        self.assertEqual(set(), self.cache._revalidations)
+        self.assertEqual({}, self.cache._inFlight)
+
+    async def test_closes_store(self):
+        store = MemoryStore()
+        with patch.object(store, "close") as close:
+            await DeliveryResultCache(maxSize=2, store=store).close()
+
+        close.assert_awaited_once_with()
+
+
+class Test_DeliveryResultCache_sharedStore(IsolatedAsyncioTestCase):
+    """
+    Two caches sharing a store, standing in for two workers.
+    """
+
+    def setUp(self):
+        server = FakeServer()
+        self.worker1 = DeliveryResultCache(
+            maxSize=2, store=RedisStore(aioredis.FakeRedis(server=server))
+        )
+        self.worker2 = DeliveryResultCache(
+            maxSize=2, store=RedisStore(aioredis.FakeRedis(server=server))
+        )
+
+    async def test_shared_answer(self):
+        fetch = AsyncMock(return_value=True)
+        self.assertTrue(await self.worker1.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertTrue(await self.worker2.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        fetch.assert_called_once_with()
+        self.assertEqual(1, self.worker2.stats["Pizza Hut"]["shared_hits"])
+        self.assertEqual(1, len(self.worker2))
+
+    async def test_coalesced_across_workers(self):
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return True
+        fetchMock = AsyncMock(side_effect=fetch)
+
+        waiter1 = asyncio.create_task(self.worker1.get("Pizza Hut", "AB1 2CD", fetchMock, 10, 5))
+        await asyncio.sleep(0.01)
+        waiter2 = asyncio.create_task(self.worker2.get("Pizza Hut", "AB1 2CD", fetchMock, 10, 5))
+        await asyncio.sleep(0.01)
+        release.set()
+
+        self.assertEqual([True, True], await asyncio.gather(waiter1, waiter2))
+        fetchMock.assert_called_once_with()
+        self.assertEqual(1, self.worker2.stats["Pizza Hut"]["shared_waits"])
+
+    async def test_failed_fetch_releases_lock(self):
+        fetch = AsyncMock(side_effect=[Exception("upstream"), False])
+        with self.assertRaisesRegex(Exception, "upstream"):
+            await self.worker1.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+
+        self.assertFalse(await self.worker2.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertEqual(2, fetch.call_count)
+        self.assertEqual(0, self.worker2.stats["Pizza Hut"]["shared_waits"])
+
+    async def test_refresh_fetches_newer(self):
+        fetch = AsyncMock(side_effect=[True, False])
+        await self.worker1.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+        await self.worker2.get("Pizza Hut", "AB1 2CD", fetch, 10, 5)
+
+        self.assertFalse(await self.worker2.refresh("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        self.assertFalse(await self.worker1.refresh("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertEqual(2, fetch.call_count)
+
+    async def test_not_shared_when_not_cached(self):
+        fetch = AsyncMock(return_value=True)
+        await self.worker1.get("Pizza Hut", "AB1 2CD", fetch, 0, 0)
+
+        await self.worker2.get("Pizza Hut", "AB1 2CD", fetch, 0, 0)
+
+        self.assertEqual(2, fetch.call_count)
+
+    async def test_timed_out_waiter_keeps_holders_lock(self):
+        store = MemoryStore()
+        holder = DeliveryResultCache(maxSize=2, store=store)
+        waiter = DeliveryResultCache(maxSize=2, store=store, lockTtl=0.05)
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return True
+        holding = asyncio.create_task(holder.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        await asyncio.sleep(0.01)
+
+        self.assertFalse(
+            await waiter.get("Pizza Hut", "AB1 2CD", AsyncMock(return_value=False), 10, 5)
+        )
+
+        self.assertIsNotNone(await store.get("lock:result:Pizza Hut:AB1 2CD"))
+        release.set()
+        self.assertTrue(await holding)
+        self.assertIsNone(await store.get("lock:result:Pizza Hut:AB1 2CD"))
+
+    async def test_store_error(self):
+        store = MemoryStore()
+        cache = DeliveryResultCache(maxSize=2, store=store)
+        fetch = AsyncMock(return_value=True)
+
+        with patch.object(store, "get", AsyncMock(side_effect=ConnectionError)), \
+                patch.object(store, "acquireLock", AsyncMock(side_effect=ConnectionError)):
+            self.assertTrue(await cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+
+        self.assertTrue(await cache.get("Pizza Hut", "AB1 2CD", fetch, 10, 5))
+        fetch.assert_called_once_with()
+
+
+class Test_CacheEntry_dumps(IsolatedAsyncioTestCase):
+
+    async def test_round_trip(self):
+        entry = CacheEntry(True, 1.5, 11.5, 31.5)
+
+        self.assertEqual(25, len(entry.dumps()))
+        self.assertEqual(entry, CacheEntry.loads(entry.dumps()))
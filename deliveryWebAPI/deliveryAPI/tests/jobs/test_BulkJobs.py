@@ -0,0 +1,401 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from deliveryAPI.jobs.BulkJobs import (
+    BulkJob, BulkJobs, InvalidInputError, JobState, JobStatus
+)
+
+MODULE_PATH = "deliveryAPI.jobs.BulkJobs."
+
+
+async def streamChunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def checkPostcode(service, postcode):
+    return {"can_deliver": postcode.startswith("SW"), "status": "ok"}
+
+
+class BulkJobTestCase(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tempDir.cleanup)
+        self.directory = self._tempDir.name
+
+    async def createJob(self, *chunks, inputFormat="csv", services=("example",)):
+        job = await BulkJob.create(self.directory, list(services))
+        self.addCleanup(job.unlock)
+        await job.upload(streamChunks(*chunks), inputFormat)
+        return job
+
+    def readInput(self, job):
+        with open(job.inputPath) as inputFile:
+            return inputFile.read().splitlines()
+
+    def readResults(self, job):
+        with open(job.resultsPath) as resultsFile:
+            return [json.loads(line) for line in resultsFile]
+
+
+class Test_BulkJob_upload(BulkJobTestCase):
+
+    async def test_csv_header(self):
+        job = await self.createJob(b"id,Postcode\n1,sw1a1aa\n2,NW9 ", b"9ED\n3,nope\n")
+
+        self.assertEqual(["SW1A 1AA", "NW9 9ED"], self.readInput(job))
+        self.assertEqual(2, job.state.total)
+        self.assertEqual(1, job.state.rejected)
+        self.assertEqual(JobStatus.QUEUED, job.state.status)
+
+    async def test_csv_first_column(self):
+        job = await self.createJob(b"SW1A 1AA,x\r\n\r\nnw99ed")
+
+        self.assertEqual(["SW1A 1AA", "NW9 9ED"], self.readInput(job))
+        self.assertEqual(0, job.state.rejected)
+
+    async def test_ndjson(self):
+        job = await self.createJob(
+            b'"SW1A 1AA"\n{"postcode": "nw9 9ed"}\n{"other": 1}\nnot json\n',
+            inputFormat="ndjson"
+        )
+
+        self.assertEqual(["SW1A 1AA", "NW9 9ED"], self.readInput(job))
+        self.assertEqual(2, job.state.rejected)
+
+    async def test_saved(self):
+        job = await self.createJob(b"SW1A 1AA\n")
+
+        loaded = await BulkJob.load(self.directory, job.id)
+
+        self.assertEqual(job.state, loaded.state)
+
+    async def test_line_too_long(self):
+        with self.assertRaises(InvalidInputError):
+            await self.createJob(b"SW1A 1AA\n" + b"x" * 5000)
+
+
+class Test_BulkJob_run(BulkJobTestCase):
+
+    async def test_ok(self):
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\nSW1A 2AA\n", services=["a", "b"])
+
+        await job.run(checkPostcode, concurrency=2, checkpointEvery=2)
+
+        self.assertEqual(
+            [
+                {"postcode": "SW1A 1AA", "results": {
+                    "a": {"can_deliver": True, "status": "ok"},
+                    "b": {"can_deliver": True, "status": "ok"}
+                }},
+                {"postcode": "NW9 9ED", "results": {
+                    "a": {"can_deliver": False, "status": "ok"},
+                    "b": {"can_deliver": False, "status": "ok"}
+                }},
+                {"postcode": "SW1A 2AA", "results": {
+                    "a": {"can_deliver": True, "status": "ok"},
+                    "b": {"can_deliver": True, "status": "ok"}
+                }},
+            ],
+            self.readResults(job)
+        )
+        state = (await BulkJob.load(self.directory, job.id)).state
+        self.assertEqual(JobStatus.COMPLETED, state.status)
+        self.assertEqual(3, state.processed)
+        self.assertEqual(os.path.getsize(job.inputPath), state.input_offset)
+        self.assertEqual(os.path.getsize(job.resultsPath), state.results_size)
+
+    async def test_order_kept(self):
+        async def slowFirst(service, postcode):
+            if postcode == "SW1A 1AA":
+                await asyncio.sleep(0.05)
+            return await checkPostcode(service, postcode)
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n")
+
+        await job.run(slowFirst, concurrency=2, checkpointEvery=10)
+
+        self.assertEqual(
+            ["SW1A 1AA", "NW9 9ED"], [result["postcode"] for result in self.readResults(job)]
+        )
+
+    async def test_bounded_concurrency(self):
+        inFlight = 0
+        maxInFlight = 0
+
+        async def counted(service, postcode):
+            nonlocal inFlight, maxInFlight
+            inFlight += 1
+            maxInFlight = max(maxInFlight, inFlight)
+            await asyncio.sleep(0.01)
+            inFlight -= 1
+            return await checkPostcode(service, postcode)
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\nSW1A 2AA\nM1 1AE\nM1 1AF\n")
+
+        await job.run(counted, concurrency=2, checkpointEvery=10)
+
+        self.assertEqual(2, maxInFlight)
+        self.assertEqual(5, job.state.processed)
+
+    async def test_resume(self):
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\nSW1A 2AA\n")
+        await job.run(checkPostcode, concurrency=1, checkpointEvery=1)
+        # as if the worker stopped after the first checkpoint, with a result written after it
+        with open(job.resultsPath, "rb") as resultsFile:
+            firstLine = resultsFile.readline()
+        with open(job.resultsPath, "wb") as resultsFile:
+            resultsFile.write(firstLine + b'{"postcode": "NW9')
+        job.state = job.state.copy(update={
+            "status": JobStatus.RUNNING, "processed": 1,
+            "input_offset": len(b"SW1A 1AA\n"), "results_size": len(firstLine)
+        })
+        checked = []
+
+        async def recorded(service, postcode):
+            checked.append(postcode)
+            return await checkPostcode(service, postcode)
+
+        await job.run(recorded, concurrency=1, checkpointEvery=1)
+
+        self.assertEqual(["NW9 9ED", "SW1A 2AA"], checked)
+        self.assertEqual(
+            ["SW1A 1AA", "NW9 9ED", "SW1A 2AA"],
+            [result["postcode"] for result in self.readResults(job)]
+        )
+        self.assertEqual(3, job.state.processed)
+
+    async def test_cancelled(self):
+        reached = asyncio.Event()
+        blocked = asyncio.Event()
+
+        async def blockSecond(service, postcode):
+            if postcode == "NW9 9ED":
+                # only checked once the first postcode's checkpoint is saved
+                reached.set()
+                await blocked.wait()
+            return await checkPostcode(service, postcode)
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n")
+
+        task = asyncio.create_task(job.run(blockSecond, concurrency=1, checkpointEvery=1))
+        await reached.wait()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        state = (await BulkJob.load(self.directory, job.id)).state
+        self.assertEqual(JobStatus.RUNNING, state.status)
+        self.assertEqual(1, state.processed)
+
+    async def test_failed(self):
+        async def broken(service, postcode):
+            raise RuntimeError("broken")
+        job = await self.createJob(b"SW1A 1AA\n")
+
+        await job.run(broken, concurrency=1, checkpointEvery=1)
+
+        state = (await BulkJob.load(self.directory, job.id)).state
+        self.assertEqual(JobStatus.FAILED, state.status)
+        self.assertEqual("broken", state.error)
+
+
+class Test_BulkJob_results(BulkJobTestCase):
+
+    async def collect(self, job, outputFormat):
+        return "".join([chunk async for chunk in job.results(outputFormat, 0.01)])
+
+    async def test_ndjson(self):
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n")
+        await job.run(checkPostcode, concurrency=2, checkpointEvery=1)
+
+        results = await self.collect(job, "ndjson")
+
+        self.assertEqual(
+            ["SW1A 1AA", "NW9 9ED"],
+            [json.loads(line)["postcode"] for line in results.splitlines()]
+        )
+
+    async def test_csv(self):
+        async def mixed(service, postcode):
+            if service == "b":
+                return {"can_deliver": None, "status": "timed_out"}
+            return await checkPostcode(service, postcode)
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n", services=["a", "b"])
+        await job.run(mixed, concurrency=2, checkpointEvery=1)
+
+        results = await self.collect(job, "csv")
+
+        self.assertEqual(
+            "postcode,a,b\nSW1A 1AA,true,timed_out\nNW9 9ED,false,timed_out\n", results
+        )
+
+    @patch(MODULE_PATH + "_BLOCK_BYTES", 100)
+    async def test_many_blocks(self):
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n" * 10)
+        await job.run(checkPostcode, concurrency=4, checkpointEvery=3)
+
+        results = await self.collect(job, "ndjson")
+
+        self.assertEqual(20, len(results.splitlines()))
+
+    async def test_while_running(self):
+        release = asyncio.Event()
+
+        reached = asyncio.Event()
+
+        async def blockSecond(service, postcode):
+            if postcode == "NW9 9ED":
+                reached.set()
+                await release.wait()
+            return await checkPostcode(service, postcode)
+        job = await self.createJob(b"SW1A 1AA\nNW9 9ED\n")
+        runTask = asyncio.create_task(job.run(blockSecond, concurrency=1, checkpointEvery=1))
+        await reached.wait()
+        results = job.results("ndjson", 0.01)
+
+        first = await results.__anext__()
+        self.assertEqual("SW1A 1AA", json.loads(first)["postcode"])
+
+        release.set()
+        second = await results.__anext__()
+        self.assertEqual("NW9 9ED", json.loads(second)["postcode"])
+        with self.assertRaises(StopAsyncIteration):
+            await results.__anext__()
+        await runTask
+
+
+class Test_BulkJob_load(BulkJobTestCase):
+
+    async def test_missing(self):
+        self.assertIsNone(await BulkJob.load(self.directory, "0" * 32))
+
+    async def test_not_an_id(self):
+        self.assertIsNone(await BulkJob.load(self.directory, "../etc"))
+
+
+class Test_BulkJob_lock(BulkJobTestCase):
+
+    async def test_held(self):
+        job = await self.createJob(b"SW1A 1AA\n")
+        other = await BulkJob.load(self.directory, job.id)
+
+        self.assertFalse(other.lock())
+
+        job.unlock()
+        self.assertTrue(other.lock())
+        other.unlock()
+
+
+class Test_BulkJobs(BulkJobTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.bulkJobs = BulkJobs(self.directory, checkPostcode, maxRunning=1)
+
+    async def asyncTearDown(self):
+        await self.bulkJobs.close()
+
+    async def waitForJobs(self):
+        await asyncio.gather(*self.bulkJobs._running.values())
+
+    async def writeState(self, **fields):
+        now = time.time()
+        state = JobState(id="a" * 32, services=["example"], created_at=now, updated_at=now)
+        job = BulkJob(os.path.join(self.directory, state.id), state.copy(update=fields))
+        os.makedirs(job.directory)
+        with open(job.inputPath, "w") as inputFile:
+            inputFile.write("SW1A 1AA\n")
+        await job.save()
+        return job
+
+    async def test_create(self):
+        state = await self.bulkJobs.create(
+            streamChunks(b"SW1A 1AA\nNW9 9ED\n"), "csv", ["example"]
+        )
+        await self.waitForJobs()
+
+        job = await self.bulkJobs.get(state.id)
+        self.assertEqual(JobStatus.COMPLETED, job.state.status)
+        self.assertEqual(2, len(self.readResults(job)))
+        self.assertEqual({}, self.bulkJobs._running)
+
+    async def test_create_invalid(self):
+        with self.assertRaises(InvalidInputError):
+            await self.bulkJobs.create(streamChunks(b"x" * 5000), "csv", ["example"])
+
+        jobId, = os.listdir(self.directory)
+        job = await self.bulkJobs.get(jobId)
+        self.assertEqual(JobStatus.FAILED, job.state.status)
+        self.assertTrue(job.lock())
+        job.unlock()
+
+    async def test_scan_resumes(self):
+        await self.writeState(status=JobStatus.RUNNING, total=1)
+
+        await self.bulkJobs.scan()
+        await self.waitForJobs()
+
+        job = await self.bulkJobs.get("a" * 32)
+        self.assertEqual(JobStatus.COMPLETED, job.state.status)
+        self.assertEqual(1, job.state.processed)
+
+    async def test_scan_skips_locked(self):
+        job = await self.writeState(status=JobStatus.QUEUED, total=1)
+        job.lock()
+        self.addCleanup(job.unlock)
+
+        await self.bulkJobs.scan()
+
+        self.assertEqual({}, self.bulkJobs._running)
+
+    async def test_scan_interrupted_upload(self):
+        await self.writeState(status=JobStatus.UPLOADING)
+
+        await self.bulkJobs.scan()
+
+        job = await self.bulkJobs.get("a" * 32)
+        self.assertEqual(JobStatus.FAILED, job.state.status)
+        self.assertEqual("the upload was interrupted", job.state.error)
+
+    @patch(MODULE_PATH + "settings.bulk_jobs_retention_seconds", 60)
+    async def test_scan_deletes_expired(self):
+        job = await self.writeState(status=JobStatus.COMPLETED, total=1)
+        with open(job.statePath) as stateFile:
+            state = json.load(stateFile)
+        state["updated_at"] -= 120
+        with open(job.statePath, "w") as stateFile:
+            json.dump(state, stateFile)
+
+        await self.bulkJobs.scan()
+
+        self.assertEqual([], os.listdir(self.directory))
+
+    @patch(MODULE_PATH + "settings.bulk_jobs_retention_seconds", 60)
+    async def test_scan_keeps_recent(self):
+        await self.writeState(status=JobStatus.COMPLETED, total=1)
+
+        await self.bulkJobs.scan()
+
+        self.assertEqual(["a" * 32], os.listdir(self.directory))
+
+    async def test_close_stops_jobs(self):
+        reached = asyncio.Event()
+        blocked = asyncio.Event()
+
+        async def blocking(service, postcode):
+            # the job has been saved as running by now
+            reached.set()
+            await blocked.wait()
+        self.bulkJobs._checkPostcode = blocking
+        state = await self.bulkJobs.create(streamChunks(b"SW1A 1AA\n"), "csv", ["example"])
+        await reached.wait()
+
+        await self.bulkJobs.close()
+
+        job = await self.bulkJobs.get(state.id)
+        self.assertEqual(JobStatus.RUNNING, job.state.status)
+        self.assertTrue(job.lock())
+        job.unlock()
@@ -0,0 +1,132 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from deliveryAPI.models.BackendRegistry import (
+    BackendRegistry, BackendSpec, Capability, BUILTIN_BACKENDS
+)
+from deliveryAPI.models.FoodModels import PizzaHut
+
+MODULE_PATH = "deliveryAPI.models.BackendRegistry."
+
+
+class Test_BackendSpec_load(TestCase):
+
+    def test_ok(self):
+        spec = BackendSpec("pizzahut", "Pizza Hut", "deliveryAPI.models.FoodModels:PizzaHut")
+
+        self.assertIs(PizzaHut, spec.load())
+
+    @patch(MODULE_PATH + "importlib")
+    def test_imported_once(self, importlib):
+        spec = BackendSpec("example", "Example", "example.module:Example")
+
+        self.assertIs(spec.load(), spec.load())
+
+        importlib.import_module.assert_called_once_with("example.module")
+
+    @patch(MODULE_PATH + "importlib")
+    def test_not_imported_on_register(self, importlib):
+        BackendRegistry([BackendSpec("example", "Example", "example.module:Example")])
+
+        importlib.import_module.assert_not_called()
+
+    def test_builtin_names_match_models(self):
+        for spec in BUILTIN_BACKENDS:
+            self.assertEqual(spec.displayName, spec.load()("AB1 2CD").name)
+
+
+class Test_BackendSpec_capabilities(TestCase):
+
+    def test_default(self):
+        spec = BackendSpec("example", "Example", "example.module:Example")
+
+        self.assertTrue(spec.hasCapability(Capability.AGGREGATE))
+        self.assertTrue(spec.hasCapability(Capability.DIRECT))
+
+    def test_from_strings(self):
+        spec = BackendSpec.fromDict({
+            "slug": "example", "name": "Example", "model": "example.module:Example",
+            "capabilities": ["direct"]
+        })
+
+        self.assertFalse(spec.hasCapability(Capability.AGGREGATE))
+        self.assertTrue(spec.hasCapability(Capability.DIRECT))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            BackendSpec("example", "Example", "example.module:Example", ["teleport"])
+
+
+class Test_BackendRegistry_backends(TestCase):
+
+    def setUp(self):
+        self.registry = BackendRegistry([
+            BackendSpec("first", "First", "example.module:First"),
+            BackendSpec("second", "Second", "example.module:Second", [Capability.DIRECT]),
+        ])
+
+    def test_registration_order(self):
+        self.assertEqual(
+            ["first", "second"], [spec.slug for spec in self.registry.backends()]
+        )
+
+    def test_capability(self):
+        self.assertEqual(
+            ["first"], [spec.slug for spec in self.registry.backends(Capability.AGGREGATE)]
+        )
+
+    def test_replaced(self):
+        self.registry.register(BackendSpec("first", "Replaced", "example.module:Replaced"))
+
+        self.assertEqual("Replaced", self.registry.get("first").displayName)
+        self.assertEqual(2, len(self.registry.backends()))
+
+    def test_unknown(self):
+        with self.assertRaises(KeyError):
+            self.registry.get("notfound")
+
+
+@patch(MODULE_PATH + "entry_points", MagicMock(return_value=[]))
+class Test_BackendRegistry_discover(TestCase):
+
+    def test_builtin(self):
+        registry = BackendRegistry.discover()
+
+        self.assertEqual(
+            ["pizzahut", "dominos", "mcdonalds", "kfc", "burgerking"],
+            [spec.slug for spec in registry.backends()]
+        )
+
+    def test_config(self):
+        with tempfile.TemporaryDirectory() as directory:
+            configPath = os.path.join(directory, "backends.json")
+            with open(configPath, "w") as configFile:
+                json.dump([
+                    {"slug": "kfc", "enabled": False},
+                    {"slug": "example", "name": "Example", "model": "example.module:Example"},
+                ], configFile)
+
+            registry = BackendRegistry.discover(configPath)
+
+        self.assertEqual(
+            ["pizzahut", "dominos", "mcdonalds", "burgerking", "example"],
+            [spec.slug for spec in registry.backends()]
+        )
+
+
+class Test_BackendRegistry_discover_entryPoints(TestCase):
+
+    @patch(MODULE_PATH + "entry_points")
+    def test_ok(self, entry_points):
+        spec = BackendSpec("example", "Example", "example.module:Example")
+        entryPoint = MagicMock()
+        entryPoint.load.return_value = [spec]
+        entry_points.return_value = [entryPoint]
+
+        registry = BackendRegistry.discover()
+
+        entry_points.assert_called_once_with(group="deliveryAPI.backends")
+        self.assertIs(spec, registry.get("example"))
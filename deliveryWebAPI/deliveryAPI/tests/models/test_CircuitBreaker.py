@@ -0,0 +1,117 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.models.CircuitBreaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+MODULE_PATH = "deliveryAPI.models.CircuitBreaker."
+
+
+@patch(MODULE_PATH + "settings")
+@patch(MODULE_PATH + "time")
+class Test_CircuitBreaker(TestCase):
+
+    def _setUpSettings(self, settings):
+        settings.circuit_failure_threshold = 2
+        settings.circuit_latency_threshold_seconds = 1
+        settings.circuit_open_seconds = 30
+        settings.circuit_half_open_probes = 1
+
+    def test_opens_after_failures(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+
+        breaker.beforeCall()
+        breaker.afterCall(0.1, failed=True)
+        self.assertIs(CircuitState.CLOSED, breaker.state)
+        breaker.beforeCall()
+        breaker.afterCall(0.1, failed=True)
+
+        self.assertIs(CircuitState.OPEN, breaker.state)
+        with self.assertRaisesRegex(CircuitOpenError, "Pizza Hut is unavailable, circuit open"):
+            breaker.beforeCall()
+
+    def test_opens_after_slow_calls(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+
+        breaker.afterCall(1.5, failed=False)
+        breaker.afterCall(1.5, failed=False)
+
+        self.assertIs(CircuitState.OPEN, breaker.state)
+
+    def test_success_resets_failures(self, time_, settings):
+        self._setUpSettings(settings)
+        breaker = CircuitBreaker("Pizza Hut")
+
+        breaker.afterCall(0.1, failed=True)
+        breaker.afterCall(0.1, failed=False)
+        breaker.afterCall(0.1, failed=True)
+
+        self.assertIs(CircuitState.CLOSED, breaker.state)
+
+    def test_half_open_probe_closes(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+        breaker.afterCall(0.1, failed=True)
+        breaker.afterCall(0.1, failed=True)
+        time_.monotonic.return_value = 30
+
+        breaker.beforeCall()
+        self.assertIs(CircuitState.HALF_OPEN, breaker.state)
+        with self.assertRaisesRegex(CircuitOpenError, "circuit half open"):
+            breaker.beforeCall()
+        breaker.afterCall(0.1, failed=False)
+
+        self.assertIs(CircuitState.CLOSED, breaker.state)
+        breaker.beforeCall()
+
+    def test_half_open_probe_reopens(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+        breaker.afterCall(0.1, failed=True)
+        breaker.afterCall(0.1, failed=True)
+        time_.monotonic.return_value = 30
+
+        breaker.beforeCall()
+        breaker.afterCall(0.1, failed=True)
+
+        self.assertIs(CircuitState.OPEN, breaker.state)
+        with self.assertRaises(CircuitOpenError):
+            breaker.beforeCall()
+
+    def test_cancelled_probe(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+        breaker.afterCall(0.1, failed=True)
+        breaker.afterCall(0.1, failed=True)
+        time_.monotonic.return_value = 30
+
+        breaker.beforeCall()
+        breaker.cancelCall()
+
+        self.assertIs(CircuitState.HALF_OPEN, breaker.state)
+        breaker.beforeCall()
+
+    def test_cancelled_keeps_failures(self, time_, settings):
+        self._setUpSettings(settings)
+        time_.monotonic.return_value = 0
+        breaker = CircuitBreaker("Pizza Hut")
+
+        breaker.beforeCall()
+        breaker.afterCall(0.1, failed=True)
+        breaker.beforeCall()
+        breaker.cancelCall()
+        breaker.beforeCall()
+        breaker.afterCall(0.1, failed=True)
+
+        self.assertIs(CircuitState.OPEN, breaker.state)
+
+    def test_for_backend(self, _time, _settings):
+        self.assertIs(CircuitBreaker.forBackend("Test"), CircuitBreaker.forBackend("Test"))
+        self.assertIsNot(CircuitBreaker.forBackend("Test"), CircuitBreaker.forBackend("Other"))
@@ -0,0 +1,82 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from deliveryAPI.models.ConcurrencyLimiter import AdaptiveConcurrencyLimiter
+
+
+MODULE_PATH = "deliveryAPI.models.ConcurrencyLimiter."
+
+
+@patch(MODULE_PATH + "settings")
+class Test_AdaptiveConcurrencyLimiter(IsolatedAsyncioTestCase):
+
+    def _setUpSettings(self, settings, initialLimit=2):
+        settings.concurrency_initial_limit = initialLimit
+        settings.concurrency_min_limit = 1
+        settings.concurrency_max_limit = 4
+        settings.concurrency_latency_threshold_seconds = 1
+        settings.concurrency_backoff_ratio = 0.5
+
+    async def test_waits_for_free_slot(self, settings):
+        self._setUpSettings(settings)
+        limiter = AdaptiveConcurrencyLimiter("Pizza Hut")
+        await limiter.acquire()
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        self.assertFalse(waiter.done())
+        limiter.release(0.1, failed=False)
+        await waiter
+
+        self.assertEqual(2, limiter.inFlight)
+
+    async def test_additive_increase(self, settings):
+        self._setUpSettings(settings)
+        limiter = AdaptiveConcurrencyLimiter("Pizza Hut")
+
+        for _ in range(4):
+            await limiter.acquire()
+            limiter.release(0.1, failed=False)
+
+        self.assertEqual(3, int(limiter.limit))
+
+    async def test_max_limit(self, settings):
+        self._setUpSettings(settings, initialLimit=4)
+        limiter = AdaptiveConcurrencyLimiter("Pizza Hut")
+
+        await limiter.acquire()
+        limiter.release(0.1, failed=False)
+
+        self.assertEqual(4, limiter.limit)
+
+    async def test_multiplicative_decrease(self, settings):
+        self._setUpSettings(settings, initialLimit=4)
+        limiter = AdaptiveConcurrencyLimiter("Pizza Hut")
+
+        await limiter.acquire()
+        limiter.release(0.1, failed=True)
+        self.assertEqual(2, limiter.limit)
+        await limiter.acquire()
+        limiter.release(1.5, failed=False)
+        self.assertEqual(1, limiter.limit)
+        await limiter.acquire()
+        limiter.release(0.1, failed=True)
+        self.assertEqual(1, limiter.limit)
+
+    async def test_cancelled_waiter_passes_slot_on(self, settings):
+        self._setUpSettings(settings, initialLimit=1)
+        limiter = AdaptiveConcurrencyLimiter("Pizza Hut")
+        await limiter.acquire()
+        waiter1 = asyncio.create_task(limiter.acquire())
+        waiter2 = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        limiter.release(0.1, failed=True)
+        waiter1.cancel()
+        await asyncio.sleep(0)
+        await waiter2
+
+        self.assertTrue(waiter1.cancelled())
+        self.assertEqual(1, limiter.inFlight)
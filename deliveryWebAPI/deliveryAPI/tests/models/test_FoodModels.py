@@ -1,11 +1,17 @@
+import asyncio
 from unittest import IsolatedAsyncioTestCase
 from unittest.mock import patch, MagicMock, call, AsyncMock
 
 from aiohttp import ClientSession
 from aiohttp.client_exceptions import ClientResponseError
 
+from deliveryAPI.models.CircuitBreaker import CircuitOpenError
+from deliveryAPI.models.JsonStream import ResponseTooLargeError
+from deliveryAPI.cache.CatchmentIndex import CatchmentIndex
+from deliveryAPI.metrics import BACKEND_SECONDS, UPSTREAM_IN_FLIGHT
 from deliveryAPI.models.FoodModels import (
-    PizzaHut, Dominos, UberEatsSession, UberEats, USER_AGENT, BaseFoodModel
+    PizzaHut, Dominos, UberEatsSession, UberEats, UberEatsLocationContext, McDonalds, KFC,
+    BurgerKing, USER_AGENT, BaseFoodModel, UberEatsSessionPool, uberEatsLocationKey
 )
 
 MODULE_PATH = "deliveryAPI.models.FoodModels."
@@ -47,6 +53,59 @@ class Test_BaseFoodModel_canDeliver(IsolatedAsyncioTestCase):
 
         testFood._session.close.assert_called_once_with()
 
+    @patch("deliveryAPI.metrics.settings.metrics_enabled", True)
+    async def test_metrics(self):
+        BACKEND_SECONDS.clear()
+        UPSTREAM_IN_FLIGHT.clear()
+
+        await SkeletonTestFoodModel("AB12 1AB").canDeliver()
+        with self.assertRaises(Exception):
+            await SkeletonTestFoodModel("AB12 1AB", raiseException=True).canDeliver()
+
+        self.assertEqual(1, BACKEND_SECONDS.count("Test", "ok"))
+        self.assertEqual(1, BACKEND_SECONDS.count("Test", "error"))
+        self.assertEqual(0, UPSTREAM_IN_FLIGHT.value("Test"))
+
+    @patch(MODULE_PATH + "AdaptiveConcurrencyLimiter")
+    @patch(MODULE_PATH + "CircuitBreaker")
+    async def test_circuit_open(self, CircuitBreaker_, AdaptiveConcurrencyLimiter_):
+        CircuitBreaker_.forBackend.return_value.beforeCall.side_effect = CircuitOpenError()
+        testFood = SkeletonTestFoodModel("AB12 1AB")
+
+        with self.assertRaises(CircuitOpenError):
+            await testFood.canDeliver()
+
+        self.assertIsNone(testFood._session)
+        AdaptiveConcurrencyLimiter_.forBackend.return_value.acquire.assert_not_called()
+
+    @patch(MODULE_PATH + "AdaptiveConcurrencyLimiter")
+    @patch(MODULE_PATH + "CircuitBreaker")
+    async def test_outcome_recorded(self, CircuitBreaker_, AdaptiveConcurrencyLimiter_):
+        AdaptiveConcurrencyLimiter_.forBackend.return_value.acquire = AsyncMock()
+        testFood = SkeletonTestFoodModel("AB12 1AB", raiseException=True)
+
+        with self.assertRaises(Exception):
+            await testFood.canDeliver()
+
+        CircuitBreaker_.forBackend.assert_called_once_with("Test")
+        self.assertTrue(CircuitBreaker_.forBackend.return_value.afterCall.call_args.args[1])
+        self.assertTrue(
+            AdaptiveConcurrencyLimiter_.forBackend.return_value.release.call_args.args[1]
+        )
+
+    @patch(MODULE_PATH + "AdaptiveConcurrencyLimiter")
+    @patch(MODULE_PATH + "CircuitBreaker")
+    async def test_cancelled_not_recorded(self, CircuitBreaker_, AdaptiveConcurrencyLimiter_):
+        AdaptiveConcurrencyLimiter_.forBackend.return_value.acquire = AsyncMock()
+        testFood = SkeletonTestFoodModel("AB12 1AB")
+        testFood._canDeliver = AsyncMock(side_effect=asyncio.CancelledError())
+
+        with self.assertRaises(asyncio.CancelledError):
+            await testFood.canDeliver()
+
+        CircuitBreaker_.forBackend.return_value.cancelCall.assert_called_once_with()
+        CircuitBreaker_.forBackend.return_value.afterCall.assert_not_called()
+
 
 class Test_PizzaHut_canDeliver(IsolatedAsyncioTestCase):
 
@@ -92,6 +151,65 @@ class Test_PizzaHut_canDeliver(IsolatedAsyncioTestCase):
         self.assertFalse(canDeliver)
         pizzaHut._session.close.assert_called_once_with()
 
+    @patch("deliveryAPI.models.RetryPolicy.settings.retry_base_delay_seconds", 0)
+    @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
+    async def test_server_error_retried(self, ClientSession_):
+        pizzaHut = PizzaHut("ABCD 1EF")
+        failedResponse = MagicMock()
+        failedResponse.raise_for_status.side_effect = ClientResponseError(
+            MagicMock(), MagicMock(), status=503
+        )
+        response = MagicMock(response_status=200)
+        response.json = AsyncMock(return_value=[{"id": "501"}])
+        ClientSession_.return_value.get = AsyncMock(side_effect=[failedResponse, response])
+
+        canDeliver = await pizzaHut.canDeliver()
+
+        self.assertTrue(canDeliver)
+        self.assertEqual(2, ClientSession_.return_value.get.call_count)
+
+
+@patch(MODULE_PATH + "settings.catchment_min_observations", 1)
+class Test_PizzaHut_canDeliver_catchmentIndex(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        CatchmentIndex._indexes.clear()
+
+    @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
+    async def test_answered_locally(self, ClientSession_):
+        response = MagicMock(response_status=200)
+        response.json = AsyncMock(return_value=[{"id": "501"}])
+        ClientSession_.return_value.get = AsyncMock(return_value=response)
+
+        self.assertTrue(await PizzaHut("NW9 9ED").canDeliver())
+        self.assertTrue(await PizzaHut("NW9 9EE").canDeliver())
+
+        ClientSession_.return_value.get.assert_called_once()
+        self.assertEqual(1, len(CatchmentIndex.forBackend("Pizza Hut")))
+
+    @patch(MODULE_PATH + "settings.catchment_index_services", [])
+    @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
+    async def test_disabled(self, ClientSession_):
+        response = MagicMock(response_status=200)
+        response.json = AsyncMock(return_value=[{"id": "501"}])
+        ClientSession_.return_value.get = AsyncMock(return_value=response)
+
+        await PizzaHut("NW9 9ED").canDeliver()
+        await PizzaHut("NW9 9EE").canDeliver()
+
+        self.assertEqual(2, ClientSession_.return_value.get.call_count)
+
+    @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
+    async def test_upstream_only(self, ClientSession_):
+        response = MagicMock(response_status=200)
+        response.json = AsyncMock(return_value=[{"id": "501"}])
+        ClientSession_.return_value.get = AsyncMock(return_value=response)
+        await PizzaHut("NW9 9ED").canDeliver()
+
+        self.assertTrue(await PizzaHut("NW9 9EE").canDeliverUpstream())
+
+        self.assertEqual(2, ClientSession_.return_value.get.call_count)
+
 
 class Test_Dominos_canDeliver(IsolatedAsyncioTestCase):
 
@@ -124,8 +242,9 @@ class Test_Dominos_canDeliver(IsolatedAsyncioTestCase):
         self.assertTrue(canDeliver)
         dominos._session.close.assert_called_once_with()
 
+    @patch(MODULE_PATH + "NegativePostcodes")
     @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
-    async def test_no_locations(self, ClientSession_):
+    async def test_no_locations(self, ClientSession_, NegativePostcodes_):
         dominos = Dominos("ABCD 1EF")
         response = MagicMock()
         response.raise_for_status.side_effect = ClientResponseError(
@@ -138,6 +257,7 @@ class Test_Dominos_canDeliver(IsolatedAsyncioTestCase):
 
         self.assertFalse(canDeliver)
         dominos._session.close.assert_called_once_with()
+        NegativePostcodes_.add.assert_called_once_with("Dominos", "ABCD 1EF")
 
     @patch(MODULE_PATH + "ClientSession", return_value=AsyncMock())
     async def test_no_local_locations(self, ClientSession_):
@@ -235,6 +355,8 @@ class UberEatsSubclassTest(UberEats):
         return "Test"
 
 
+@patch(MODULE_PATH + "settings.ue_session_pool_max_size", 0)
+@patch(MODULE_PATH + "settings.ue_search_streaming", False)
 @patch(MODULE_PATH + "UELocationCache")
 class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
 
@@ -245,7 +367,7 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
 
     @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
     async def test_ok(self, UberEatsSession_, UELocationCache):
-        UELocationCache.getCacheLocation.return_value = None
+        UELocationCache.getCacheLocation = AsyncMock(return_value=None)
         getAddressInfoResponse = MagicMock()
         getAddressInfoResponse.json = AsyncMock(return_value={
             "data": [
@@ -324,9 +446,9 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
 
     @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
     async def test_cached_location(self, UberEatsSession_, UELocationCache):
-        UELocationCache.getCacheLocation.return_value = {
+        UELocationCache.getCacheLocation = AsyncMock(return_value={
             "cached": "location"
-        }
+        })
         locationResponse = MagicMock()
         locationResponse.json = AsyncMock(return_value={
             "data": [
@@ -373,9 +495,10 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
         UELocationCache.setCacheLocation.assert_not_called()
         uberEats._session.close.assert_called_once_with()
 
+    @patch(MODULE_PATH + "NegativePostcodes")
     @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
-    async def test_no_location(self, UberEatsSession_, UELocationCache):
-        UELocationCache.getCacheLocation.return_value = None
+    async def test_no_location(self, UberEatsSession_, NegativePostcodes_, UELocationCache):
+        UELocationCache.getCacheLocation = AsyncMock(return_value=None)
         response = MagicMock()
         UberEatsSession_.return_value.post = AsyncMock(return_value=response)
         response.json = AsyncMock(return_value={
@@ -388,11 +511,12 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
 
         self.assertFalse(canDeliver)
         self.assertEqual(0, UELocationCache.setCacheLocation.call_count)
-        uberEats._session.close.assert_called_once_with()
+        UberEatsSession_.return_value.close.assert_called_once_with()
+        NegativePostcodes_.add.assert_called_once_with("*", "ABCD 1EF")
 
     @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
     async def test_no_valid_stores(self, UberEatsSession_, UELocationCache):
-        UELocationCache.getCacheLocation.return_value = None
+        UELocationCache.getCacheLocation = AsyncMock(return_value=None)
         response = MagicMock()
         response.json = AsyncMock(return_value={
             "data": [
@@ -426,7 +550,7 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
 
     @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
     async def test_location_cookie_failed(self, UberEatsSession_, UELocationCache):
-        UELocationCache.getCacheLocation.return_value = None
+        UELocationCache.getCacheLocation = AsyncMock(return_value=None)
         getAddressInfoResponse = MagicMock()
         getAddressInfoResponse.json = AsyncMock(return_value={
             "data": [
@@ -466,4 +590,291 @@ class Test_UberEats_canDeliver(IsolatedAsyncioTestCase):
         ):
             await uberEats.canDeliver()
 
-        uberEats._session.close.assert_called_once_with()
+        UberEatsSession_.return_value.close.assert_called_once_with()
+
+
+@patch(MODULE_PATH + "settings.ue_session_pool_max_size", 0)
+@patch(
+    MODULE_PATH + "UELocationCache",
+    getCacheLocation=AsyncMock(return_value={"cached": "location"})
+)
+@patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
+class Test_UberEats_canDeliver_streaming(IsolatedAsyncioTestCase):
+
+    def _searchResponse(self, *chunks, readPastEnd=False):
+        async def iterAny():
+            for chunk in chunks:
+                yield chunk
+            if readPastEnd:
+                raise AssertionError("read past the matching store")
+
+        response = MagicMock()
+        response.content.iter_any = iterAny
+        return response
+
+    def _setUpSession(self, UberEatsSession_, searchResponse):
+        confirmationResponse = AsyncMock()
+        confirmationResponse.json.return_value = {"status": "success"}
+        UberEatsSession_.return_value.post = AsyncMock(
+            side_effect=[confirmationResponse, searchResponse]
+        )
+        UberEatsSession_.return_value.setCookie = MagicMock()
+
+    async def test_stops_at_match(self, UberEatsSession_, _UELocationCache):
+        searchResponse = self._searchResponse(
+            b'{"data": [{"type": "dish", "store": {"title": "ABC"}}, ',
+            b'{"type": "store", "store": {"title": "ABC TEST ABC"}}, ',
+            readPastEnd=True
+        )
+        self._setUpSession(UberEatsSession_, searchResponse)
+
+        self.assertTrue(await UberEatsSubclassTest("ABCD 1EF").canDeliver())
+
+        searchResponse.close.assert_called_once_with()
+        searchResponse.json.assert_not_called()
+
+    async def test_no_match(self, UberEatsSession_, _UELocationCache):
+        searchResponse = self._searchResponse(
+            b'{"status": "success", "data": [{"type": "store", "store": {"title": "Other"}}]}'
+        )
+        self._setUpSession(UberEatsSession_, searchResponse)
+
+        self.assertFalse(await UberEatsSubclassTest("ABCD 1EF").canDeliver())
+
+        searchResponse.close.assert_called_once_with()
+
+    @patch(MODULE_PATH + "settings.ue_search_max_bytes", 10)
+    async def test_too_large(self, UberEatsSession_, _UELocationCache):
+        searchResponse = self._searchResponse(b'{"data": [', b'{"type": "dish"}, ' * 10)
+        self._setUpSession(UberEatsSession_, searchResponse)
+
+        with self.assertRaises(ResponseTooLargeError):
+            await UberEatsSubclassTest("ABCD 1EF").canDeliver()
+
+        searchResponse.close.assert_called_once_with()
+
+
+@patch(MODULE_PATH + "settings.ue_session_pool_max_size", 0)
+@patch(MODULE_PATH + "settings.ue_search_streaming", False)
+@patch(MODULE_PATH + "UELocationCache")
+class Test_UberEatsLocationContext(IsolatedAsyncioTestCase):
+
+    @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
+    async def test_shared_between_brands(self, UberEatsSession_, UELocationCache):
+        UELocationCache.getCacheLocation = AsyncMock(return_value={
+            "cached": "location"
+        })
+        confirmationResponse = AsyncMock()
+        confirmationResponse.json.return_value = {"status": "success"}
+        searchResponse = MagicMock()
+        searchResponse.json = AsyncMock(return_value={
+            "data": [
+                {
+                    "type": "store",
+                    "store": {
+                        "title": "KFC Ashford"
+                    }
+                }
+            ]
+        })
+
+        async def post(url, **_kwargs):
+            await asyncio.sleep(0)
+            if "setTargetLocationV1" in url:
+                return confirmationResponse
+            return searchResponse
+        UberEatsSession_.return_value.post = AsyncMock(side_effect=post)
+        UberEatsSession_.return_value.setCookie = MagicMock()
+
+        canDeliver = await asyncio.gather(
+            McDonalds("ABCD 1EF").canDeliver(),
+            KFC("ABCD 1EF").canDeliver(),
+            BurgerKing("ABCD 1EF").canDeliver()
+        )
+
+        self.assertEqual([False, True, False], canDeliver)
+        UberEatsSession_.assert_called_once()
+        UELocationCache.getCacheLocation.assert_called_once_with("ABCD 1EF")
+        postedUrls = [
+            postCall.args[0] for postCall in UberEatsSession_.return_value.post.mock_calls
+        ]
+        self.assertEqual(1, sum("setTargetLocationV1" in url for url in postedUrls))
+        self.assertEqual(3, sum("getSearchSuggestionsV1" in url for url in postedUrls))
+        UberEatsSession_.return_value.close.assert_called_once_with()
+        self.assertEqual({}, UberEatsLocationContext._contexts)
+
+    @patch(MODULE_PATH + "UberEatsSession", return_value=AsyncMock())
+    async def test_released_when_unused(self, UberEatsSession_, _UELocationCache):
+        context = UberEatsLocationContext.acquire("ABCD 1EF")
+        self.assertIs(context, UberEatsLocationContext.acquire("ABCD 1EF"))
+
+        await context.release()
+        await context.release()
+
+        # nothing to close, a session is only opened to resolve the location
+        UberEatsSession_.assert_not_called()
+        self.assertIsNot(context, UberEatsLocationContext.acquire("ABCD 1EF"))
+        await UberEatsLocationContext._contexts["ABCD 1EF"].release()
+
+
+@patch(MODULE_PATH + "settings.ue_session_pool_idle_seconds", 60)
+@patch(MODULE_PATH + "settings.ue_search_streaming", False)
+@patch(MODULE_PATH + "UELocationCache")
+class Test_UberEatsSessionPool(IsolatedAsyncioTestCase):
+
+    async def asyncTearDown(self):
+        await UberEatsSessionPool.close()
+
+    def _setUpSessions(self, UberEatsSession_, UELocationCache, searchResponses=None):
+        UELocationCache.getCacheLocation = AsyncMock(
+            side_effect=lambda postcode: {"place": postcode[:3]}
+        )
+        confirmationResponse = AsyncMock()
+        confirmationResponse.json.return_value = {"status": "success"}
+        searchResponse = MagicMock()
+        searchResponse.json = AsyncMock(return_value={
+            "data": [{"type": "store", "store": {"title": "KFC Ashford"}}]
+        })
+        searchResponses = list(searchResponses or [])
+
+        async def post(url, **_kwargs):
+            if "setTargetLocationV1" in url:
+                return confirmationResponse
+            if searchResponses:
+                response = searchResponses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+            return searchResponse
+
+        UberEatsSession_.side_effect = lambda *_args, **_kwargs: MagicMock(
+            post=AsyncMock(side_effect=post), close=AsyncMock()
+        )
+
+    @staticmethod
+    def _postedUrls(session):
+        return [postCall.args[0] for postCall in session.post.mock_calls]
+
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_reused(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+
+        self.assertTrue(await KFC("ABCD 1EF").canDeliver())
+        self.assertTrue(await KFC("ABCD 1EF").canDeliver())
+
+        UberEatsSession_.assert_called_once()
+        pinnedSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+        postedUrls = self._postedUrls(pinnedSession.session)
+        self.assertEqual(1, sum("setTargetLocationV1" in url for url in postedUrls))
+        self.assertEqual(2, sum("getSearchSuggestionsV1" in url for url in postedUrls))
+        pinnedSession.session.close.assert_not_called()
+        self.assertEqual({"sessions": 1, "in_use": 0}, UberEatsSessionPool.stats())
+
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_shared_by_location(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+
+        await KFC("ABCD 1EF").canDeliver()
+        await KFC("ABCD 2EF").canDeliver()
+        await KFC("XYZ 1EF").canDeliver()
+
+        self.assertEqual(2, UberEatsSession_.call_count)
+        self.assertEqual(2, UberEatsSessionPool.stats()["sessions"])
+
+    @patch(MODULE_PATH + "settings.ue_session_pool_max_size", 1)
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_max_size(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+        await KFC("ABCD 1EF").canDeliver()
+        firstSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+
+        await KFC("XYZ 1EF").canDeliver()
+
+        firstSession.session.close.assert_called_once_with()
+        self.assertEqual(
+            [uberEatsLocationKey({"place": "XYZ"})], list(UberEatsSessionPool._sessions)
+        )
+
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_idle(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+        await KFC("ABCD 1EF").canDeliver()
+        idleSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+        idleSession.lastUsed -= 120
+
+        await KFC("XYZ 1EF").canDeliver()
+
+        idleSession.session.close.assert_called_once_with()
+        self.assertEqual(1, UberEatsSessionPool.stats()["sessions"])
+
+    @patch(MODULE_PATH + "settings.ue_session_pool_sweep_interval_seconds", 0.01)
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_idle_without_traffic(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+        await KFC("ABCD 1EF").canDeliver()
+        idleSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+        idleSession.lastUsed -= 120
+
+        UberEatsSessionPool.open()
+        await asyncio.sleep(0.05)
+
+        idleSession.session.close.assert_called_once_with()
+        self.assertEqual(0, UberEatsSessionPool.stats()["sessions"])
+
+    @patch(MODULE_PATH + "settings.ue_session_pool_max_size", 0)
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_in_use_kept(self, UberEatsSession_, _UELocationCache):
+        UberEatsSession_.side_effect = lambda *_args, **_kwargs: MagicMock(close=AsyncMock())
+        inUse = UberEatsSessionPool.acquire("in use", "ABCD 1EF")
+        idle = UberEatsSessionPool.acquire("idle", "XYZ 1EF")
+
+        await UberEatsSessionPool.release(idle)
+
+        idle.session.close.assert_called_once_with()
+        inUse.session.close.assert_not_called()
+        await UberEatsSessionPool.release(inUse)
+        inUse.session.close.assert_called_once_with()
+
+    @patch(MODULE_PATH + "settings.retry_base_delay_seconds", 0)
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_repinned_after_failure(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(
+            UberEatsSession_, UELocationCache,
+            searchResponses=[ClientResponseError(MagicMock(), (), status=503)]
+        )
+
+        self.assertTrue(await KFC("ABCD 1EF").canDeliver())
+
+        pinnedSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+        self.assertEqual(
+            ["setTargetLocationV1", "getSearchSuggestionsV1"] * 2,
+            [
+                url.split("/")[-1].split("?")[0]
+                for url in self._postedUrls(pinnedSession.session)
+            ]
+        )
+
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_repinned_on_next_request(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(
+            UberEatsSession_, UELocationCache,
+            searchResponses=[ClientResponseError(MagicMock(), (), status=400)]
+        )
+        with self.assertRaises(ClientResponseError):
+            await KFC("ABCD 1EF").canDeliver()
+
+        self.assertTrue(await KFC("ABCD 1EF").canDeliver())
+
+        pinnedSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+        postedUrls = self._postedUrls(pinnedSession.session)
+        self.assertEqual(2, sum("setTargetLocationV1" in url for url in postedUrls))
+
+    @patch(MODULE_PATH + "UberEatsSession")
+    async def test_close(self, UberEatsSession_, UELocationCache):
+        self._setUpSessions(UberEatsSession_, UELocationCache)
+        await KFC("ABCD 1EF").canDeliver()
+        pinnedSession = UberEatsSessionPool._sessions[uberEatsLocationKey({"place": "ABC"})]
+
+        await UberEatsSessionPool.close()
+
+        pinnedSession.session.close.assert_called_once_with()
+        self.assertEqual({"sessions": 0, "in_use": 0}, UberEatsSessionPool.stats())
@@ -0,0 +1,69 @@
+import json
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import MagicMock
+
+from deliveryAPI.models.JsonStream import JsonArrayStream, ResponseTooLargeError
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class Test_JsonArrayStream(IsolatedAsyncioTestCase):
+
+    async def _items(self, data: bytes, size: int = 7, key: str = "data", maxBytes: int = 1000):
+        return [item async for item in JsonArrayStream(chunked(data, size), key, maxBytes)]
+
+    async def test_ok(self):
+        document = {
+            "status": "success",
+            "data": [{"type": "store", "store": {"title": 'KFC é "Ashford"'}}, 12.5, None, [1, 2]],
+            "meta": {"count": 4}
+        }
+        data = json.dumps(document).encode()
+
+        for size in (1, 3, 7, len(data)):
+            self.assertEqual(document["data"], await self._items(data, size))
+
+    async def test_number_split_between_chunks(self):
+        self.assertEqual([12345], await self._items(b'{"data": [12345]}', size=12))
+
+    async def test_empty_array(self):
+        self.assertEqual([], await self._items(b'{"data": [ ], "other": 1}'))
+
+    async def test_missing_key(self):
+        self.assertEqual([], await self._items(b'{"other": [1, 2]}'))
+        self.assertEqual([], await self._items(b'{}'))
+
+    async def test_stops_early(self):
+        async def chunks():
+            yield b'{"data": [1, 2, '
+            raise AssertionError("read too far")
+
+        stream = JsonArrayStream(chunks(), "data", 1000)
+        async for item in stream:
+            if item == 2:
+                break
+
+    async def test_truncated(self):
+        with self.assertRaisesRegex(ValueError, "ended early"):
+            await self._items(b'{"data": [1, {"type": "st')
+
+    async def test_malformed(self):
+        with self.assertRaises(ValueError):
+            await self._items(b'{"data": [1; 2]}')
+
+    async def test_too_large(self):
+        with self.assertRaises(ResponseTooLargeError):
+            await self._items(b'{"data": [' + b'1, ' * 100 + b'1]}', maxBytes=50)
+
+    async def test_large_value_decoded_a_few_times(self):
+        data = json.dumps({"other": ["x" * 100] * 10000, "data": [1]}).encode()
+        stream = JsonArrayStream(chunked(data, 4096), "data", len(data))
+        stream._decoder.raw_decode = MagicMock(wraps=stream._decoder.raw_decode)
+
+        self.assertEqual([1], [item async for item in stream])
+
+        # retried as what has arrived doubles, not for each of the 250 or so chunks
+        self.assertLess(stream._decoder.raw_decode.call_count, 20)
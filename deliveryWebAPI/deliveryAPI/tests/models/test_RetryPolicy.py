@@ -0,0 +1,147 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from aiohttp.client_exceptions import ClientResponseError, ServerDisconnectedError
+
+from deliveryAPI.models.RetryPolicy import RetryPolicy
+from deliveryAPI.metrics import UPSTREAM_ERRORS, UPSTREAM_STEP_SECONDS
+
+
+MODULE_PATH = "deliveryAPI.models.RetryPolicy."
+
+
+def _setUpSettings(settings):
+    settings.retry_max_attempts = 3
+    settings.retry_attempts = {}
+    settings.retry_base_delay_seconds = 0
+    settings.retry_max_delay_seconds = 0
+    settings.retry_budget_ratio = 0.5
+    settings.retry_budget_max_tokens = 10
+    settings.hedge_services = ["Pizza Hut"]
+    settings.hedge_delay_seconds = 0.01
+    settings.hedge_min_samples = 3
+    settings.hedge_latency_samples = 10
+
+
+def _responseError(status):
+    return ClientResponseError(MagicMock(), MagicMock(), status=status)
+
+
+class Test_RetryPolicy_isRetryable(TestCase):
+
+    def test_ok(self):
+        self.assertTrue(RetryPolicy.isRetryable(_responseError(503)))
+        self.assertTrue(RetryPolicy.isRetryable(_responseError(429)))
+        self.assertTrue(RetryPolicy.isRetryable(ServerDisconnectedError()))
+        self.assertTrue(RetryPolicy.isRetryable(asyncio.TimeoutError()))
+        self.assertFalse(RetryPolicy.isRetryable(_responseError(404)))
+        self.assertFalse(RetryPolicy.isRetryable(Exception()))
+
+
+@patch(MODULE_PATH + "settings")
+class Test_RetryPolicy_call(IsolatedAsyncioTestCase):
+
+    async def test_ok(self, settings):
+        _setUpSettings(settings)
+        step = AsyncMock(return_value="locations")
+
+        self.assertEqual("locations", await RetryPolicy("Pizza Hut").call("getLocations", step))
+
+        step.assert_called_once_with()
+
+    async def test_retried(self, settings):
+        _setUpSettings(settings)
+        step = AsyncMock(side_effect=[_responseError(503), ServerDisconnectedError(), "locations"])
+
+        self.assertEqual("locations", await RetryPolicy("Pizza Hut").call("getLocations", step))
+
+        self.assertEqual(3, step.call_count)
+
+    @patch("deliveryAPI.metrics.settings.metrics_enabled", True)
+    async def test_metrics(self, settings):
+        _setUpSettings(settings)
+        UPSTREAM_ERRORS.clear()
+        UPSTREAM_STEP_SECONDS.clear()
+        step = AsyncMock(side_effect=[_responseError(503), "locations"])
+
+        await RetryPolicy("Pizza Hut").call("getLocations", step)
+
+        self.assertEqual(1, UPSTREAM_ERRORS.value("Pizza Hut", "getLocations", "503"))
+        self.assertEqual(2, UPSTREAM_STEP_SECONDS.count("Pizza Hut", "getLocations"))
+
+    async def test_attempts_exhausted(self, settings):
+        _setUpSettings(settings)
+        settings.retry_attempts = {"Pizza Hut": 2}
+        step = AsyncMock(side_effect=_responseError(503))
+
+        with self.assertRaises(ClientResponseError):
+            await RetryPolicy("Pizza Hut").call("getLocations", step)
+
+        self.assertEqual(2, step.call_count)
+
+    async def test_not_retryable(self, settings):
+        _setUpSettings(settings)
+        step = AsyncMock(side_effect=_responseError(400))
+
+        with self.assertRaises(ClientResponseError):
+            await RetryPolicy("Pizza Hut").call("getLocations", step)
+
+        step.assert_called_once_with()
+
+    async def test_budget_exhausted(self, settings):
+        _setUpSettings(settings)
+        settings.retry_budget_max_tokens = 1
+        policy = RetryPolicy("Pizza Hut")
+        step = AsyncMock(side_effect=_responseError(503))
+
+        with self.assertRaises(ClientResponseError):
+            await policy.call("getLocations", step)
+        self.assertEqual(2, step.call_count)
+
+        # only half a token has been earned back
+        step.reset_mock()
+        with self.assertRaises(ClientResponseError):
+            await policy.call("getLocations", step)
+        step.assert_called_once_with()
+
+
+@patch(MODULE_PATH + "settings")
+class Test_RetryPolicy_hedge(IsolatedAsyncioTestCase):
+
+    async def test_fast_response_not_hedged(self, settings):
+        _setUpSettings(settings)
+        step = AsyncMock(return_value="locations")
+
+        result = await RetryPolicy("Pizza Hut").call("getLocations", step, hedge=True)
+
+        self.assertEqual("locations", result)
+        step.assert_called_once_with()
+
+    async def test_slow_response_hedged(self, settings):
+        _setUpSettings(settings)
+        responses = iter([asyncio.Event().wait(), asyncio.sleep(0, "hedged")])
+        step = MagicMock(side_effect=lambda: next(responses))
+
+        result = await RetryPolicy("Pizza Hut").call("getLocations", step, hedge=True)
+
+        self.assertEqual("hedged", result)
+        self.assertEqual(2, step.call_count)
+
+    async def test_not_hedged_for_other_backends(self, settings):
+        _setUpSettings(settings)
+        step = MagicMock(side_effect=lambda: asyncio.sleep(0.02, "locations"))
+
+        result = await RetryPolicy("Dominos").call("getLocations", step, hedge=True)
+
+        self.assertEqual("locations", result)
+        step.assert_called_once_with()
+
+    async def test_hedge_delay_from_p95(self, settings):
+        _setUpSettings(settings)
+        policy = RetryPolicy("Pizza Hut")
+        self.assertEqual(0.01, policy.hedgeDelay("getLocations"))
+
+        policy._latencies["getLocations"].extend([0.3, 0.1, 0.2])
+
+        self.assertEqual(0.3, policy.hedgeDelay("getLocations"))
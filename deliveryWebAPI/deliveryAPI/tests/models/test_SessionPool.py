@@ -0,0 +1,81 @@
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from deliveryAPI.models.SessionPool import SessionPool
+from deliveryAPI.models.FoodModels import PizzaHut, UberEatsSession
+
+MODULE_PATH = "deliveryAPI.models.SessionPool."
+
+
+class SessionPoolTestCase(IsolatedAsyncioTestCase):
+
+    async def asyncTearDown(self):
+        await SessionPool.close()
+
+
+class Test_SessionPool_getConnector(SessionPoolTestCase):
+
+    async def test_not_open(self):
+        self.assertIsNone(SessionPool.getConnector("api.pizzahut.io"))
+
+    async def test_reused_per_host(self):
+        SessionPool.open()
+
+        connector = SessionPool.getConnector("api.pizzahut.io")
+
+        self.assertIs(connector, SessionPool.getConnector("api.pizzahut.io"))
+        self.assertIsNot(connector, SessionPool.getConnector("www.ubereats.com"))
+
+    @patch(MODULE_PATH + "settings")
+    async def test_per_host_limit(self, settings):
+        settings.connection_limit_per_host = 10
+        settings.connection_limits = {"www.ubereats.com": 5}
+        SessionPool.open()
+
+        self.assertEqual(10, SessionPool.getConnector("api.pizzahut.io").limit_per_host)
+        self.assertEqual(5, SessionPool.getConnector("www.ubereats.com").limit_per_host)
+
+    async def test_closed_connector_replaced(self):
+        SessionPool.open()
+        connector = SessionPool.getConnector("api.pizzahut.io")
+        await connector.close()
+
+        self.assertIsNot(connector, SessionPool.getConnector("api.pizzahut.io"))
+
+
+class Test_SessionPool_close(SessionPoolTestCase):
+
+    async def test_ok(self):
+        SessionPool.open()
+        connector = SessionPool.getConnector("api.pizzahut.io")
+
+        await SessionPool.close()
+
+        self.assertTrue(connector.closed)
+        self.assertIsNone(SessionPool.getConnector("api.pizzahut.io"))
+
+
+class Test_SessionPool_borrowedSessions(SessionPoolTestCase):
+
+    async def test_independent_session_does_not_own_connector(self):
+        SessionPool.open()
+        session = PizzaHut("ABCD 1EF")._createSession()
+        self.assertIs(SessionPool.getConnector("api.pizzahut.io"), session.connector)
+
+        await session.close()
+
+        self.assertFalse(SessionPool.getConnector("api.pizzahut.io").closed)
+
+    async def test_uber_eats_sessions_have_separate_cookies(self):
+        SessionPool.open()
+        connector = SessionPool.getConnector("www.ubereats.com")
+        session1 = UberEatsSession("ABCD 1EF", connector=connector)
+        session2 = UberEatsSession("ABCD 1EF", connector=connector)
+
+        session1.setCookie("uev2.loc", "location")
+
+        self.assertEqual(1, len(session1.cookie_jar))
+        self.assertEqual(0, len(session2.cookie_jar))
+        await session1.close()
+        await session2.close()
+        self.assertFalse(connector.closed)
@@ -0,0 +1,128 @@
+import json
+import os
+import tempfile
+import time
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.cache.CoverageTable import CoverageTable
+from deliveryAPI.coverage import buildCoverageTable, main
+from deliveryAPI.jobs.BulkJobs import JobState, JobStatus
+
+MODULE_PATH = "deliveryAPI.coverage."
+
+
+def ok(canDeliver):
+    return {"can_deliver": canDeliver, "status": "ok"}
+
+
+class CoverageTestCase(TestCase):
+
+    def setUp(self):
+        tempDir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempDir.cleanup)
+        self.directory = tempDir.name
+
+    def writeJob(self, jobId, results, createdAt, resultsSize=None):
+        directory = os.path.join(self.directory, jobId)
+        os.makedirs(directory)
+        data = "".join(json.dumps(result) + "\n" for result in results).encode()
+        with open(os.path.join(directory, "results.ndjson"), "wb") as resultsFile:
+            resultsFile.write(data)
+        state = JobState(
+            id=jobId, status=JobStatus.COMPLETED, services=["pizzahut"],
+            results_size=len(data) if resultsSize is None else resultsSize,
+            created_at=createdAt, updated_at=createdAt
+        )
+        with open(os.path.join(directory, "state.json"), "w") as stateFile:
+            stateFile.write(state.json())
+        return directory
+
+
+@patch("deliveryAPI.cache.CoverageTable.settings.coverage_table_max_age_seconds", 3600)
+class Test_buildCoverageTable(CoverageTestCase):
+
+    def lookup(self, builder, name, postcode):
+        path = os.path.join(self.directory, "Coverage_Table.bin")
+        builder.write(path)
+        coverageTable = CoverageTable()
+        coverageTable.open(path)
+        try:
+            return coverageTable.lookup(name, postcode)
+        finally:
+            coverageTable.close()
+
+    def test_ok(self):
+        job = self.writeJob("a", [
+            {"postcode": "SW1A 1AA", "results": {"pizzahut": ok(True), "other": ok(False)}},
+        ], time.time())
+
+        builder = buildCoverageTable([job], {"pizzahut": "Pizza Hut"})
+
+        self.assertTrue(self.lookup(builder, "Pizza Hut", "SW1A 1AA"))
+        self.assertIs(False, self.lookup(builder, "other", "SW1A 1AA"))
+
+    def test_only_upstream_answers(self):
+        job = self.writeJob("a", [
+            {"postcode": "SW1A 1AA", "results": {
+                "pizzahut": {"can_deliver": True, "status": "stale", "age_seconds": 10}
+            }},
+            {"postcode": "NW9 9ED", "results": {
+                "pizzahut": {"can_deliver": None, "status": "timed_out"}
+            }},
+        ], time.time())
+
+        self.assertEqual(0, len(buildCoverageTable([job], {})))
+
+    def test_later_job_wins(self):
+        now = time.time()
+        later = self.writeJob("b", [
+            {"postcode": "SW1A 1AA", "results": {"pizzahut": ok(False)}}
+        ], now)
+        earlier = self.writeJob("a", [
+            {"postcode": "SW1A 1AA", "results": {"pizzahut": ok(True)}}
+        ], now - 60)
+
+        builder = buildCoverageTable([later, earlier], {})
+
+        self.assertIs(False, self.lookup(builder, "pizzahut", "SW1A 1AA"))
+
+    def test_up_to_checkpoint(self):
+        firstLine = json.dumps({"postcode": "SW1A 1AA", "results": {"pizzahut": ok(True)}}) + "\n"
+        job = self.writeJob("a", [
+            {"postcode": "SW1A 1AA", "results": {"pizzahut": ok(True)}},
+            {"postcode": "NW9 9ED", "results": {"pizzahut": ok(True)}},
+        ], time.time(), resultsSize=len(firstLine))
+
+        self.assertEqual(1, len(buildCoverageTable([job], {})))
+
+
+class Test_main(CoverageTestCase):
+
+    def test_ok(self):
+        job = self.writeJob("a", [
+            {"postcode": postcode, "results": {"pizzahut": ok(True)}}
+            for postcode in ["NW9 9ED", "NW9 9EF", "NW9 9EG"]
+        ], time.time())
+        output = os.path.join(self.directory, "Coverage_Table.bin")
+
+        with patch("builtins.print") as printed:
+            main([job, "--output", output, "--min-sector-postcodes", "3"])
+
+        printed.assert_called_once_with(f"wrote {output}, 3 postcodes and 1 sectors")
+        coverageTable = CoverageTable()
+        coverageTable.open(output)
+        self.addCleanup(coverageTable.close)
+        self.assertTrue(coverageTable.lookup("Pizza Hut", "NW9 9EZ"))
+
+    def test_no_sectors(self):
+        job = self.writeJob("a", [
+            {"postcode": postcode, "results": {"pizzahut": ok(True)}}
+            for postcode in ["NW9 9ED", "NW9 9EF", "NW9 9EG"]
+        ], time.time())
+        output = os.path.join(self.directory, "Coverage_Table.bin")
+
+        with patch("builtins.print") as printed:
+            main([job, "--output", output, "--no-sectors"])
+
+        printed.assert_called_once_with(f"wrote {output}, 3 postcodes and 0 sectors")
@@ -0,0 +1,44 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI import fastjson
+from deliveryAPI.api.schemas import Postcode
+
+
+MODULE_PATH = "deliveryAPI.fastjson."
+
+
+class Test_enabled(TestCase):
+
+    @patch(MODULE_PATH + "settings.fast_json", True)
+    def test_ok(self):
+        self.assertTrue(fastjson.enabled())
+
+    @patch(MODULE_PATH + "settings.fast_json", False)
+    def test_disabled(self):
+        self.assertFalse(fastjson.enabled())
+
+    @patch(MODULE_PATH + "orjson", None)
+    @patch(MODULE_PATH + "settings.fast_json", True)
+    def test_not_installed(self):
+        self.assertFalse(fastjson.enabled())
+
+
+class Test_loads(TestCase):
+
+    def test_ok(self):
+        self.assertEqual({"data": [1, "two"]}, fastjson.loads(b'{"data": [1, "two"]}'))
+
+    @patch(MODULE_PATH + "settings.fast_json", False)
+    def test_disabled(self):
+        self.assertEqual({"data": [1, "two"]}, fastjson.loads('{"data": [1, "two"]}'))
+
+
+class Test_dumps(TestCase):
+
+    def test_ok(self):
+        self.assertEqual('{"SW1A 1AA":true}', fastjson.dumps({Postcode("SW1A 1AA"): True}))
+
+    @patch(MODULE_PATH + "settings.fast_json", False)
+    def test_disabled(self):
+        self.assertEqual('{"SW1A 1AA": true}', fastjson.dumps({Postcode("SW1A 1AA"): True}))
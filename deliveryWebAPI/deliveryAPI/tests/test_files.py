@@ -0,0 +1,19 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from deliveryAPI.files import writeAtomically
+
+
+class Test_writeAtomically(TestCase):
+
+    def test_replaced(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "state.json")
+            writeAtomically(path, "old")
+
+            writeAtomically(path, "new")
+
+            with open(path) as dataFile:
+                self.assertEqual("new", dataFile.read())
+            self.assertEqual(["state.json"], os.listdir(directory))
@@ -0,0 +1,109 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+MODULE_PATH = "deliveryAPI.metrics."
+
+
+@patch(MODULE_PATH + "settings.metrics_enabled", True)
+class Test_Counter(TestCase):
+
+    def test_render(self):
+        counter = Counter("test_total", "A test counter", ["backend", "status"])
+
+        counter.inc("Pizza Hut", "503")
+        counter.inc("Pizza Hut", "503", amount=2)
+        counter.inc('Say "hi"', "timeout")
+
+        self.assertEqual(3, counter.value("Pizza Hut", "503"))
+        self.assertEqual(
+            [
+                "# HELP test_total A test counter",
+                "# TYPE test_total counter",
+                'test_total{backend="Pizza Hut",status="503"} 3.0',
+                'test_total{backend="Say \\"hi\\"",status="timeout"} 1.0',
+            ],
+            counter.render()
+        )
+
+
+@patch(MODULE_PATH + "settings.metrics_enabled", False)
+class Test_Counter_disabled(TestCase):
+
+    def test_ok(self):
+        counter = Counter("test_total", "A test counter")
+
+        counter.inc()
+
+        self.assertEqual(0, counter.value())
+
+
+@patch(MODULE_PATH + "settings.metrics_enabled", True)
+class Test_Gauge(TestCase):
+
+    def test_ok(self):
+        gauge = Gauge("test_in_flight", "A test gauge", ["backend"])
+
+        gauge.inc("Dominos")
+        gauge.inc("Dominos")
+        gauge.dec("Dominos")
+
+        self.assertEqual(1, gauge.value("Dominos"))
+        self.assertEqual("# TYPE test_in_flight gauge", gauge.render()[1])
+
+
+@patch(MODULE_PATH + "settings.metrics_enabled", True)
+class Test_Histogram(TestCase):
+
+    def test_render(self):
+        histogram = Histogram("test_seconds", "A test histogram", ["step"], buckets=(0.1, 1))
+
+        histogram.observe(0.1, "getLocations")
+        histogram.observe(0.5, "getLocations")
+        histogram.observe(2, "getLocations")
+
+        self.assertEqual(3, histogram.count("getLocations"))
+        self.assertEqual(
+            [
+                "# HELP test_seconds A test histogram",
+                "# TYPE test_seconds histogram",
+                'test_seconds_bucket{step="getLocations",le="0.1"} 1',
+                'test_seconds_bucket{step="getLocations",le="1"} 2',
+                'test_seconds_bucket{step="getLocations",le="+Inf"} 3',
+                'test_seconds_sum{step="getLocations"} 2.6',
+                'test_seconds_count{step="getLocations"} 3',
+            ],
+            histogram.render()
+        )
+
+
+@patch(MODULE_PATH + "settings.metrics_enabled", True)
+class Test_MetricsRegistry(TestCase):
+
+    def test_render(self):
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("test_total", "A test counter"))
+        counter.inc()
+
+        self.assertEqual(
+            "# HELP test_total A test counter\n# TYPE test_total counter\ntest_total 1.0\n",
+            registry.render()
+        )
+
+        registry.clear()
+        self.assertEqual(0, counter.value())
+
+    def test_const_labels(self):
+        registry = MetricsRegistry()
+        counter = registry.register(Counter("test_total", "A test counter", ["backend"]))
+        histogram = registry.register(Histogram("test_seconds", "A test histogram", buckets=(1,)))
+        counter.inc("Dominos")
+        histogram.observe(0.5)
+
+        lines = registry.render({"worker": "1234"}).splitlines()
+
+        self.assertIn('test_total{worker="1234",backend="Dominos"} 1.0', lines)
+        self.assertIn('test_seconds_bucket{worker="1234",le="1"} 1', lines)
+        self.assertIn('test_seconds_count{worker="1234"} 1', lines)
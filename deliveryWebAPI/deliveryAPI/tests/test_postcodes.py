@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from deliveryAPI.postcodes import normalizePostcode, postcodeSector, InvalidPostcodeError
+
+
+class Test_normalizePostcode(TestCase):
+
+    def test_ok(self):
+        self.assertEqual("SW1A 1AA", normalizePostcode("SW1A 1AA"))
+
+    def test_spacing_and_case(self):
+        for postcode in ("sw1a1aa", " SW1A  1AA ", "Sw1A\t1aA"):
+            self.assertEqual("SW1A 1AA", normalizePostcode(postcode))
+
+    def test_formats(self):
+        postcodes = ("M1 1AE", "B33 8TH", "CR2 6XH", "DN55 1PT", "W1A 0AX", "EC1A 1BB", "GIR 0AA")
+        for postcode in postcodes:
+            self.assertEqual(postcode, normalizePostcode(postcode.replace(" ", "")))
+
+    def test_malformed(self):
+        postcodes = ("", "   ", "ABCD 1EF", "SW1A", "SW1A 1AAA", "QW1 1AA", "SW1A 1CA", "12345")
+        for postcode in postcodes:
+            with self.assertRaises(InvalidPostcodeError, msg=postcode):
+                normalizePostcode(postcode)
+
+
+class Test_postcodeSector(TestCase):
+
+    def test_ok(self):
+        self.assertEqual("SW1A 1", postcodeSector("SW1A 1AA"))
+        self.assertEqual("M1 1", postcodeSector("m11ae"))
+
+    def test_not_a_postcode(self):
+        self.assertIsNone(postcodeSector("ABCD 1EF"))
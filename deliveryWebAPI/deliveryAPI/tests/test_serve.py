@@ -0,0 +1,67 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from deliveryAPI.serve import availableCpus, workerCount, main
+
+
+MODULE_PATH = "deliveryAPI.serve."
+
+
+@patch(MODULE_PATH + "os")
+class Test_availableCpus(TestCase):
+
+    def test_affinity(self, os_):
+        os_.sched_getaffinity.return_value = {0, 1}
+        os_.cpu_count.return_value = 8
+
+        self.assertEqual(2, availableCpus())
+
+    def test_no_affinity(self, os_):
+        os_.sched_getaffinity.side_effect = AttributeError
+        os_.cpu_count.return_value = 8
+
+        self.assertEqual(8, availableCpus())
+
+    def test_unknown(self, os_):
+        os_.sched_getaffinity.side_effect = AttributeError
+        os_.cpu_count.return_value = None
+
+        self.assertEqual(1, availableCpus())
+
+
+@patch(MODULE_PATH + "availableCpus", return_value=4)
+class Test_workerCount(TestCase):
+
+    @patch(MODULE_PATH + "settings.serve_workers", None)
+    def test_cpus(self, _availableCpus):
+        self.assertEqual(4, workerCount())
+
+    @patch(MODULE_PATH + "settings.serve_workers", 2)
+    def test_configured(self, _availableCpus):
+        self.assertEqual(2, workerCount())
+
+
+@patch(MODULE_PATH + "uvicorn")
+@patch(MODULE_PATH + "workerCount", return_value=4)
+class Test_main(TestCase):
+
+    def test_ok(self, _workerCount, uvicorn_):
+        main()
+
+        uvicorn_.run.assert_called_once()
+        (app,), config = uvicorn_.run.call_args
+        self.assertEqual("deliveryAPI.api.api:app", app)
+        self.assertEqual(4, config["workers"])
+        self.assertEqual("auto", config["loop"])
+        self.assertEqual("auto", config["http"])
+        self.assertEqual(30, config["timeout_graceful_shutdown"])
+        self.assertNotIn("reload", config)
+
+    @patch(MODULE_PATH + "settings.serve_http", "h11")
+    @patch(MODULE_PATH + "settings.serve_port", 9000)
+    def test_configured(self, _workerCount, uvicorn_):
+        main()
+
+        _app, config = uvicorn_.run.call_args
+        self.assertEqual("h11", config["http"])
+        self.assertEqual(9000, config["port"])
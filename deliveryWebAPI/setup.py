@@ -12,5 +12,11 @@ setup(
         "fastapi",
         "uvicorn",
         "aiohttp"
-    ]
+    ],
+    extras_require={
+        "redis": ["redis"],
+        "fastjson": ["orjson"],
+        # picked up by deliveryAPI.serve when installed
+        "server": ["uvloop; sys_platform != 'win32'", "httptools"]
+    }
 )